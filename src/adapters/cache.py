@@ -0,0 +1,202 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import config
+from adapters.interfaces import LLMClient, AsyncLLMClient
+
+logger = logging.getLogger(__name__)
+
+EVICT_EVERY = 100  # writes between two evictions
+
+
+def request_hash(model: str, messages: List[Dict[str, str]], **options) -> str:
+    """
+    Stable sha256 of a chat request, identifying the response it gets
+    """
+    request = {"model": model, "messages": messages}
+    if options:
+        request["options"] = options
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Chat responses in a local SQLite file, keyed by request_hash.
+
+    Entries older than max_age seconds are dropped. Past max_bytes of responses, the least
+    recently used ones are dropped first. Eviction runs on opening and then every EVICT_EVERY
+    writes, so the file can briefly exceed its limits. Safe to share between threads.
+
+    Args:
+        path: SQLite file, created with its directory if missing
+        max_bytes: Total size of the responses to keep, None for no limit
+        max_age: Seconds an entry is kept, None for no limit
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, max_age: Optional[float] = None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_llm_response_used ON llm_response (used)")
+        self.writes = 0
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT response, created FROM llm_response WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age is not None and row[1] < now - self.max_age):
+                return None
+            self.connection.execute("UPDATE llm_response SET used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO llm_response (key, response, size, created, used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode()), now, now),
+            )
+            self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        evicted = 0
+        with self.lock:
+            if self.max_age is not None:
+                evicted += self.connection.execute(
+                    "DELETE FROM llm_response WHERE created < ?", (time.time() - self.max_age,)
+                ).rowcount
+            if self.max_bytes is not None:
+                # running total of sizes, most recently used first
+                evicted += self.connection.execute(
+                    "DELETE FROM llm_response WHERE key IN ("
+                    " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY used DESC, key) AS total FROM llm_response)"
+                    " WHERE total > ?)",
+                    (self.max_bytes,),
+                ).rowcount
+        if evicted:
+            logger.info(f"Evicted {evicted} cached LLM responses")
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM llm_response").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class _CachingClient:
+    def __init__(self, client, cache: LLMResponseCache, bypass: bool = False):
+        self.client = client
+        self.model = client.model
+        self.cache = cache
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _key(self, messages, kwargs) -> str:
+        options = {name: value for name, value in kwargs.items() if name != "stream"}
+        return request_hash(self.model, messages, **options)
+
+    def _cached(self, key: str) -> Optional[str]:
+        response = None if self.bypass else self.cache.get(key)
+        with self.lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def counts(self) -> Tuple[int, int]:
+        with self.lock:
+            return self.hits, self.misses
+
+
+class CachingLLMClient(_CachingClient, LLMClient):
+    """
+    Wraps an LLMClient and answers requests it has seen before (same model, messages and
+    options) from an LLMResponseCache.
+
+    Args:
+        client: The client to call on a cache miss
+        cache: Where responses are kept
+        bypass: Always call the client, and refresh the cached responses with its answers
+    """
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        key = self._key(messages, kwargs)
+        response = self._cached(key)
+        if response is None:
+            response = self.client.chat(messages, **kwargs)
+            self.cache.put(key, response)
+        return response
+
+
+class AsyncCachingLLMClient(_CachingClient, AsyncLLMClient):
+    """
+    CachingLLMClient for an AsyncLLMClient
+    """
+
+    async def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        key = self._key(messages, kwargs)
+        response = self._cached(key)
+        if response is None:
+            response = await self.client.chat(messages, **kwargs)
+            self.cache.put(key, response)
+        return response
+
+
+def cached_llm_client(client: Union[LLMClient, AsyncLLMClient]) -> Union[LLMClient, AsyncLLMClient]:
+    """
+    The client wrapped in the LLM_CACHE_PATH cache, or unchanged when the cache is disabled
+    """
+    settings = config.settings
+    if not settings.LLM_CACHE_PATH:
+        return client
+
+    cache = LLMResponseCache(
+        settings.LLM_CACHE_PATH,
+        max_bytes=settings.LLM_CACHE_MAX_BYTES,
+        max_age=settings.LLM_CACHE_MAX_AGE_DAYS * 24 * 60 * 60,
+    )
+    caching_client = AsyncCachingLLMClient if inspect.iscoroutinefunction(client.chat) else CachingLLMClient
+    return caching_client(client, cache, bypass=settings.LLM_CACHE_BYPASS)
+
+
+def cache_counts(client: Union[LLMClient, AsyncLLMClient]) -> Tuple[int, int]:
+    """
+    Cache hits and misses of the client so far, (0, 0) when it isn't wrapped in a cache
+    """
+    if isinstance(client, _CachingClient):
+        return client.counts()
+    return 0, 0
+
+
+def log_hit_rate(client: Union[LLMClient, AsyncLLMClient], since: Tuple[int, int] = (0, 0)):
+    """
+    Log how many of the client's requests the cache answered since cache_counts returned `since`
+    """
+    hits, misses = cache_counts(client)
+    hits, misses = hits - since[0], misses - since[1]
+    if hits + misses:
+        logger.info(f"LLM cache answered {hits}/{hits + misses} requests ({hits / (hits + misses):.0%})")
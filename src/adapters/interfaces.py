@@ -2,5 +2,14 @@ from typing import Protocol, List, Dict
 
 
 class LLMClient(Protocol):
+    model: str
+
     def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
         ...
+
+
+class AsyncLLMClient(Protocol):
+    model: str
+
+    async def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        ...
@@ -2,15 +2,30 @@ from typing import List, Dict
 
 import ollama
 
-from adapters.interfaces import LLMClient
+from adapters.interfaces import LLMClient, AsyncLLMClient
 
 
 class OllamaClient(LLMClient):
-    def __init__(self, model: str):
+    def __init__(self, model: str, timeout: float = None, host: str = None):
         self.model = model
+        self.client = ollama.Client(host=host, timeout=timeout)
 
     def chat(self, messages: List[Dict[str, str]], stream=False, **kwargs):
-        response = ollama.chat(
+        response = self.client.chat(
+            model=self.model,
+            messages=messages,
+            **kwargs,
+        )
+        return response["message"]["content"]
+
+
+class AsyncOllamaClient(AsyncLLMClient):
+    def __init__(self, model: str, timeout: float = None, host: str = None):
+        self.model = model
+        self.client = ollama.AsyncClient(host=host, timeout=timeout)
+
+    async def chat(self, messages: List[Dict[str, str]], stream=False, **kwargs):
+        response = await self.client.chat(
             model=self.model,
             messages=messages,
             **kwargs,
@@ -0,0 +1,35 @@
+"""article text missing index
+
+Revision ID: 0a6d93f2c7e8
+Revises: b71e4c09a5d2
+Create Date: 2026-10-18 13:58:16.084217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a6d93f2c7e8'
+down_revision: Union[str, Sequence[str], None] = 'b71e4c09a5d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_article_text_missing',
+        'article',
+        ['created'],
+        unique=False,
+        postgresql_where=sa.text('text IS NULL'),
+        sqlite_where=sa.text('text IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_article_text_missing', table_name='article')
@@ -0,0 +1,36 @@
+"""summary chunk
+
+Revision ID: 1b6e9d3f5a27
+Revises: f2b8c4e71a05
+Create Date: 2026-10-18 23:12:40.771826
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b6e9d3f5a27'
+down_revision: Union[str, Sequence[str], None] = 'f2b8c4e71a05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'summary_chunk',
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('request_hash'),
+    )
+    op.create_index(op.f('ix_summary_chunk_created'), 'summary_chunk', ['created'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_summary_chunk_created'), table_name='summary_chunk')
+    op.drop_table('summary_chunk')
@@ -0,0 +1,111 @@
+"""article url hash
+
+Revision ID: 3f8d2a6c91b4
+Revises: e5a1f0c36b27
+Create Date: 2026-10-18 11:20:05.617340
+
+"""
+import hashlib
+from typing import Sequence, Union
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8d2a6c91b4'
+down_revision: Union[str, Sequence[str], None] = 'e5a1f0c36b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Copy of common.urls as of this revision, so that later changes to the live normaliser
+# don't change what this migration does
+TRACKING_PARAMS = {
+    "at_campaign", "at_medium", "at_link_id", "at_link_type", "at_link_origin", "at_format", "at_ptr_name",
+    "at_bbc_team", "at_custom1", "at_custom2", "at_custom3", "at_custom4",
+    "cmp", "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ocid", "ref", "ref_src", "igshid",
+}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not (name.lower() in TRACKING_PARAMS or name.lower().startswith(TRACKING_PREFIXES))
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha1(canonicalize_url(url).encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('article', sa.Column('url_hash', sa.String(length=40), nullable=True))
+
+    # Backfill. Legacy rows sharing a canonical URL are collapsed onto the oldest one, as
+    # e5a1f0c36b27 did for identical URLs, so that every article gets a hash.
+    connection = op.get_bind()
+    article = sa.table('article', sa.column('id', sa.Integer), sa.column('url', sa.String), sa.column('url_hash', sa.String))
+    first_ids = {}
+    updates = []
+    merges = []
+    for article_id, url in connection.execute(sa.select(article.c.id, article.c.url).order_by(article.c.id)):
+        if not url:
+            continue
+        key = url_hash(url)
+        if key in first_ids:
+            merges.append({"duplicate_id": article_id, "article_id": first_ids[key]})
+            continue
+        first_ids[key] = article_id
+        updates.append({"article_id": article_id, "url_hash": key})
+
+    if merges:
+        connection.execute(
+            sa.text("UPDATE comment SET article_id = :article_id WHERE article_id = :duplicate_id"), merges,
+        )
+        # topics the oldest article doesn't have yet move over, the others go with the duplicate
+        connection.execute(
+            sa.text("""
+                UPDATE article_topic SET article_id = :article_id
+                WHERE article_id = :duplicate_id AND topic_id NOT IN (
+                    SELECT topic_id FROM article_topic WHERE article_id = :article_id
+                )
+            """),
+            merges,
+        )
+        connection.execute(sa.text("DELETE FROM article_topic WHERE article_id = :duplicate_id"), merges)
+        connection.execute(sa.text("DELETE FROM article WHERE id = :duplicate_id"), merges)
+
+    if updates:
+        connection.execute(
+            article.update().where(article.c.id == sa.bindparam("article_id")).values(url_hash=sa.bindparam("url_hash")),
+            updates,
+        )
+
+    op.create_index(op.f('ix_article_url_hash'), 'article', ['url_hash'], unique=True)
+    # superseded by the fixed-width hash index
+    op.drop_index(op.f('ix_article_url'), table_name='article')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_article_url'), 'article', ['url'], unique=True)
+    op.drop_index(op.f('ix_article_url_hash'), table_name='article')
+    with op.batch_alter_table('article') as batch_op:
+        batch_op.drop_column('url_hash')
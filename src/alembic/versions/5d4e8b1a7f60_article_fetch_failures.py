@@ -0,0 +1,55 @@
+"""article fetch failures
+
+Revision ID: 5d4e8b1a7f60
+Revises: 0a6d93f2c7e8
+Create Date: 2026-10-18 16:22:48.550173
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d4e8b1a7f60'
+down_revision: Union[str, Sequence[str], None] = '0a6d93f2c7e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('article', sa.Column('fetch_attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('article', sa.Column('fetch_error', sa.String(length=64), nullable=True))
+    op.add_column('article', sa.Column('fetch_next_attempt_at', sa.DateTime(), nullable=True))
+    op.add_column('article', sa.Column('fetch_failed_permanently', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    # permanent failures no longer belong to the extraction work queue
+    op.drop_index('ix_article_text_missing', table_name='article')
+    op.create_index(
+        'ix_article_text_missing',
+        'article',
+        ['created'],
+        unique=False,
+        postgresql_where=sa.text('text IS NULL AND fetch_failed_permanently = false'),
+        sqlite_where=sa.text('text IS NULL AND fetch_failed_permanently = 0'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_article_text_missing', table_name='article')
+    op.create_index(
+        'ix_article_text_missing',
+        'article',
+        ['created'],
+        unique=False,
+        postgresql_where=sa.text('text IS NULL'),
+        sqlite_where=sa.text('text IS NULL'),
+    )
+    with op.batch_alter_table('article') as batch_op:
+        batch_op.drop_column('fetch_failed_permanently')
+        batch_op.drop_column('fetch_next_attempt_at')
+        batch_op.drop_column('fetch_error')
+        batch_op.drop_column('fetch_attempts')
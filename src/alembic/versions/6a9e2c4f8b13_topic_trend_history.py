@@ -0,0 +1,40 @@
+"""topic trend history
+
+Revision ID: 6a9e2c4f8b13
+Revises: 1b6e9d3f5a27
+Create Date: 2026-10-19 10:41:17.208365
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a9e2c4f8b13'
+down_revision: Union[str, Sequence[str], None] = '1b6e9d3f5a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'topic_trend_history',
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('scored_days', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['topic_id'], ['topic.id'], ),
+        sa.PrimaryKeyConstraint('topic_id'),
+    )
+    # Backfill. The distinct update dates of a topic's baselines are days it was scored on,
+    # so they give a lower bound of its history.
+    op.execute("""
+        INSERT INTO topic_trend_history (topic_id, scored_days)
+        SELECT topic_id, COUNT(DISTINCT updated_date) FROM term_baseline GROUP BY topic_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('topic_trend_history')
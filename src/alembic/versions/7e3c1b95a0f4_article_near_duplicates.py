@@ -0,0 +1,47 @@
+"""article near duplicates
+
+Revision ID: 7e3c1b95a0f4
+Revises: c82f5e17d4a9
+Create Date: 2026-10-18 19:12:40.318027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e3c1b95a0f4'
+down_revision: Union[str, Sequence[str], None] = 'c82f5e17d4a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('article') as batch_op:
+        batch_op.add_column(sa.Column('minhash', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('canonical_article_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_article_canonical_article_id'), ['canonical_article_id'], unique=False)
+        batch_op.create_foreign_key('fk_article_canonical_article_id', 'article', ['canonical_article_id'], ['id'])
+
+    op.create_table(
+        'article_minhash_bucket',
+        sa.Column('bucket', sa.BigInteger(), nullable=False),
+        sa.Column('article_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['article_id'], ['article.id'], ),
+        sa.PrimaryKeyConstraint('bucket', 'article_id'),
+    )
+    op.create_index(op.f('ix_article_minhash_bucket_article_id'), 'article_minhash_bucket', ['article_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_article_minhash_bucket_article_id'), table_name='article_minhash_bucket')
+    op.drop_table('article_minhash_bucket')
+    with op.batch_alter_table('article') as batch_op:
+        batch_op.drop_constraint('fk_article_canonical_article_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_article_canonical_article_id'))
+        batch_op.drop_column('canonical_article_id')
+        batch_op.drop_column('minhash')
@@ -0,0 +1,33 @@
+"""feed conditional get cache
+
+Revision ID: 9c2b7e41d8a3
+Revises: 4ed04106e0fa
+Create Date: 2026-10-18 09:12:41.203518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2b7e41d8a3'
+down_revision: Union[str, Sequence[str], None] = '4ed04106e0fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('feed', sa.Column('etag', sa.String(), nullable=True))
+    op.add_column('feed', sa.Column('last_modified', sa.String(), nullable=True))
+    op.add_column('feed', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('feed') as batch_op:
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('last_modified')
+        batch_op.drop_column('etag')
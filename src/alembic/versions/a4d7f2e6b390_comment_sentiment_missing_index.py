@@ -0,0 +1,35 @@
+"""comment sentiment missing index
+
+Revision ID: a4d7f2e6b390
+Revises: 7e3c1b95a0f4
+Create Date: 2026-10-18 20:41:03.872164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d7f2e6b390'
+down_revision: Union[str, Sequence[str], None] = '7e3c1b95a0f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_comment_sentiment_missing',
+        'comment',
+        ['id'],
+        unique=False,
+        postgresql_where=sa.text('sentiment IS NULL'),
+        sqlite_where=sa.text('sentiment IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comment_sentiment_missing', table_name='comment')
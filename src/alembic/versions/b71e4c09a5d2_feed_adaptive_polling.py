@@ -0,0 +1,39 @@
+"""feed adaptive polling
+
+Revision ID: b71e4c09a5d2
+Revises: 3f8d2a6c91b4
+Create Date: 2026-10-18 12:41:52.330981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71e4c09a5d2'
+down_revision: Union[str, Sequence[str], None] = '3f8d2a6c91b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('feed', sa.Column('poll_interval', sa.Integer(), nullable=True))
+    op.add_column('feed', sa.Column('publish_rate', sa.Float(), nullable=True))
+    op.add_column('feed', sa.Column('last_new_items', sa.Integer(), nullable=True))
+    op.add_column('feed', sa.Column('last_polled_at', sa.DateTime(), nullable=True))
+    op.add_column('feed', sa.Column('next_poll_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_feed_next_poll_at'), 'feed', ['next_poll_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_feed_next_poll_at'), table_name='feed')
+    with op.batch_alter_table('feed') as batch_op:
+        batch_op.drop_column('next_poll_at')
+        batch_op.drop_column('last_polled_at')
+        batch_op.drop_column('last_new_items')
+        batch_op.drop_column('publish_rate')
+        batch_op.drop_column('poll_interval')
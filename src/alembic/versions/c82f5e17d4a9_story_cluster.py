@@ -0,0 +1,43 @@
+"""story cluster
+
+Revision ID: c82f5e17d4a9
+Revises: 5d4e8b1a7f60
+Create Date: 2026-10-18 18:05:12.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c82f5e17d4a9'
+down_revision: Union[str, Sequence[str], None] = '5d4e8b1a7f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'story_cluster',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('centroid', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('assign_similarity', sa.Float(), nullable=False),
+        sa.Column('active', sa.Boolean(), server_default=sa.true(), nullable=False),
+        sa.Column('clustered_at', sa.DateTime(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['topic_id'], ['topic.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('topic_id'),
+    )
+    op.create_index(op.f('ix_story_cluster_active'), 'story_cluster', ['active'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_story_cluster_active'), table_name='story_cluster')
+    op.drop_table('story_cluster')
@@ -0,0 +1,56 @@
+"""trending terms
+
+Revision ID: d19b6a3e8c52
+Revises: a4d7f2e6b390
+Create Date: 2026-10-18 21:27:55.601934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd19b6a3e8c52'
+down_revision: Union[str, Sequence[str], None] = 'a4d7f2e6b390'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'term_baseline',
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('term', sa.String(length=100), nullable=False),
+        sa.Column('mean', sa.Float(), nullable=False),
+        sa.Column('variance', sa.Float(), nullable=False),
+        sa.Column('updated_date', sa.Date(), nullable=False),
+        sa.ForeignKeyConstraint(['topic_id'], ['topic.id'], ),
+        sa.PrimaryKeyConstraint('topic_id', 'term'),
+    )
+    op.create_index(op.f('ix_term_baseline_updated_date'), 'term_baseline', ['updated_date'], unique=False)
+
+    op.create_table(
+        'trending_term',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('term', sa.String(length=100), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=False),
+        sa.Column('articles', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['topic_id'], ['topic.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('date', 'topic_id', 'term'),
+    )
+    op.create_index(op.f('ix_trending_term_date'), 'trending_term', ['date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_trending_term_date'), table_name='trending_term')
+    op.drop_table('trending_term')
+    op.drop_index(op.f('ix_term_baseline_updated_date'), table_name='term_baseline')
+    op.drop_table('term_baseline')
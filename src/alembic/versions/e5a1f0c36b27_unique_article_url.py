@@ -0,0 +1,45 @@
+"""unique article url
+
+Revision ID: e5a1f0c36b27
+Revises: 9c2b7e41d8a3
+Create Date: 2026-10-18 10:03:27.914062
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1f0c36b27'
+down_revision: Union[str, Sequence[str], None] = '9c2b7e41d8a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# every article whose URL was already stored under a lower id
+DUPLICATE_IDS = """
+    SELECT a.id FROM article a
+    WHERE EXISTS (SELECT 1 FROM article b WHERE b.url = a.url AND b.id < a.id)
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Collapse duplicate rows onto the first article with that URL before adding the unique index
+    op.execute(f"""
+        UPDATE comment SET article_id = (
+            SELECT MIN(b.id) FROM article a JOIN article b ON b.url = a.url
+            WHERE a.id = comment.article_id
+        )
+        WHERE article_id IN ({DUPLICATE_IDS})
+    """)
+    op.execute(f"DELETE FROM article_topic WHERE article_id IN ({DUPLICATE_IDS})")
+    op.execute(f"DELETE FROM article WHERE id IN ({DUPLICATE_IDS})")
+
+    op.create_index(op.f('ix_article_url'), 'article', ['url'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_article_url'), table_name='article')
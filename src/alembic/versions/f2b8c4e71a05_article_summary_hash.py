@@ -0,0 +1,30 @@
+"""article summary hash
+
+Revision ID: f2b8c4e71a05
+Revises: d19b6a3e8c52
+Create Date: 2026-10-18 22:41:09.318264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8c4e71a05'
+down_revision: Union[str, Sequence[str], None] = 'd19b6a3e8c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('article') as batch_op:
+        batch_op.add_column(sa.Column('summary_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('article') as batch_op:
+        batch_op.drop_column('summary_hash')
@@ -1,15 +1,19 @@
 import datetime
 
 from fastapi import FastAPI, Depends, Query, HTTPException
+from sqlalchemy import exists
 from sqlalchemy.orm import joinedload
 from starlette.middleware.cors import CORSMiddleware
 
 import config
+from common.urls import url_hash
 from api.models import ArticleList, Article, Topic, TopicList, DailyTrendSummaryList
 from db.connection import get_session_dependency
+from embeddings.ann import get_related_index
 from db.models import Article as ArticleDB
 from db.models import Topic as TopicDB
 from db.models import DailyTrendSummary as DailyTrendSummaryDB
+from db.models import StoryCluster as StoryClusterDB
 
 app = FastAPI()
 
@@ -25,12 +29,16 @@ app.add_middleware(
 @app.get("/articles/")
 def get_articles(
         topic_id: int | None = Query(default=None),
+        url: str | None = Query(default=None, description="Find the article for a URL (tracking params, scheme and trailing slash are ignored)"),
         skip: int = Query(default=0, ge=0),
         limit: int = Query(default=50, ge=1, le=100),
         session=Depends(get_session_dependency)
 ) -> list[ArticleList]:
     query = session.query(ArticleDB)
 
+    if url is not None:
+        query = query.filter(ArticleDB.url_hash == url_hash(url))
+
     if topic_id is not None:
         query = (
             query
@@ -45,7 +53,10 @@ def get_articles(
 def get_topics(
         session=Depends(get_session_dependency)
 ) -> list[TopicList]:
-    topics = session.query(TopicDB).all()
+    # stories that clustering has since dropped are kept for their summaries, but not listed
+    topics = session.query(TopicDB).filter(
+        ~exists().where(StoryClusterDB.topic_id == TopicDB.id, StoryClusterDB.active.is_(False))
+    ).all()
     return topics
 
 
@@ -71,6 +82,27 @@ def get_article(
     return article
 
 
+@app.get("/article/{article_id}/related/")
+def get_related_articles(
+        article_id: int,
+        limit: int = Query(default=10, ge=1, le=50),
+        session=Depends(get_session_dependency),
+        related_index=Depends(get_related_index),
+) -> list[ArticleList]:
+    """
+    Articles whose embeddings are closest to this one's, closest first. Empty until the
+    article has been embedded.
+    """
+    if not session.query(ArticleDB.id).filter_by(id=article_id).first():
+        raise HTTPException(status_code=404, detail="Article not found")
+    if related_index is None:
+        raise HTTPException(status_code=503, detail="Related articles index is not available")
+
+    related_ids = related_index.related(article_id, limit)
+    articles = {article.id: article for article in session.query(ArticleDB).filter(ArticleDB.id.in_(related_ids))}
+    return [articles[i] for i in related_ids if i in articles]
+
+
 @app.get("/daily-summaries/")
 def get_daily_summaries(
         date: datetime.date | None = Query(default=None, description="Filter by date (default: today)"),
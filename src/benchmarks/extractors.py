@@ -0,0 +1,111 @@
+"""
+Compare the lean lxml extractors against newspaper3k on saved HTML pages.
+
+    cd src/
+    python -m benchmarks.extractors --repeat 50
+
+Each extractor runs in its own fresh process so its peak memory can be measured
+independently. CPU time is process time per page; peak memory is the growth of the
+process' max RSS while extracting (which, unlike tracemalloc, includes libxml2).
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from db.models import SourceName
+from ingestion.extractors import extract_content, NewspaperExtractor
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "html")
+
+# fixture file name prefix -> source the page comes from
+FIXTURE_SOURCES = {
+    "bbc": SourceName.BBC,
+    "guardian": SourceName.THE_GUARDIAN,
+}
+
+
+def load_pages(fixtures_dir: str):
+    pages = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+            html = f.read()
+        source_name = FIXTURE_SOURCES.get(name.split("_")[0])
+        pages.append((name, f"https://fixtures.test/{name}", html, source_name))
+    return pages
+
+
+def _extract_lean(url, html, source_name):
+    return extract_content(url, html, source_name)
+
+
+def _extract_newspaper(url, html, source_name):
+    return NewspaperExtractor().extract(url, html)
+
+
+EXTRACTORS = {
+    "lxml": _extract_lean,
+    "newspaper": _extract_newspaper,
+}
+
+
+def _max_rss_kb() -> float:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 if sys.platform == "darwin" else max_rss
+
+
+def _run(extractor_name, fixtures_dir, repeat, results):
+    extract = EXTRACTORS[extractor_name]
+    pages = load_pages(fixtures_dir)
+
+    # warm up lazy imports and caches before measuring
+    for _, url, html, source_name in pages:
+        extract(url, html, source_name)
+    baseline_rss = _max_rss_kb()
+
+    cpu_per_page = {}
+    for name, url, html, source_name in pages:
+        start = time.process_time()
+        for _ in range(repeat):
+            extract(url, html, source_name)
+        cpu_per_page[name] = (time.process_time() - start) / repeat
+
+    results.put((extractor_name, cpu_per_page, _max_rss_kb() - baseline_rss))
+
+
+def run_benchmark(fixtures_dir: str = DEFAULT_FIXTURES, repeat: int = 20):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    measurements = {}
+    for extractor_name in EXTRACTORS:
+        process = context.Process(target=_run, args=(extractor_name, fixtures_dir, repeat, results))
+        process.start()
+        name, cpu_per_page, peak_rss_kb = results.get()
+        process.join()
+        measurements[name] = (cpu_per_page, peak_rss_kb)
+    return measurements
+
+
+def print_report(measurements):
+    lean_cpu, lean_rss = measurements["lxml"]
+    newspaper_cpu, newspaper_rss = measurements["newspaper"]
+
+    print(f"{'page':<28}{'lxml ms':>10}{'newspaper ms':>15}{'speedup':>10}")
+    for page in lean_cpu:
+        lean_ms = lean_cpu[page] * 1000
+        newspaper_ms = newspaper_cpu[page] * 1000
+        print(f"{page:<28}{lean_ms:>10.2f}{newspaper_ms:>15.2f}{newspaper_ms / max(lean_ms, 1e-9):>9.1f}x")
+    print(f"{'peak memory growth (KiB)':<28}{lean_rss:>10.0f}{newspaper_rss:>15.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=20, help="extractions per page")
+    args = parser.parse_args()
+
+    print_report(run_benchmark(args.fixtures, args.repeat))
@@ -0,0 +1,193 @@
+"""
+A local stand-in for Ollama's /api/chat, for load testing the summary pipeline without a model.
+
+    cd src/
+    python -m benchmarks.fake_ollama --port 11435 --latency 0.2 --tokens-per-second 40 --error-rate 0.01
+    OLLAMA_HOST=http://127.0.0.1:11435 python -m scripts.run_summary
+
+Each request waits for a sampled time-to-first-token (log-normal around --latency, spread by
+--latency-sigma), plus its reply's token count at --tokens-per-second, then answers with a
+summary made from the start of the last message. Packed multi-article requests get a JSON
+object with one summary per article. --error-rate of the requests fail with HTTP 500.
+"""
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from summary.tokens import count_tokens
+
+PACKED_ARTICLE = re.compile(r"Article (\d+):\n(.*)")
+
+
+def fake_summary(text: str) -> str:
+    words = text.split()
+    return " ".join(words[:20]).rstrip(".") + "."
+
+
+def fake_reply(messages) -> str:
+    content = messages[-1]["content"] if messages else ""
+    articles = PACKED_ARTICLE.findall(content)
+    if articles:
+        return json.dumps({number: fake_summary(first_line) for number, first_line in articles})
+    # skip the instruction line of summary requests
+    return fake_summary(content.split("\n\n", 1)[-1])
+
+
+class FakeOllamaServer:
+    """
+    Serves /api/chat on a background thread, one thread per connection.
+
+    Args:
+        port: 0 picks a free port
+        latency: Median seconds before the first token
+        latency_sigma: Spread of the log-normal latency distribution, 0 for a fixed latency
+        tokens_per_second: Generation speed, 0 for instant replies
+        error_rate: Fraction of requests answered with HTTP 500
+        seed: Seed of the latency and error draws
+    """
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            latency: float = 0.0,
+            latency_sigma: float = 0.0,
+            tokens_per_second: float = 0.0,
+            error_rate: float = 0.0,
+            seed: int = 0,
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.reply_tokens = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw(self):
+        with self.lock:
+            latency = self.latency * self.random.lognormvariate(0, self.latency_sigma) if self.latency else 0.0
+            failed = self.random.random() < self.error_rate
+        return latency, failed
+
+    def _chat(self, request: dict):
+        """
+        Returns:
+            HTTP status and response body (or NDJSON lines when streaming)
+        """
+        messages = request.get("messages") or []
+        latency, failed = self._draw()
+        time.sleep(latency)
+        with self.lock:
+            self.requests += 1
+            self.errors += failed
+        if failed:
+            return 500, [{"error": "simulated failure"}]
+
+        reply = fake_reply(messages)
+        prompt_tokens = sum(count_tokens(message.get("content", "")) for message in messages)
+        reply_tokens = count_tokens(reply)
+        generation = reply_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        time.sleep(generation)
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.reply_tokens += reply_tokens
+
+        final = {
+            "model": request.get("model"),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": reply},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((latency + generation) * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": reply_tokens,
+            "eval_duration": int(generation * 1e9),
+        }
+        if not request.get("stream", True):
+            return 200, [final]
+        pieces = [{**final, "message": {"role": "assistant", "content": word}, "done": False}
+                  for word in re.findall(r"\S+\s*", reply)]
+        return 200, pieces + [{**final, "message": {"role": "assistant", "content": ""}}]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self._send(404, [{"error": "not found"}])
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send(400, [{"error": "invalid JSON"}])
+                    return
+                self._send(*server._chat(request))
+
+            def _send(self, status: int, lines):
+                body = "".join(json.dumps(line) + "\n" for line in lines).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/x-ndjson" if len(lines) > 1 else "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeOllamaServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2, help="median seconds to the first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="0 for instant replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with HTTP 500")
+    args = parser.parse_args()
+
+    fake = FakeOllamaServer(args.host, args.port, args.latency, args.latency_sigma, args.tokens_per_second,
+                            args.error_rate)
+    print(f"Serving a fake Ollama on {fake.url}")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,68 @@
+"""
+Compare article summary throughput with and without packing several short articles per request.
+
+    cd src/
+    python -m benchmarks.summaries --articles 200 --pack-sizes 1 4 8
+
+Summarizes the texts of the most recent articles with OLLAMA_MODEL once per pack size,
+without writing anything back, and reports effective articles/sec. Pack size 1 is the
+unbatched path: one request per article. The texts go straight to summarise_texts through an
+uncached client, so every run sends every article, whatever Article.summary_hash and
+LLM_CACHE_PATH hold.
+"""
+import argparse
+import time
+
+import config
+from adapters.ollama import AsyncOllamaClient
+from db.connection import get_session
+from db.models import Article
+from summary.main import summarise_texts
+
+
+def load_texts(limit: int):
+    with get_session() as session:
+        rows = (
+            session.query(Article.text)
+            .filter(Article.text.isnot(None))
+            .order_by(Article.created.desc())
+            .limit(limit)
+            .all()
+        )
+    return [text for (text,) in rows]
+
+
+def run_benchmark(llm_client, texts, pack_sizes, concurrency: int):
+    measurements = {}
+    for pack_size in pack_sizes:
+        start = time.perf_counter()
+        results = list(summarise_texts(llm_client, texts, concurrency, pack_size=pack_size))
+        seconds = time.perf_counter() - start
+        measurements[pack_size] = (sum(1 for result in results if result.error is None), seconds)
+    return measurements
+
+
+def print_report(measurements):
+    """
+    Print one line per pack size, with its speedup over the first one; "n/a" when the first
+    summarized nothing (every request failed, or there were no texts)
+    """
+    baseline = None
+    print(f"{'pack size':<12}{'summarized':>12}{'seconds':>10}{'articles/s':>12}{'speedup':>10}")
+    for pack_size, (summarised, seconds) in measurements.items():
+        rate = summarised / seconds if seconds else 0.0
+        if baseline is None:
+            baseline = rate
+        speedup = f"{rate / baseline:>9.1f}x" if baseline else f"{'n/a':>10}"
+        print(f"{pack_size:<12}{summarised:>12}{seconds:>10.1f}{rate:>12.2f}{speedup}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=100, help="number of recent articles to summarize")
+    parser.add_argument("--pack-sizes", type=int, nargs="+", default=[1, 4], help="articles per request to compare")
+    parser.add_argument("--concurrency", type=int, default=config.settings.SUMMARY_CONCURRENCY)
+    args = parser.parse_args()
+
+    client = AsyncOllamaClient(config.settings.OLLAMA_MODEL, timeout=config.settings.SUMMARY_REQUEST_TIMEOUT)
+    print_report(run_benchmark(client, load_texts(args.articles), args.pack_sizes, args.concurrency))
@@ -0,0 +1,204 @@
+"""
+End-to-end throughput of the summary pipeline on synthetic articles.
+
+    cd src/
+    python -m benchmarks.summary_pipeline --scales 1000 10000 100000 --concurrency 16
+
+For each scale, a fresh SQLite database (or --database-url, which must point at an empty
+scratch database: every table in it is dropped afterwards, so the benchmark refuses to use
+one that already has tables unless --i-know-this-drops-everything is given) is filled with
+synthetic articles across the default topics, then
+generate_article_summaries and generate_daily_summary run against a FakeOllamaServer through
+the real Ollama client. Reports wall time, throughput, LLM requests and database queries per
+stage. --ollama-host runs against an existing server instead, e.g. a real Ollama, or a fake
+one started separately with `python -m benchmarks.fake_ollama`: the in-process fake shares
+the benchmark's GIL and tops out at a few hundred requests per second.
+"""
+import argparse
+import datetime
+import logging
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import create_engine, event, insert, inspect, select
+from sqlalchemy.orm import sessionmaker
+
+import config
+from adapters.ollama import AsyncOllamaClient
+from benchmarks.fake_ollama import FakeOllamaServer
+from db.bulk import chunked
+from db.connection import Base
+from db.models import Article, DailyTrendSummary, FeedType, Source, SourceName, Topic, article_topic
+from summary.main import generate_article_summaries, generate_daily_summary
+
+WORDS = (
+    "government minister council election vote budget policy report market shares company profits growth "
+    "hospital patients doctors health study research technology software data security network launch "
+    "city river bridge storm weather police court trial judge school students teachers energy prices "
+    "climate plan talks deal announced said warned expected increased reduced new major local national"
+).split()
+
+
+@dataclass
+class StageResult:
+    scale: int
+    stage: str
+    seconds: float
+    items: int
+    llm_requests: int
+    queries: int
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+def synthetic_text(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(6, 30)):
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24)))
+        lines.append(sentence.capitalize() + ".")
+    return "\n".join(lines)
+
+
+def seed_database(session_maker, count: int, seed: int = 0):
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    with session_maker() as session:
+        source = Source(name=SourceName.BBC)
+        session.add_all([source, *(Topic(name=feed_type.value) for feed_type in FeedType)])
+        session.commit()
+
+        topics = [feed_type.value for feed_type in FeedType]
+        rows = (
+            {
+                "title": f"Synthetic article {i}",
+                "url": f"https://benchmark.test/article/{i}",
+                "source_id": source.id,
+                "source_topic": rng.choice(topics),
+                "text": synthetic_text(rng),
+                "created": now - datetime.timedelta(minutes=rng.uniform(1, 20 * 60)),
+            }
+            for i in range(count)
+        )
+        for chunk in chunked(list(rows), 5000):
+            session.execute(insert(Article), chunk)
+        # what infer_topics would do: daily summaries read the articles of a topic through article_topic
+        session.execute(insert(article_topic).from_select(
+            ["article_id", "topic_id"],
+            select(Article.id, Topic.id).join(Topic, Topic.name == Article.source_topic),
+        ))
+        session.commit()
+
+
+def existing_tables(database_url: str):
+    engine = create_engine(database_url)
+    try:
+        return inspect(engine).get_table_names()
+    finally:
+        engine.dispose()
+
+
+def count_queries(engine) -> dict:
+    counter = {"queries": 0}
+
+    def before_cursor_execute(*args):
+        counter["queries"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+def run_scale(scale: int, ollama_host: str, concurrency: int, database_url: str = None, seed: int = 0):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(database_url or f"sqlite:///{os.path.join(directory, 'benchmark.sqlite')}")
+        Base.metadata.create_all(engine)
+        session_maker = sessionmaker(bind=engine)
+        seed_database(session_maker, scale, seed)
+
+        counter = count_queries(engine)
+        llm_client = RequestCounter(AsyncOllamaClient(
+            config.settings.OLLAMA_MODEL, timeout=config.settings.SUMMARY_REQUEST_TIMEOUT, host=ollama_host,
+        ))
+        results = []
+        since = datetime.datetime.now() - datetime.timedelta(days=1)
+
+        with session_maker() as session:
+            started, queries = time.perf_counter(), counter["queries"]
+            summarised = generate_article_summaries(session, llm_client, date=since, concurrency=concurrency)
+            results.append(StageResult(scale, "article summaries", time.perf_counter() - started,
+                                       summarised.summarised, llm_client.take(), counter["queries"] - queries))
+
+            started, queries = time.perf_counter(), counter["queries"]
+            generate_daily_summary(session, llm_client, date=since, concurrency=concurrency)
+            results.append(StageResult(scale, "daily summaries", time.perf_counter() - started,
+                                       session.query(DailyTrendSummary).count(), llm_client.take(),
+                                       counter["queries"] - queries))
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+    return results
+
+
+class RequestCounter:
+    """
+    Counts the requests made through an async LLM client
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.model = client.model
+        self.requests = 0
+
+    async def chat(self, messages, **kwargs) -> str:
+        self.requests += 1
+        return await self.client.chat(messages, **kwargs)
+
+    def take(self) -> int:
+        requests, self.requests = self.requests, 0
+        return requests
+
+
+def print_report(results):
+    print(f"{'articles':>9}  {'stage':<18}{'seconds':>9}{'summaries':>11}{'per second':>12}"
+          f"{'LLM requests':>14}{'DB queries':>12}")
+    for result in results:
+        print(f"{result.scale:>9}  {result.stage:<18}{result.seconds:>9.1f}{result.items:>11}"
+              f"{result.items_per_second:>12.2f}{result.llm_requests:>14}{result.queries:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000], help="articles per run")
+    parser.add_argument("--concurrency", type=int, default=config.settings.SUMMARY_CONCURRENCY)
+    parser.add_argument("--database-url", help="empty scratch database to use instead of a temporary SQLite file")
+    parser.add_argument("--i-know-this-drops-everything", action="store_true",
+                        help="use --database-url even if it has tables, all of which get dropped")
+    parser.add_argument("--ollama-host", help="existing server to use instead of the fake one")
+    parser.add_argument("--latency", type=float, default=0.01, help="fake server's median seconds to the first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="fake server's speed, 0 for instant")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true", help="log every summary, which slows large runs down")
+    args = parser.parse_args()
+    if args.database_url and not args.i_know_this_drops_everything:
+        tables = existing_tables(args.database_url)
+        if tables:
+            parser.error(f"--database-url already has tables ({', '.join(sorted(tables))}), all of which "
+                         f"would be dropped; pass --i-know-this-drops-everything if that is what you want")
+
+    config.setup_logging()
+    if not args.verbose:
+        for logger_name in ("summary", "httpx", "httpcore"):
+            logging.getLogger(logger_name).setLevel(logging.WARNING)
+    all_results = []
+    for scale in args.scales:
+        if args.ollama_host:
+            all_results += run_scale(scale, args.ollama_host, args.concurrency, args.database_url)
+            continue
+        with FakeOllamaServer(latency=args.latency, latency_sigma=args.latency_sigma,
+                              tokens_per_second=args.tokens_per_second, error_rate=args.error_rate) as server:
+            all_results += run_scale(scale, server.url, args.concurrency, args.database_url)
+    print_report(all_results)
@@ -0,0 +1,48 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# query parameters added by feeds and share buttons that don't change the page
+TRACKING_PARAMS = {
+    "at_campaign", "at_medium", "at_link_id", "at_link_type", "at_link_origin", "at_format", "at_ptr_name",
+    "at_bbc_team", "at_custom1", "at_custom2", "at_custom3", "at_custom4",
+    "cmp", "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ocid", "ref", "ref_src", "igshid",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalise a URL so that links to the same page compare equal:
+    https scheme, lower-case host, no default port, fragment, tracking
+    parameters or trailing slash, and sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def url_hash(url: str) -> str:
+    """
+    Fixed-width dedup key for an article URL: SHA-1 hex digest of its canonical form
+    """
+    return hashlib.sha1(canonicalize_url(url).encode("utf-8")).hexdigest()
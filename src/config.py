@@ -1,8 +1,11 @@
 import logging
+from pathlib import Path
 from typing import List
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"  # defaults below don't depend on the working directory
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(extra='ignore', env_file="../.env")
@@ -11,6 +14,100 @@ class Settings(BaseSettings):
     DATABASE_CONNECTION_STRING: str = ""
     OLLAMA_MODEL: str = "llama3.1:8b"
 
+    # LLM response cache (adapters/cache.py)
+    LLM_CACHE_PATH: str | None = str(DATA_DIR / "llm_cache.sqlite")  # None disables the cache
+    LLM_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    LLM_CACHE_MAX_AGE_DAYS: float = 30
+    LLM_CACHE_BYPASS: bool = False  # always call the model, refreshing the cached responses
+
+    # Article summaries (summary/main.py)
+    SUMMARY_CONCURRENCY: int = 4  # requests in flight; match the number of parallel requests Ollama serves
+    SUMMARY_REQUEST_TIMEOUT: float = 120.0  # seconds
+    SUMMARY_COMMIT_BATCH_SIZE: int = 20
+    SUMMARY_PACK_SIZE: int = 1  # above 1, short articles are summarized this many per request
+    SUMMARY_PACK_MAX_TOKENS: int = 400  # articles up to this long count as short
+    SUMMARY_MAX_INPUT_TOKENS: int = 1500  # longer articles are cut down to their lead and most salient sentences
+    SUMMARY_LEAD_SENTENCES: int = 3
+    SUMMARY_TOKENIZER: str | None = None  # Hugging Face tokenizer of OLLAMA_MODEL, e.g. "unsloth/Meta-Llama-3.1-8B-Instruct". None estimates token counts.
+
+    # Daily topic summaries (summary/main.py)
+    DAILY_SUMMARY_TOKEN_BUDGET: int = 3000  # input tokens per request; more summaries than this are summarized in chunks
+    DAILY_SUMMARY_CHUNK_BOUNDARY: int = 16  # a chunk ends every this many articles on average, at articles picked by id
+    DAILY_SUMMARY_CACHE_DAYS: int = 3  # how long chunk summaries are kept for reuse
+
+    # RSS feed downloads
+    FEED_FETCH_MAX_WORKERS: int = 8
+    FEED_FETCH_PER_HOST_LIMIT: int = 2
+    FEED_FETCH_TIMEOUT: float = 10.0  # seconds, per request
+    FEED_FETCH_TOTAL_TIMEOUT: float = 60.0  # seconds, for the whole ingestion run
+
+    # Adaptive feed polling (scripts/run_scheduler.py)
+    FEED_POLL_MIN_INTERVAL: int = 5 * 60  # seconds
+    FEED_POLL_MAX_INTERVAL: int = 6 * 60 * 60  # seconds, upper bound on how stale a feed can get
+    FEED_POLL_DEFAULT_INTERVAL: int = 30 * 60  # seconds, for feeds without history
+    FEED_POLL_TARGET_NEW_ITEMS: float = 2.0  # aim for this many new articles per poll
+    FEED_POLL_JITTER: float = 0.1  # +/- fraction of the interval
+
+    # Article content extraction (ingestion/content.py)
+    EXTRACTION_DOWNLOAD_WORKERS: int = 16
+    EXTRACTION_PER_DOMAIN_LIMIT: int = 4
+    EXTRACTION_PARSE_WORKERS: int = 4  # processes; 1 parses in the main process
+    EXTRACTION_TIMEOUT: float = 15.0  # seconds, per download
+    EXTRACTION_COMMIT_BATCH_SIZE: int = 50
+    EXTRACTION_QUERY_CHUNK_SIZE: int = 1000  # rows fetched per round-trip from the work queue
+    EXTRACTION_MAX_ARTICLES_PER_RUN: int | None = None  # None processes the whole backlog
+    EXTRACTION_MAX_ATTEMPTS: int = 5  # failed attempts before an article is given up on
+    EXTRACTION_RETRY_BASE_DELAY: int = 60 * 60  # seconds before the first retry, doubled after each failure
+    EXTRACTION_RETRY_MAX_DELAY: int = 7 * 24 * 60 * 60  # seconds
+    HTML_CACHE_DIR: str | None = str(DATA_DIR / "html_cache")  # raw article HTML, None disables the cache
+
+    # Near-duplicate detection (ingestion/dedup.py). Changing the first three invalidates stored signatures.
+    DEDUP_NUM_PERM: int = 128  # MinHash signature length
+    DEDUP_BANDS: int = 16  # LSH bands of DEDUP_NUM_PERM / DEDUP_BANDS rows each
+    DEDUP_SHINGLE_SIZE: int = 5  # words
+    DEDUP_THRESHOLD: float = 0.8  # estimated Jaccard similarity of a near-duplicate
+
+    # Topic inference (inference/main.py)
+    TOPIC_INFERENCE_MODE: str = "source"  # "source" copies the feed topic, "embedding" uses EMBEDDING_MODEL
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BATCH_SIZE: int = 256
+    EMBEDDING_THREADS: int | None = None  # torch intra-op threads for all CPU models, None uses torch's default
+    EMBEDDING_MAX_CHARS: int = 2000  # of title + text; the models truncate at a few hundred tokens anyway
+    EMBEDDING_STORE_DIR: str | None = str(DATA_DIR / "embeddings")  # article vectors, None disables the store
+    EMBEDDING_STORE_DTYPE: str = "float16"  # or "int8", applies when the store is (re)created
+    RELATED_INDEX_NEIGHBORS: int = 30  # graph degree of the related-articles ANN index
+    RELATED_INDEX_MIN_ROWS: int = 10_000  # smaller stores are searched exactly, without an ANN index
+    RELATED_INDEX_REBUILD_FRACTION: float = 0.2  # rebuild instead of extending once this share of rows is new
+    RELATED_INDEX_RELOAD_INTERVAL: float = 30.0  # seconds between two checks of the API for a newly written index
+
+    # Comment sentiment and topics (inference/comments.py)
+    COMMENT_SENTIMENT_MODEL: str = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+    COMMENT_CHUNK_SIZE: int = 2048  # comments read, classified and committed together
+    COMMENT_BATCH_SIZE: int = 64  # comments per forward pass
+    COMMENT_MAX_TOKENS: int = 256
+    COMMENT_TOPIC_THRESHOLD: float = 0.3  # cosine similarity for a comment to be tagged with a topic
+
+    # Trending terms (inference/trending.py)
+    TREND_TOP_K: int = 10  # terms stored per topic per day
+    TREND_BASELINE_SMOOTHING: float = 0.1  # EWMA weight of each new day in a term's baseline
+    TREND_VARIANCE_FLOOR: float = 1e-4  # keeps new and steady terms from getting unbounded scores
+    TREND_MIN_ARTICLES: int = 2  # articles of the topic that must use a term that day
+    TREND_MIN_SCORE: float = 2.0  # standard deviations above the baseline
+    TREND_MIN_HISTORY_DAYS: int = 4  # days of a topic scored before its terms can trend
+    TREND_BASELINE_MAX_AGE: int = 60  # days; baselines of terms unused for longer are dropped
+    TREND_BACKFILL_DAYS: int = 7  # days scored on the first run
+
+    # Emerging story clustering (inference/clustering.py)
+    CLUSTER_WINDOW_HOURS: int = 48
+    CLUSTER_FULL_INTERVAL: int = 6 * 60 * 60  # seconds between full re-clusterings; runs in between only assign
+    CLUSTER_MIN_SIZE: int = 5  # articles
+    CLUSTER_UMAP_DIMENSIONS: int | None = 5  # None clusters the raw embeddings
+    CLUSTER_UMAP_NEIGHBORS: int = 15
+    CLUSTER_MATCH_SIMILARITY: float = 0.8  # centroid similarity for a re-clustered story to keep its topic
+    CLUSTER_ASSIGN_MIN_SIMILARITY: float = 0.5  # floor on the similarity new articles need to join a story
+    TOPIC_SIMILARITY_THRESHOLD: float = 0.3  # cosine similarity needed for topics after the best one
+    TOPIC_MAX_PER_ARTICLE: int = 2
+
 
 settings = Settings()
 
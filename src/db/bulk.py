@@ -0,0 +1,91 @@
+from typing import Any, Dict, Iterable, List, Sequence
+
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+# keeps multi-row statements under the bound parameter limits of both backends
+CHUNK_SIZE = 500
+
+_dialect_inserts = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def chunked(items: Sequence, size: int = CHUNK_SIZE) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def insert_ignore(
+        session: Session,
+        table: Table,
+        rows: List[Dict[str, Any]],
+        index_elements: List[str] = None,
+        returning=None,
+) -> list:
+    """
+    Bulk INSERT ... ON CONFLICT DO NOTHING on Postgres and SQLite.
+
+    Args:
+        session: Database session
+        table: Table (or mapped class) to insert into
+        rows: Column values, one dict per row
+        index_elements: Columns of the unique constraint to ignore conflicts on.
+            If None, any conflict is ignored.
+        returning: Column to return for the rows that were actually inserted
+
+    Returns:
+        The `returning` values of inserted rows, or an empty list if `returning` is None.
+    """
+    if not rows:
+        return []
+
+    dialect = session.get_bind().dialect.name
+    if dialect not in _dialect_inserts:
+        raise NotImplementedError(f"insert_ignore is not supported for dialect: {dialect}")
+
+    statement = _dialect_inserts[dialect](table).on_conflict_do_nothing(index_elements=index_elements)
+    if returning is not None:
+        statement = statement.returning(returning)
+
+    inserted = []
+    for chunk in chunked(rows):
+        result = session.execute(statement, list(chunk))
+        if returning is not None:
+            inserted.extend(result.scalars().all())
+    return inserted
+
+
+def upsert(
+        session: Session,
+        table: Table,
+        rows: List[Dict[str, Any]],
+        index_elements: List[str],
+        update_columns: List[str],
+):
+    """
+    Bulk INSERT ... ON CONFLICT DO UPDATE on Postgres and SQLite.
+
+    Args:
+        session: Database session
+        table: Table (or mapped class) to insert into
+        rows: Column values, one dict per row
+        index_elements: Columns of the unique constraint that identifies a row
+        update_columns: Columns overwritten with the new values when the row exists
+    """
+    if not rows:
+        return
+
+    dialect = session.get_bind().dialect.name
+    if dialect not in _dialect_inserts:
+        raise NotImplementedError(f"upsert is not supported for dialect: {dialect}")
+
+    statement = _dialect_inserts[dialect](table)
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: statement.excluded[column] for column in update_columns},
+    )
+    for chunk in chunked(rows):
+        session.execute(statement, list(chunk))
@@ -1,10 +1,13 @@
 import datetime
 
-from sqlalchemy import Column, Integer, DateTime, String, Text, JSON, ForeignKey, Date, Table
+from sqlalchemy import Column, Integer, DateTime, String, Text, JSON, ForeignKey, Date, Table, Float, Index, Boolean, \
+    LargeBinary, BigInteger, UniqueConstraint
+from sqlalchemy import text as sql_text, false, true
 from sqlalchemy.orm import relationship
 from sqlalchemy import Enum as SAEnum
 from enum import Enum
 
+from common.urls import url_hash
 from db.connection import Base
 
 
@@ -25,6 +28,18 @@ class Feed(Base):
     source_id = Column(Integer, ForeignKey("source.id"), nullable=False)
     source = relationship("Source")
 
+    # validators from the last successful download, used to skip unchanged feeds
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    content_hash = Column(String(64), nullable=True)  # sha256 hex digest of the feed body
+
+    # adaptive polling state, maintained by ingestion.scheduler
+    poll_interval = Column(Integer, nullable=True)  # seconds
+    publish_rate = Column(Float, nullable=True)  # smoothed new articles per hour
+    last_new_items = Column(Integer, nullable=True)
+    last_polled_at = Column(DateTime, nullable=True)
+    next_poll_at = Column(DateTime, nullable=True, index=True)
+
 
 class SourceName(Enum):
     BBC = "BBC"
@@ -62,9 +77,31 @@ class Topic(Base):
 
     articles = relationship("Article", secondary=article_topic, back_populates="topics")
 
+# LSH index of Article.minhash: one row per band of each signature
+article_minhash_bucket = Table(
+    "article_minhash_bucket",
+    Base.metadata,
+    Column("bucket", BigInteger, primary_key=True),
+    Column("article_id", ForeignKey("article.id"), primary_key=True, index=True),
+)
+
+
+def _default_url_hash(context):
+    url = context.get_current_parameters().get("url")
+    return url_hash(url) if url else None
+
 
 class Article(Base):
     __tablename__ = 'article'
+    __table_args__ = (
+        # work queue of ingestion/content.py: articles still waiting for their text
+        Index(
+            "ix_article_text_missing",
+            "created",
+            postgresql_where=sql_text("text IS NULL AND fetch_failed_permanently = false"),
+            sqlite_where=sql_text("text IS NULL AND fetch_failed_permanently = 0"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -75,6 +112,8 @@ class Article(Base):
 
     title = Column(String, nullable=True)
     url = Column(String, nullable=True)
+    # dedup key, see common.urls.url_hash. null only for legacy rows whose canonical URL was already taken.
+    url_hash = Column(String(40), nullable=True, unique=True, index=True, default=_default_url_hash)
 
     source_id = Column(Integer, ForeignKey("source.id"), nullable=False)
     source = relationship("Source")
@@ -82,7 +121,20 @@ class Article(Base):
     source_topic = Column(String, nullable=True)  # the topic that the source website gave this article. nullable because some sources may not have it.
     author = Column(String, nullable=True)
     text = Column(Text, nullable=True)
+
+    # content extraction failures, see ingestion/content.py
+    fetch_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    fetch_error = Column(String(64), nullable=True)  # error class of the last failed attempt, e.g. HTTP404
+    fetch_next_attempt_at = Column(DateTime, nullable=True)
+    fetch_failed_permanently = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    # near-duplicate detection, see ingestion/dedup.py
+    minhash = Column(LargeBinary, nullable=True)  # MinHash signature of the text
+    canonical_article_id = Column(Integer, ForeignKey("article.id"), nullable=True, index=True)
+    canonical_article = relationship("Article", remote_side=[id])
     summary = Column(Text, nullable=True)
+    # sha256 of the model and the request the summary came from, see summary/main.py
+    summary_hash = Column(String(64), nullable=True)
     created = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
 
     topics = relationship("Topic", secondary=article_topic, back_populates="articles")
@@ -90,6 +142,15 @@ class Article(Base):
 
 class Comment(Base):
     __tablename__ = 'comment'
+    __table_args__ = (
+        # work queue of inference/comments.py: comments still waiting for sentiment
+        Index(
+            "ix_comment_sentiment_missing",
+            "id",
+            postgresql_where=sql_text("sentiment IS NULL"),
+            sqlite_where=sql_text("sentiment IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -115,3 +176,82 @@ class DailyTrendSummary(Base):
     topic = relationship("Topic")
 
     articles = relationship("Article", back_populates="daily_trend_summary")
+
+
+class SummaryChunk(Base):
+    """
+    A partial summary of a daily topic summary (summary/main.py), kept so that later runs over
+    mostly the same articles can reuse it. Keyed by the hash of the request that produced it.
+    """
+    __tablename__ = 'summary_chunk'
+
+    request_hash = Column(String(64), primary_key=True)
+    summary = Column(Text, nullable=False)
+    created = Column(DateTime, nullable=False, default=datetime.datetime.utcnow, index=True)
+
+
+class StoryCluster(Base):
+    """
+    An emerging story found by clustering recent article embeddings (inference/clustering.py).
+
+    The cluster is exposed as its own Topic, so articles are linked to it through article_topic.
+    """
+    __tablename__ = 'story_cluster'
+
+    id = Column(Integer, primary_key=True)
+
+    topic_id = Column(Integer, ForeignKey("topic.id"), nullable=False, unique=True)
+    topic = relationship("Topic")
+
+    centroid = Column(LargeBinary, nullable=False)  # L2-normalised float32 vector
+    size = Column(Integer, nullable=False)
+    assign_similarity = Column(Float, nullable=False)  # cosine similarity new articles need to join
+    active = Column(Boolean, nullable=False, default=True, server_default=true(), index=True)
+    clustered_at = Column(DateTime, nullable=False)  # last full clustering that produced this cluster
+    updated = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class TermBaseline(Base):
+    """
+    Rolling baseline of how much weight a term usually has within a topic (inference/trending.py):
+    exponentially weighted mean and variance of its daily TF-IDF weight, as of updated_date.
+    """
+    __tablename__ = 'term_baseline'
+
+    topic_id = Column(Integer, ForeignKey("topic.id"), primary_key=True)
+    term = Column(String(100), primary_key=True)
+    mean = Column(Float, nullable=False)
+    variance = Column(Float, nullable=False)
+    updated_date = Column(Date, nullable=False, index=True)
+
+
+class TopicTrendHistory(Base):
+    """
+    Number of days of a topic that inference/trending.py has scored. Until there are enough, the
+    topic's baselines are too young to tell a surge from the topic's usual vocabulary.
+    """
+    __tablename__ = 'topic_trend_history'
+
+    topic_id = Column(Integer, ForeignKey("topic.id"), primary_key=True)
+    scored_days = Column(Integer, nullable=False)
+
+
+class TrendingTerm(Base):
+    """
+    A term that surged within a topic on a given day, scored against its TermBaseline
+    """
+    __tablename__ = 'trending_term'
+    __table_args__ = (
+        UniqueConstraint("date", "topic_id", "term"),
+    )
+
+    id = Column(Integer, primary_key=True)
+
+    date = Column(Date, nullable=False, index=True)
+    topic_id = Column(Integer, ForeignKey("topic.id"), nullable=False)
+    topic = relationship("Topic")
+
+    term = Column(String(100), nullable=False)
+    score = Column(Float, nullable=False)  # standard deviations above the baseline
+    weight = Column(Float, nullable=False)  # mean TF-IDF weight across the topic's articles that day
+    articles = Column(Integer, nullable=False)  # articles of the topic using the term that day
@@ -0,0 +1,188 @@
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+import config
+from embeddings.store import EmbeddingStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "related.ann"
+
+
+class RelatedIndex:
+    """
+    Nearest neighbours of articles by embedding, for "related coverage".
+
+    The first `rows` rows of the store are searched with a pynndescent index (or exactly, when
+    the index was small enough to skip building one); rows appended to the store after the
+    index was built are searched exactly, so new articles show up before the next rebuild.
+
+    Args:
+        store: The embeddings the index was built from
+        rows: Store rows covered by `ann`
+        ann: pynndescent.NNDescent over those rows, None to search them exactly
+    """
+
+    def __init__(self, store: EmbeddingStore, rows: int, ann=None):
+        self.store = store
+        self.rows = rows
+        self.ann = ann
+
+    def _exact(self, query: np.ndarray, start: int, stop: int, k: int):
+        similarities = self.store.decode(self.store.vectors[start:stop]) @ query
+        top = np.argsort(-similarities)[:k]
+        return top + start, 1 - similarities[top]
+
+    def related(self, article_id: int, limit: int) -> List[int]:
+        """
+        Returns:
+            Ids of the most similar articles, closest first; empty if the article isn't indexed
+        """
+        (row,) = self.store.rows([article_id])
+        if row < 0:
+            return []
+        query = self.store.decode(self.store.vectors[row])
+        k = limit + 1  # the article finds itself
+
+        if self.ann is not None:
+            neighbours, distances = self.ann.query(query[np.newaxis, :], k=min(k, self.rows))
+            neighbours, distances = neighbours[0], distances[0]
+        else:
+            neighbours, distances = self._exact(query, 0, self.rows, k)
+
+        if len(self.store) > self.rows:
+            fresh, fresh_distances = self._exact(query, self.rows, len(self.store), k)
+            neighbours = np.concatenate([neighbours, fresh])
+            distances = np.concatenate([distances, fresh_distances])
+
+        ordered = neighbours[np.argsort(distances, kind="stable")]
+        return [int(i) for i in self.store.ids[ordered] if i != article_id][:limit]
+
+
+def index_path(store: EmbeddingStore) -> str:
+    return os.path.join(store.root, INDEX_FILE)
+
+
+def _build_ann(vectors: np.ndarray):
+    # slow to import, and only needed when building
+    import pynndescent
+
+    ann = pynndescent.NNDescent(vectors, metric="cosine", n_neighbors=config.settings.RELATED_INDEX_NEIGHBORS)
+    ann.prepare()
+    return ann
+
+
+def update_related_index(store: EmbeddingStore, min_rows: int = None) -> RelatedIndex:
+    """
+    Bring the related-articles index up to date with the store and save it next to it.
+
+    New rows are added to the existing index in place; it is rebuilt from scratch when they
+    exceed RELATED_INDEX_REBUILD_FRACTION of it, or when the store was reset for another model.
+    Stores smaller than min_rows are searched exactly and get no ANN index at all.
+
+    Args:
+        store: Embeddings to index
+        min_rows: Defaults to RELATED_INDEX_MIN_ROWS
+    """
+    settings = config.settings
+    min_rows = settings.RELATED_INDEX_MIN_ROWS if min_rows is None else min_rows
+    path = index_path(store)
+    started = time.perf_counter()
+
+    saved = _read(path)
+    stale = saved is None or saved["model"] != store.model_name or saved["rows"] > len(store)
+    rows, ann = (0, None) if stale else (saved["rows"], saved["ann"])
+    new_rows = len(store) - rows
+    if not stale and not new_rows:
+        return RelatedIndex(store, rows, ann)
+
+    if len(store) < min_rows:
+        rows, ann = len(store), None
+    elif ann is None or new_rows > settings.RELATED_INDEX_REBUILD_FRACTION * rows:
+        ann = _build_ann(store.decode(store.vectors))
+        rows = len(store)
+        logger.info(f"Built the related-articles index over {rows} articles in {time.perf_counter() - started:.1f}s")
+    else:
+        ann.update(xs_fresh=store.decode(store.vectors[rows:]))
+        ann.prepare()
+        rows = len(store)
+        logger.info(f"Added {new_rows} articles to the related-articles index in {time.perf_counter() - started:.1f}s")
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as index_file:
+        pickle.dump({"model": store.model_name, "rows": rows, "ann": ann}, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+        index_file.flush()
+        os.fsync(index_file.fileno())
+    # readers pick up the new file by its modification time, so it has to appear in one go
+    os.replace(temporary_path, path)
+    return RelatedIndex(store, rows, ann)
+
+
+def _read(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as index_file:
+        return pickle.load(index_file)
+
+
+def load_related_index(store_dir: str) -> Optional[RelatedIndex]:
+    store = EmbeddingStore(store_dir)
+    saved = _read(index_path(store))
+    if saved is None or saved["model"] != store.model_name:
+        return None
+    index = RelatedIndex(store, saved["rows"], saved["ann"])
+    if len(store):
+        # pays for the id lookup table and numba compilation here rather than on the first request
+        index.related(int(store.ids[0]), 1)
+    return index
+
+
+_loaded = {"store_dir": None, "mtime": None, "index": None, "checked": None}
+_loaded_lock = threading.Lock()
+
+
+def get_related_index() -> Optional[RelatedIndex]:
+    """
+    The index of EMBEDDING_STORE_DIR, loaded once per process and reloaded only when the
+    pipeline has written a new one. The file is looked at no more than once every
+    RELATED_INDEX_RELOAD_INTERVAL seconds, and one request thread reloads it while the others
+    keep the previous index. None when there is no index yet.
+    """
+    settings = config.settings
+    store_dir = settings.EMBEDDING_STORE_DIR
+    if not store_dir:
+        return None
+
+    def fresh() -> bool:
+        return (_loaded["store_dir"] == store_dir and _loaded["checked"] is not None
+                and time.monotonic() - _loaded["checked"] < settings.RELATED_INDEX_RELOAD_INTERVAL)
+
+    if fresh():
+        return _loaded["index"]
+    with _loaded_lock:
+        if fresh():
+            return _loaded["index"]
+        try:
+            index_stat = os.stat(os.path.join(store_dir, INDEX_FILE))
+            # os.replace gives every written index a new inode, even within the mtime resolution
+            mtime = (index_stat.st_mtime_ns, index_stat.st_ino)
+        except FileNotFoundError:
+            mtime = None
+
+        if _loaded["store_dir"] != store_dir or mtime != _loaded["mtime"]:
+            try:
+                index = None if mtime is None else load_related_index(store_dir)
+            except (EOFError, pickle.UnpicklingError) as e:
+                logger.warning(f"Keeping the previous related-articles index, the new one can't be read: {e}")
+                if _loaded["store_dir"] != store_dir:
+                    _loaded.update(store_dir=store_dir, mtime=None, index=None)
+            else:
+                _loaded.update(store_dir=store_dir, mtime=mtime, index=index)
+        _loaded["checked"] = time.monotonic()
+        return _loaded["index"]
@@ -0,0 +1,80 @@
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+
+import config
+from db.connection import get_session
+from db.models import Article
+from embeddings.ann import update_related_index
+from embeddings.store import EmbeddingStore
+from inference.encoder import Encoder, SentenceTransformerEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def open_embedding_store(model_name: Optional[str] = None) -> Optional[EmbeddingStore]:
+    """
+    Args:
+        model_name: Model the caller embeds with; None to only read what is stored
+    """
+    if not config.settings.EMBEDDING_STORE_DIR:
+        return None
+    return EmbeddingStore(config.settings.EMBEDDING_STORE_DIR, model_name, dtype=config.settings.EMBEDDING_STORE_DTYPE)
+
+
+def article_document(title: Optional[str], text: Optional[str]) -> str:
+    # the models we use truncate at a few hundred tokens, so there is no point shipping whole articles
+    return f"{title or ''}\n\n{text or ''}".strip()[:config.settings.EMBEDDING_MAX_CHARS]
+
+
+def embed_articles(session, encoder: Encoder, store: EmbeddingStore, batch_size: int = None) -> int:
+    """
+    Encode every article with extracted text that isn't in the store yet, and append it.
+
+    Articles are only stored once they have text, so the vector never goes stale when the
+    text arrives after the title.
+
+    Returns:
+        The number of articles embedded
+    """
+    batch_size = batch_size or config.settings.EMBEDDING_BATCH_SIZE
+
+    article_ids = np.fromiter(
+        (article_id for (article_id,) in session.query(Article.id).filter(Article.text.isnot(None)).order_by(Article.id)),
+        dtype=np.int64,
+    )
+    missing_ids = article_ids[~store.contains(article_ids)].tolist()
+
+    started = time.perf_counter()
+    for start in range(0, len(missing_ids), batch_size):
+        rows = (
+            session.query(Article.id, Article.title, Article.text)
+            .filter(Article.id.in_(missing_ids[start:start + batch_size]))
+            .all()
+        )
+        vectors = encoder.encode([article_document(title, text) for _, title, text in rows])
+        store.add([article_id for article_id, _, _ in rows], vectors)
+
+    elapsed = time.perf_counter() - started
+    if missing_ids:
+        logger.info(f"Embedded {len(missing_ids)} articles in {elapsed:.1f}s ({len(missing_ids) / elapsed:.0f} articles/s)")
+    return len(missing_ids)
+
+
+if __name__ == "__main__":
+    config.setup_logging()
+
+    encoder = SentenceTransformerEncoder(
+        config.settings.EMBEDDING_MODEL,
+        batch_size=config.settings.EMBEDDING_BATCH_SIZE,
+        threads=config.settings.EMBEDDING_THREADS,
+    )
+    store = open_embedding_store(encoder.model_name)
+    if store is None:
+        raise SystemExit("EMBEDDING_STORE_DIR is not set")
+
+    with get_session() as session:
+        embed_articles(session, encoder, store)
+    update_related_index(store)
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DTYPES = {"float16": np.float16, "int8": np.int8}
+INT8_SCALE = 127.0  # vectors are L2-normalised, so every component is within [-1, 1]
+
+_META_FILE = "meta.json"
+_IDS_FILE = "ids.bin"
+_VECTORS_FILE = "vectors.bin"
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk matrix of article embeddings, keyed by article id.
+
+    Vectors are kept as float16 (or int8, scaled by INT8_SCALE) in one flat file with a
+    parallel file of int64 article ids, and both are memory-mapped read-only, so opening a
+    store with millions of rows neither reads nor copies it. Row lookups go through a sorted
+    view of the ids built with numpy on first use.
+
+    meta.json records the model the vectors were produced with. Opening the store for a
+    different model empties it, so that everything gets re-embedded.
+
+    Only one process may append at a time; readers see new rows after refresh().
+
+    Args:
+        root: Directory holding the store
+        model_name: Model the caller embeds with. None opens whatever model the store has.
+        dtype: Storage type for a new store, "float16" or "int8"
+    """
+
+    def __init__(self, root: str, model_name: Optional[str] = None, dtype: str = "float16"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported embedding dtype {dtype}")
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+
+        meta = self._read_meta()
+        if model_name is not None and meta.get("model") != model_name:
+            if meta:
+                logger.warning(f"Embedding model changed from {meta.get('model')} to {model_name}, resetting store")
+            meta = {"model": model_name, "dtype": dtype, "dimensions": None}
+            self._reset_files(meta)
+
+        self.model_name = meta.get("model")
+        self.dtype = meta.get("dtype", dtype)
+        self.dimensions = meta.get("dimensions")
+        self.refresh()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _read_meta(self) -> dict:
+        if not os.path.exists(self._path(_META_FILE)):
+            return {}
+        with open(self._path(_META_FILE)) as meta_file:
+            return json.load(meta_file)
+
+    def _write_meta(self, meta: dict):
+        temporary_path = self._path(_META_FILE + ".tmp")
+        with open(temporary_path, "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(temporary_path, self._path(_META_FILE))
+
+    def _reset_files(self, meta: dict):
+        # other processes may have the files memory-mapped, and truncating a mapped file in place
+        # kills them with SIGBUS on their next read; replaced files stay mapped until re-opened
+        for name in (_IDS_FILE, _VECTORS_FILE):
+            temporary_path = self._path(name + ".tmp")
+            open(temporary_path, "wb").close()
+            os.replace(temporary_path, self._path(name))
+        self._write_meta(meta)
+
+    def refresh(self):
+        """
+        Re-map the files to pick up rows appended since the store was opened
+        """
+        self._sorted_order = None
+        self._sorted_ids = None
+        rows = 0
+        if self.dimensions:
+            row_bytes = self.dimensions * np.dtype(DTYPES[self.dtype]).itemsize
+            # ids are written last, so a row only counts once both halves are on disk
+            rows = min(
+                os.path.getsize(self._path(_IDS_FILE)) // 8,
+                os.path.getsize(self._path(_VECTORS_FILE)) // row_bytes,
+            )
+
+        if rows:
+            self._ids = np.memmap(self._path(_IDS_FILE), dtype=np.int64, mode="r", shape=(rows,))
+            self._vectors = np.memmap(
+                self._path(_VECTORS_FILE), dtype=DTYPES[self.dtype], mode="r", shape=(rows, self.dimensions),
+            )
+        else:
+            self._ids = np.empty(0, dtype=np.int64)
+            self._vectors = np.empty((0, self.dimensions or 0), dtype=DTYPES[self.dtype])
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Article id of every row, read-only"""
+        return self._ids
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The raw stored matrix, read-only. Use get() for float32 vectors."""
+        return self._vectors
+
+    def rows(self, article_ids: Sequence[int]) -> np.ndarray:
+        """
+        Returns:
+            The row of each article id, or -1 for ids that aren't stored
+        """
+        article_ids = np.asarray(article_ids, dtype=np.int64)
+        if not len(self._ids):
+            return np.full(len(article_ids), -1, dtype=np.int64)
+
+        if self._sorted_order is None:
+            self._sorted_order = np.argsort(self._ids, kind="stable")
+            self._sorted_ids = self._ids[self._sorted_order]
+        sorted_ids = self._sorted_ids
+
+        positions = np.searchsorted(sorted_ids, article_ids).clip(max=len(sorted_ids) - 1)
+        found = sorted_ids[positions] == article_ids
+        return np.where(found, self._sorted_order[positions], -1)
+
+    def contains(self, article_ids: Sequence[int]) -> np.ndarray:
+        return self.rows(article_ids) >= 0
+
+    def decode(self, stored: np.ndarray) -> np.ndarray:
+        if self.dtype == "int8":
+            return stored.astype(np.float32) / INT8_SCALE
+        return stored.astype(np.float32)
+
+    def get(self, article_ids: Sequence[int]) -> np.ndarray:
+        """
+        Returns:
+            float32 vectors of the given articles, row for row
+
+        Raises:
+            KeyError: if any of the articles isn't stored
+        """
+        rows = self.rows(article_ids)
+        if (rows < 0).any():
+            missing = np.asarray(article_ids)[rows < 0]
+            raise KeyError(f"No embeddings for articles {missing[:10].tolist()}")
+        return self.decode(self._vectors[rows])
+
+    def add(self, article_ids: Sequence[int], vectors: np.ndarray) -> int:
+        """
+        Append vectors for articles that aren't stored yet; ids already present are skipped.
+
+        Returns:
+            The number of rows appended
+        """
+        article_ids = np.asarray(article_ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(article_ids):
+            return 0
+
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            self._write_meta({"model": self.model_name, "dtype": self.dtype, "dimensions": self.dimensions})
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions}-dimensional vectors, got {vectors.shape[1]}")
+
+        _, first_occurrence = np.unique(article_ids, return_index=True)
+        new = np.zeros(len(article_ids), dtype=bool)
+        new[first_occurrence] = True
+        new &= ~self.contains(article_ids)
+        if not new.any():
+            return 0
+
+        if self.dtype == "int8":
+            stored = np.round(vectors[new] * INT8_SCALE).clip(-127, 127).astype(np.int8)
+        else:
+            stored = vectors[new].astype(np.float16)
+
+        # drop anything a crashed writer left past the last complete row
+        row_bytes = self.dimensions * np.dtype(DTYPES[self.dtype]).itemsize
+        os.truncate(self._path(_VECTORS_FILE), len(self) * row_bytes)
+        os.truncate(self._path(_IDS_FILE), len(self) * 8)
+
+        with open(self._path(_VECTORS_FILE), "ab") as vectors_file:
+            vectors_file.write(stored.tobytes())
+        with open(self._path(_IDS_FILE), "ab") as ids_file:
+            ids_file.write(article_ids[new].tobytes())
+
+        self.refresh()
+        return int(new.sum())
@@ -0,0 +1,279 @@
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, exists
+
+import config
+from db.bulk import chunked, insert_ignore
+from db.models import Article, StoryCluster, Topic, article_topic
+from embeddings.store import EmbeddingStore
+
+logger = logging.getLogger(__name__)
+
+TOPIC_NAME_TERMS = 3
+
+
+@dataclass
+class ClusteringResult:
+    full: bool
+    clusters: int
+    assigned: int
+
+
+def window_embeddings(session, store: EmbeddingStore, since: datetime.datetime) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns:
+        Ids and float32 vectors of the articles created since the given time that are in the store
+    """
+    article_ids = np.fromiter(
+        (article_id for (article_id,) in session.query(Article.id).filter(Article.created >= since).order_by(Article.id)),
+        dtype=np.int64,
+    )
+    rows = store.rows(article_ids)
+    if (rows < 0).any():
+        logger.info(f"{int((rows < 0).sum())} recent articles have no embedding yet and are left out")
+    return article_ids[rows >= 0], store.decode(store.vectors[rows[rows >= 0]])
+
+
+def cluster_labels(vectors: np.ndarray, min_cluster_size: int, umap_dimensions: Optional[int], umap_neighbors: int) -> np.ndarray:
+    """
+    Reduce the vectors with UMAP, then cluster them with HDBSCAN.
+
+    Args:
+        vectors: L2-normalised embeddings
+        min_cluster_size: Smallest group of articles that counts as a story
+        umap_dimensions: Target dimensions. None clusters the raw vectors.
+        umap_neighbors: UMAP neighbourhood size
+
+    Returns:
+        The cluster label of every vector, -1 for noise
+    """
+    # both are slow to import, and only needed for full clustering runs
+    import hdbscan
+
+    reduced = vectors
+    if umap_dimensions and len(vectors) > umap_neighbors + 1:
+        import umap
+
+        reduced = umap.UMAP(
+            n_components=umap_dimensions,
+            n_neighbors=umap_neighbors,
+            metric="cosine",
+            min_dist=0.0,
+        ).fit_transform(vectors)
+
+    return hdbscan.HDBSCAN(min_cluster_size=min_cluster_size).fit_predict(reduced)
+
+
+def name_clusters(titles: List[List[str]]) -> List[str]:
+    """
+    Name each cluster after the title terms that set it apart from the others (class-based TF-IDF)
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    documents = [" ".join(title or "" for title in cluster_titles) for cluster_titles in titles]
+    try:
+        vectorizer = TfidfVectorizer(stop_words="english", token_pattern=r"(?u)\b[a-zA-Z][a-zA-Z]+\b")
+        weights = vectorizer.fit_transform(documents).toarray()
+    except ValueError:  # nothing but stop words
+        return ["untitled story"] * len(titles)
+
+    terms = vectorizer.get_feature_names_out()
+    names = []
+    for row in weights:
+        top = [terms[i] for i in np.argsort(-row)[:TOPIC_NAME_TERMS] if row[i] > 0]
+        names.append(", ".join(top) or "untitled story")
+    return names
+
+
+def _normalise(vector: np.ndarray) -> np.ndarray:
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _centroid(cluster: StoryCluster) -> np.ndarray:
+    return np.frombuffer(cluster.centroid, dtype=np.float32)
+
+
+def full_recluster(
+        session,
+        article_ids: np.ndarray,
+        vectors: np.ndarray,
+        now: datetime.datetime,
+        min_cluster_size: int,
+        umap_dimensions: Optional[int],
+        umap_neighbors: int,
+        match_similarity: float,
+        assign_min_similarity: float,
+) -> ClusteringResult:
+    """
+    Cluster the whole window from scratch and reconcile the result with the stored clusters.
+
+    A new cluster whose centroid is close enough to an active one takes over that cluster and
+    its Topic, so stories keep their identity across runs. Stored clusters that are matched by
+    nothing are deactivated. The window's links to story topics are rewritten.
+    """
+    labels = cluster_labels(vectors, min_cluster_size, umap_dimensions, umap_neighbors)
+    cluster_numbers = [label for label in np.unique(labels) if label >= 0]
+
+    previous = session.query(StoryCluster).filter(StoryCluster.active.is_(True)).all()
+
+    members = [article_ids[labels == label] for label in cluster_numbers]
+    centroids = [_normalise(vectors[labels == label].mean(axis=0)) for label in cluster_numbers]
+    titles_by_id = dict(
+        session.query(Article.id, Article.title).filter(Article.id.in_(article_ids[labels >= 0].tolist()))
+    ) if cluster_numbers else {}
+    names = name_clusters([[titles_by_id.get(int(i)) for i in ids] for ids in members])
+
+    # greedily pair new clusters with stored ones, most similar first
+    matches = {}
+    if len(previous) and cluster_numbers:
+        similarities = np.array(centroids) @ np.array([_centroid(c) for c in previous]).T
+        taken = set()
+        for new_index, old_index in zip(*np.unravel_index(np.argsort(-similarities, axis=None), similarities.shape)):
+            if similarities[new_index, old_index] < match_similarity:
+                break
+            if new_index not in matches and old_index not in taken:
+                matches[new_index] = previous[old_index]
+                taken.add(old_index)
+
+    matched = set(id(cluster) for cluster in matches.values())
+    for cluster in previous:
+        if id(cluster) not in matched:
+            cluster.active = False
+
+    clusters = []
+    for index, (ids, centroid, name) in enumerate(zip(members, centroids, names)):
+        member_similarities = vectors[np.isin(article_ids, ids)] @ centroid
+        assign_similarity = max(assign_min_similarity, float(np.percentile(member_similarities, 10)))
+
+        cluster = matches.get(index)
+        if cluster is None:
+            cluster = StoryCluster(topic=Topic(name=name))
+            session.add(cluster)
+        cluster.topic.name = name
+        cluster.centroid = centroid.astype(np.float32).tobytes()
+        cluster.size = len(ids)
+        cluster.assign_similarity = assign_similarity
+        cluster.active = True
+        cluster.clustered_at = now
+        clusters.append(cluster)
+    session.flush()
+
+    story_topic_ids = [topic_id for (topic_id,) in session.query(StoryCluster.topic_id)]
+    for chunk in chunked(article_ids.tolist()):
+        session.execute(
+            delete(article_topic)
+            .where(article_topic.c.article_id.in_(chunk))
+            .where(article_topic.c.topic_id.in_(story_topic_ids))
+        )
+    insert_ignore(session, article_topic, [
+        {"article_id": int(article_id), "topic_id": cluster.topic_id}
+        for cluster, ids in zip(clusters, members)
+        for article_id in ids
+    ])
+    session.commit()
+
+    return ClusteringResult(full=True, clusters=len(clusters), assigned=int((labels >= 0).sum()))
+
+
+def assign_to_clusters(session, article_ids: np.ndarray, vectors: np.ndarray) -> ClusteringResult:
+    """
+    Attach window articles that aren't in any active story yet to the closest active cluster,
+    if they are similar enough to it, and fold them into its centroid.
+    """
+    clusters = session.query(StoryCluster).filter(StoryCluster.active.is_(True)).order_by(StoryCluster.id).all()
+    if not clusters or not len(article_ids):
+        return ClusteringResult(full=False, clusters=len(clusters), assigned=0)
+
+    topic_ids = [cluster.topic_id for cluster in clusters]
+    linked_ids = set()
+    for chunk in chunked(article_ids.tolist()):
+        linked_ids.update(
+            article_id for (article_id,) in
+            session.query(article_topic.c.article_id)
+            .filter(article_topic.c.article_id.in_(chunk), article_topic.c.topic_id.in_(topic_ids))
+        )
+    unlinked = ~np.isin(article_ids, list(linked_ids))
+    article_ids, vectors = article_ids[unlinked], vectors[unlinked]
+    if not len(article_ids):
+        return ClusteringResult(full=False, clusters=len(clusters), assigned=0)
+
+    similarities = vectors @ np.array([_centroid(c) for c in clusters]).T
+    best = similarities.argmax(axis=1)
+    thresholds = np.array([c.assign_similarity for c in clusters])
+    accepted = similarities[np.arange(len(best)), best] >= thresholds[best]
+
+    associations = []
+    for index, cluster in enumerate(clusters):
+        joining = accepted & (best == index)
+        if not joining.any():
+            continue
+        total = _centroid(cluster) * cluster.size + vectors[joining].sum(axis=0)
+        cluster.centroid = _normalise(total).astype(np.float32).tobytes()
+        cluster.size += int(joining.sum())
+        associations.extend({"article_id": int(i), "topic_id": cluster.topic_id} for i in article_ids[joining])
+
+    insert_ignore(session, article_topic, associations)
+    session.commit()
+    return ClusteringResult(full=False, clusters=len(clusters), assigned=len(associations))
+
+
+def cluster_recent_articles(
+        session,
+        store: EmbeddingStore,
+        now: datetime.datetime = None,
+        window_hours: int = None,
+        full_interval: int = None,
+        force_full: bool = False,
+) -> ClusteringResult:
+    """
+    Group the embeddings of the last window_hours of articles into stories.
+
+    New articles are assigned to the existing clusters on every run; the whole window is
+    re-clustered only when the last full run is older than full_interval seconds (or there
+    is none), which keeps the frequent runs down to a matrix product.
+
+    Args:
+        session: Database session
+        store: Article embeddings; articles missing from it are left out
+        now: Current time, defaults to utcnow
+        window_hours: Defaults to CLUSTER_WINDOW_HOURS
+        full_interval: Defaults to CLUSTER_FULL_INTERVAL
+        force_full: Re-cluster the whole window regardless of when it was last done
+    """
+    settings = config.settings
+    now = now or datetime.datetime.utcnow()
+    window_hours = window_hours or settings.CLUSTER_WINDOW_HOURS
+    full_interval = settings.CLUSTER_FULL_INTERVAL if full_interval is None else full_interval
+
+    started = time.perf_counter()
+    article_ids, vectors = window_embeddings(session, store, now - datetime.timedelta(hours=window_hours))
+
+    last_full = session.query(StoryCluster.clustered_at).order_by(StoryCluster.clustered_at.desc()).limit(1).scalar()
+    has_active = session.query(exists().where(StoryCluster.active.is_(True))).scalar()
+    due = force_full or not has_active or last_full is None or (now - last_full).total_seconds() >= full_interval
+
+    if due and len(article_ids) >= 2 * settings.CLUSTER_MIN_SIZE:
+        result = full_recluster(
+            session,
+            article_ids,
+            vectors,
+            now,
+            min_cluster_size=settings.CLUSTER_MIN_SIZE,
+            umap_dimensions=settings.CLUSTER_UMAP_DIMENSIONS,
+            umap_neighbors=settings.CLUSTER_UMAP_NEIGHBORS,
+            match_similarity=settings.CLUSTER_MATCH_SIMILARITY,
+            assign_min_similarity=settings.CLUSTER_ASSIGN_MIN_SIMILARITY,
+        )
+    else:
+        result = assign_to_clusters(session, article_ids, vectors)
+
+    logger.info(
+        f"{'Full' if result.full else 'Incremental'} clustering of {len(article_ids)} articles: "
+        f"{result.assigned} assigned to {result.clusters} stories in {time.perf_counter() - started:.1f}s"
+    )
+    return result
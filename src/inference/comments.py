@@ -0,0 +1,136 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import update
+
+import config
+from db.connection import get_session
+from db.models import Comment, Topic
+from embeddings.main import open_embedding_store
+from embeddings.store import EmbeddingStore
+from inference.encoder import Encoder, SentenceTransformerEncoder
+from inference.main import topic_centroids
+from inference.sentiment import SentimentClassifier, TransformersSentimentClassifier
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CommentTaggingResult:
+    tagged: int
+    seconds: float
+
+    @property
+    def comments_per_second(self) -> float:
+        return self.tagged / self.seconds if self.seconds else 0.0
+
+
+def comment_topics(encoder: Encoder, bodies, topic_names, centroids: np.ndarray, threshold: float, max_topics: int):
+    """
+    Names of the topics each comment is similar enough to, most similar first
+    """
+    if not topic_names:
+        return [[] for _ in bodies]
+
+    similarities = encoder.encode(list(bodies)) @ centroids.T
+    ranked = np.argsort(-similarities, axis=1)[:, :max_topics]
+    return [
+        [topic_names[c] for c in columns if similarities[row, c] >= threshold]
+        for row, columns in enumerate(ranked)
+    ]
+
+
+def tag_comments(
+        session,
+        classifier: SentimentClassifier,
+        encoder: Optional[Encoder] = None,
+        chunk_size: int = None,
+        limit: int = None,
+        store: Optional[EmbeddingStore] = None,
+) -> CommentTaggingResult:
+    """
+    Fill in sentiment (and topics, given an encoder) for comments that don't have it yet.
+
+    Comments are read in id order, one chunk at a time, classified, and written back with a
+    bulk UPDATE and a commit per chunk. Sentiment is what marks a comment as done, so an
+    interrupted run loses at most the chunk in progress and the next run carries on from there.
+
+    Args:
+        session: Database session
+        classifier: Sentiment model
+        encoder: Embedding model for topic tagging. None leaves topics untouched.
+        chunk_size: Comments per round-trip and commit
+        limit: Maximum number of comments to tag in this run
+        store: Article embeddings of the encoder's model, for the topic centroids
+
+    Returns:
+        How many comments were tagged, and how long it took
+    """
+    settings = config.settings
+    chunk_size = chunk_size or settings.COMMENT_CHUNK_SIZE
+
+    if encoder is not None:
+        topic_ids, centroids = topic_centroids(session, encoder, store)
+        names = dict(session.query(Topic.id, Topic.name))
+        topic_names = [names[topic_id] for topic_id in topic_ids]
+
+    started = time.perf_counter()
+    tagged = 0
+    last_id = 0
+    while limit is None or tagged < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - tagged)
+        chunk = (
+            session.query(Comment.id, Comment.body)
+            .filter(Comment.sentiment.is_(None), Comment.id > last_id)
+            .order_by(Comment.id)
+            .limit(size)
+            .all()
+        )
+        if not chunk:
+            break
+
+        bodies = [body for _, body in chunk]
+        sentiments = classifier.classify(bodies)
+        rows = [{"id": comment_id, "sentiment": sentiment} for (comment_id, _), sentiment in zip(chunk, sentiments)]
+        if encoder is not None:
+            topics = comment_topics(
+                encoder, bodies, topic_names, centroids, settings.COMMENT_TOPIC_THRESHOLD, settings.TOPIC_MAX_PER_ARTICLE,
+            )
+            for row, comment_topic_names in zip(rows, topics):
+                row["topics"] = comment_topic_names
+
+        session.execute(update(Comment), rows)
+        session.commit()
+
+        tagged += len(chunk)
+        last_id = chunk[-1][0]
+        elapsed = time.perf_counter() - started
+        logger.info(f"Tagged {tagged} comments ({tagged / elapsed:.0f} comments/s)")
+
+    result = CommentTaggingResult(tagged=tagged, seconds=time.perf_counter() - started)
+    if tagged:
+        logger.info(f"Tagged {result.tagged} comments in {result.seconds:.1f}s ({result.comments_per_second:.0f} comments/s)")
+    return result
+
+
+if __name__ == "__main__":
+    config.setup_logging()
+
+    settings = config.settings
+    classifier = TransformersSentimentClassifier(
+        settings.COMMENT_SENTIMENT_MODEL,
+        batch_size=settings.COMMENT_BATCH_SIZE,
+        max_tokens=settings.COMMENT_MAX_TOKENS,
+        threads=settings.EMBEDDING_THREADS,
+    )
+    encoder = SentenceTransformerEncoder(
+        settings.EMBEDDING_MODEL,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        threads=settings.EMBEDDING_THREADS,
+    )
+
+    with get_session() as session:
+        tag_comments(session, classifier, encoder, store=open_embedding_store(encoder.model_name))
@@ -0,0 +1,44 @@
+from typing import Protocol, List
+
+import numpy as np
+
+
+class Encoder(Protocol):
+    model_name: str
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts as L2-normalised float32 rows, one per text
+        """
+        ...
+
+
+class SentenceTransformerEncoder(Encoder):
+    """
+    CPU sentence-transformers model, encoding in large batches.
+
+    Args:
+        model_name: Hugging Face model id
+        batch_size: Texts per forward pass
+        threads: torch intra-op threads. None leaves torch's default.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 256, threads: int = None):
+        # imported here so that the rest of the pipeline doesn't need torch installed
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32)
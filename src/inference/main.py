@@ -1,28 +1,237 @@
-from db.models import Article, Topic
+import logging
+import time
+from typing import Optional
 
+import numpy as np
+from sqlalchemy import exists, or_
 
-def infer_topics(session):
+import config
+from db.bulk import insert_ignore
+from db.models import Article, Topic, StoryCluster, article_topic
+from embeddings.main import article_document
+from embeddings.store import EmbeddingStore
+from inference.encoder import Encoder
+
+logger = logging.getLogger(__name__)
+
+TOPIC_PROTOTYPE = "News about {name}"  # stands in for topics without any embedded article
+CENTROID_CHUNK_ROWS = 10_000  # stored vectors decoded at a time when averaging them
+
+# story topics are managed by inference/clustering.py
+_not_a_story = ~exists().where(StoryCluster.topic_id == Topic.id)
+
+# articles with a topic other than a story; clustering may link an article to its story first
+_tagged = exists().where(
+    article_topic.c.article_id == Article.id,
+    ~exists().where(StoryCluster.topic_id == article_topic.c.topic_id),
+)
+
+
+def infer_topics(session, encoder: Optional[Encoder] = None, store: Optional[EmbeddingStore] = None):
     """
-    Assign a Topic entity to each Article based on source_topic
+    Assign Topic entities to every Article that doesn't have any yet, not counting the story
+    topics of inference/clustering.py.
+
+    Without an encoder the topic is copied from the feed's source_topic. With one, articles
+    are embedded and matched against topic centroids (see infer_topics_by_embedding).
+
+    Args:
+        session: Database session
+        encoder: Embedding model to use instead of source_topic
+        store: Embeddings to reuse, and to keep the new ones in
     """
-    articles = session.query(Article).all()
+    if encoder is not None:
+        return infer_topics_by_embedding(session, encoder, store=store)
 
-    for article in articles:
-        if not article.source_topic:
-            continue
+    topic_ids = {name: topic_id for topic_id, name in session.query(Topic.id, Topic.name).filter(_not_a_story)}
 
-        topic = (
-            session.query(Topic)
-            .filter_by(name=article.source_topic)
-            .first()
+    untagged_articles = (
+        session.query(Article.id, Article.source_topic)
+        .filter(
+            Article.source_topic.isnot(None),
+            Article.source_topic != "",
+            ~_tagged,
         )
+        .all()
+    )
 
-        if not topic:
-            topic = Topic(name=article.source_topic)
+    associations = []
+    for article_id, source_topic in untagged_articles:
+        if source_topic not in topic_ids:
+            topic = Topic(name=source_topic)
             session.add(topic)
             session.flush()  # ensures topic.id exists
+            topic_ids[source_topic] = topic.id
 
-        if topic not in article.topics:
-            article.topics.append(topic)
+        associations.append({"article_id": article_id, "topic_id": topic_ids[source_topic]})
 
+    insert_ignore(session, article_topic, associations)
     session.commit()
+
+
+def topic_centroids(session, encoder: Encoder, store: Optional[EmbeddingStore] = None):
+    """
+    The centroid of a topic is the mean stored embedding of the articles already linked to it.
+    Topics without any such article, and all topics when there is no store, are embedded from
+    TOPIC_PROTOTYPE and their name instead.
+
+    Args:
+        session: Database session
+        encoder: Embedding model, for the topics without stored article embeddings
+        store: Article embeddings produced by the same model
+
+    Returns:
+        The topic ids and an L2-normalised centroid per topic, row for row
+    """
+    topics = (
+        session.query(Topic.id, Topic.name)
+        .filter(Topic.name.isnot(None), _not_a_story)
+        .order_by(Topic.id)
+        .all()
+    )
+    if not topics:
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    topic_ids = np.array([topic_id for topic_id, _ in topics], dtype=np.int64)
+    counts = np.zeros(len(topics), dtype=np.int64)
+    sums = None
+    if store is not None and len(store):
+        links = np.array(
+            session.query(article_topic.c.topic_id, article_topic.c.article_id)
+            .filter(article_topic.c.topic_id.in_(topic_ids.tolist()))
+            .all(),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        rows = store.rows(links[:, 1])
+        found = rows >= 0
+        # topic_ids is sorted, so searchsorted maps each link to its topic's row
+        columns, rows = np.searchsorted(topic_ids, links[found, 0]), rows[found]
+        sums = np.zeros((len(topics), store.dimensions), dtype=np.float32)
+        for start in range(0, len(rows), CENTROID_CHUNK_ROWS):
+            chunk = slice(start, start + CENTROID_CHUNK_ROWS)
+            np.add.at(sums, columns[chunk], store.decode(store.vectors[rows[chunk]]))
+        counts = np.bincount(columns, minlength=len(topics))
+
+    averaged = counts > 0
+    prompted = np.flatnonzero(~averaged)
+    encoded = encoder.encode([TOPIC_PROTOTYPE.format(name=topics[i][1]) for i in prompted]) if len(prompted) else None
+    centroids = np.empty((len(topics), store.dimensions if sums is not None else encoded.shape[1]), dtype=np.float32)
+    if averaged.any():
+        centroids[averaged] = sums[averaged] / counts[averaged, None]
+    if encoded is not None:
+        centroids[prompted] = encoded
+    logger.debug(f"{averaged.sum()}/{len(topics)} topic centroids averaged from stored article embeddings")
+
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True).clip(min=1e-12)
+    return topic_ids.tolist(), centroids
+
+
+def assign_topics(similarities: np.ndarray, threshold: float, max_topics: int):
+    """
+    Pick topic columns for each row of an (articles x topics) similarity matrix.
+
+    The best topic is always kept, so every processed article leaves the work queue; up to
+    max_topics - 1 more are added when they clear the threshold.
+    """
+    ranked = np.argsort(-similarities, axis=1)[:, :max_topics]
+    for row, columns in enumerate(ranked):
+        yield [columns[0]] + [c for c in columns[1:] if similarities[row, c] >= threshold]
+
+
+def infer_topics_by_embedding(
+        session,
+        encoder: Encoder,
+        store: Optional[EmbeddingStore] = None,
+        batch_size: int = None,
+        threshold: float = None,
+        max_topics: int = None,
+) -> int:
+    """
+    Embed title + text of the untagged articles and link each one to its most similar topics.
+
+    Articles that already have a topic are never re-encoded, nor are those whose vector is in
+    the store; vectors of articles with text are added to it. Articles still waiting for
+    content extraction are left for a later run, since their tags would otherwise come from the
+    title alone and never be revisited; those extraction has given up on are tagged by title.
+    Work is streamed and committed one batch at a time, so an interrupted run picks up where it
+    stopped.
+
+    Args:
+        session: Database session
+        encoder: Embedding model
+        store: Embeddings to reuse, and to keep the new ones in
+        batch_size: Articles encoded and committed together
+        threshold: Minimum cosine similarity for topics after the best one
+        max_topics: Upper bound on topics per article
+
+    Returns:
+        The number of articles tagged
+    """
+    batch_size = batch_size or config.settings.EMBEDDING_BATCH_SIZE
+    threshold = config.settings.TOPIC_SIMILARITY_THRESHOLD if threshold is None else threshold
+    max_topics = max_topics or config.settings.TOPIC_MAX_PER_ARTICLE
+
+    topic_ids, centroids = topic_centroids(session, encoder, store)
+    if not topic_ids:
+        logger.warning("No topics to assign, skipping embedding inference")
+        return 0
+
+    # ids first, so that the inserts below don't disturb the cursor we're reading from
+    untagged_ids = [
+        article_id for (article_id,) in
+        session.query(Article.id)
+        .filter(
+            ~_tagged,
+            or_(Article.text.isnot(None), Article.fetch_failed_permanently.is_(True), Article.url.is_(None)),
+        )
+        .order_by(Article.id)
+    ]
+
+    started = time.perf_counter()
+    tagged = 0
+    for start in range(0, len(untagged_ids), batch_size):
+        batch_ids = untagged_ids[start:start + batch_size]
+        rows = (
+            session.query(Article.id, Article.title, Article.text)
+            .filter(Article.id.in_(batch_ids))
+            .all()
+        )
+        embeddings = _article_embeddings(rows, encoder, store)
+        similarities = embeddings @ centroids.T
+
+        associations = [
+            {"article_id": article_id, "topic_id": topic_ids[column]}
+            for (article_id, _, _), columns in zip(rows, assign_topics(similarities, threshold, max_topics))
+            for column in columns
+        ]
+        insert_ignore(session, article_topic, associations)
+        session.commit()
+        tagged += len(rows)
+
+    elapsed = time.perf_counter() - started
+    if tagged:
+        logger.info(f"Tagged {tagged} articles by embedding in {elapsed:.1f}s ({tagged / elapsed:.0f} articles/s)")
+    return tagged
+
+
+def _article_embeddings(rows, encoder: Encoder, store: Optional[EmbeddingStore]) -> np.ndarray:
+    """
+    Vectors for (id, title, text) rows, read from the store where possible and encoded otherwise
+    """
+    if store is None:
+        return encoder.encode([article_document(title, text) for _, title, text in rows])
+
+    article_ids = [article_id for article_id, _, _ in rows]
+    stored_rows = store.rows(article_ids)
+    stored = stored_rows >= 0
+    to_encode = np.flatnonzero(~stored)
+    encoded = encoder.encode([article_document(rows[i][1], rows[i][2]) for i in to_encode]) if len(to_encode) else None
+
+    embeddings = np.empty((len(rows), store.dimensions or encoded.shape[1]), dtype=np.float32)
+    if stored.any():
+        embeddings[stored] = store.decode(store.vectors[stored_rows[stored]])
+    if encoded is not None:
+        embeddings[to_encode] = encoded
+        with_text = [i for i in to_encode if rows[i][2] is not None]
+        store.add([article_ids[i] for i in with_text], embeddings[with_text])
+    return embeddings
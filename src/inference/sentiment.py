@@ -0,0 +1,63 @@
+from typing import Protocol, List, Dict, Sequence
+
+
+class SentimentClassifier(Protocol):
+    model_name: str
+
+    def classify(self, texts: List[str]) -> List[Dict]:
+        """
+        One {"label": ..., "score": ...} per text, in input order
+        """
+        ...
+
+
+def length_sorted_batches(lengths: Sequence[int], batch_size: int) -> List[List[int]]:
+    """
+    Group text positions into batches of similar length, so that padding each batch to its
+    longest member wastes as little compute as possible.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+class TransformersSentimentClassifier(SentimentClassifier):
+    """
+    Hugging Face sequence classification model on CPU.
+
+    Texts are tokenized once, sorted by token count and run in padded batches, so a batch
+    of short comments isn't padded to the length of the longest comment in the chunk.
+
+    Args:
+        model_name: Hugging Face model id
+        batch_size: Texts per forward pass
+        max_tokens: Longer texts are truncated
+        threads: torch intra-op threads. None leaves torch's default.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 64, max_tokens: int = 256, threads: int = None):
+        # imported here so that the rest of the pipeline doesn't need torch installed
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        self.labels = {i: label.lower() for i, label in self.model.config.id2label.items()}
+
+    def classify(self, texts: List[str]) -> List[Dict]:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_tokens)["input_ids"]
+        results: List[Dict] = [None] * len(texts)
+
+        with self.torch.inference_mode():
+            for batch in length_sorted_batches([len(ids) for ids in encoded], self.batch_size):
+                inputs = self.tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+                probabilities = self.model(**inputs).logits.softmax(dim=-1)
+                scores, labels = probabilities.max(dim=-1)
+                for i, label, score in zip(batch, labels.tolist(), scores.tolist()):
+                    results[i] = {"label": self.labels[label], "score": round(score, 4)}
+        return results
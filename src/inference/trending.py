@@ -0,0 +1,222 @@
+import datetime
+import logging
+import time
+from typing import List, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, func
+
+import config
+from db.bulk import chunked, insert_ignore, upsert
+from db.connection import get_session
+from db.models import Article, TermBaseline, TopicTrendHistory, TrendingTerm, article_topic
+
+logger = logging.getLogger(__name__)
+
+
+def day_documents(session, day: datetime.date) -> Tuple[List[int], List[str], List[Tuple[int, int]]]:
+    """
+    Returns:
+        Ids and title + text of the day's articles, and their (article id, topic id) links
+    """
+    start = datetime.datetime.combine(day, datetime.time())
+    end = start + datetime.timedelta(days=1)
+    window = (Article.created >= start, Article.created < end)
+
+    rows = session.query(Article.id, Article.title, Article.text).filter(*window).order_by(Article.id).all()
+    links = (
+        session.query(article_topic.c.article_id, article_topic.c.topic_id)
+        .join(Article, Article.id == article_topic.c.article_id)
+        .filter(*window)
+        .all()
+    )
+    return [row[0] for row in rows], [f"{title or ''}\n{text or ''}" for _, title, text in rows], links
+
+
+def decay_baseline(mean: np.ndarray, variance: np.ndarray, idle_days: np.ndarray, smoothing: float):
+    """
+    Apply, in place, the EWMA updates of the days on which a term didn't appear at all (weight 0).
+    Baselines are only written on days a term is used, so this catches them up lazily.
+    """
+    for step in range(1, int(idle_days.max(initial=0)) + 1):
+        idle = idle_days >= step
+        difference = -mean[idle]
+        increment = smoothing * difference
+        mean[idle] += increment
+        variance[idle] = (1 - smoothing) * (variance[idle] + difference * increment)
+
+
+def update_baseline(mean: np.ndarray, variance: np.ndarray, weight: np.ndarray, smoothing: float):
+    """
+    Exponentially weighted mean and variance, updated in place with one day's weights
+    """
+    difference = weight - mean
+    increment = smoothing * difference
+    mean += increment
+    variance[:] = (1 - smoothing) * (variance + difference * increment)
+
+
+def score_day(session, day: datetime.date, top_k: int = None) -> int:
+    """
+    Find the terms that surged within each topic on the given day.
+
+    The day's articles are vectorised once into a sparse TF-IDF matrix. A sparse product with
+    the topic membership matrix gives every topic's mean weight per term, which is compared,
+    term by term and in bulk, with the term's rolling baseline for that topic:
+    score = (weight - mean) / sqrt(variance + TREND_VARIANCE_FLOOR). The top_k terms per topic
+    used by at least TREND_MIN_ARTICLES articles are stored as TrendingTerm rows, and only the
+    baselines of the terms used that day are updated. Topics scored on fewer than
+    TREND_MIN_HISTORY_DAYS earlier days, such as new topics or all of them on the first backfill
+    day, only get their baselines updated: against baselines that start at zero, nearly every
+    term of theirs would look like a surge.
+
+    Days have to be scored in order; a day at or before the latest baseline update is skipped.
+
+    Returns:
+        The number of trending terms stored
+    """
+    settings = config.settings
+    top_k = top_k or settings.TREND_TOP_K
+    smoothing = settings.TREND_BASELINE_SMOOTHING
+
+    last_day = session.query(func.max(TermBaseline.updated_date)).scalar()
+    if last_day is not None and day <= last_day:
+        logger.info(f"Trending terms for {day} are already scored, skipping")
+        return 0
+
+    started = time.perf_counter()
+    article_ids, documents, links = day_documents(session, day)
+    if not links:
+        return 0
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(
+        stop_words="english",
+        token_pattern=r"(?u)\b[a-zA-Z][a-zA-Z]{1,39}\b",  # keeps bigrams within TrendingTerm.term
+        ngram_range=(1, 2),
+        min_df=min(2, len(documents)),
+        sublinear_tf=True,
+        dtype=np.float32,
+    )
+    try:
+        tfidf = vectorizer.fit_transform(documents)
+    except ValueError:  # no usable terms
+        return 0
+    terms = vectorizer.get_feature_names_out()
+
+    topic_ids = sorted({topic_id for _, topic_id in links})
+    topic_index = {topic_id: i for i, topic_id in enumerate(topic_ids)}
+    document_index = {article_id: i for i, article_id in enumerate(article_ids)}
+    membership = sparse.csr_matrix(
+        (np.ones(len(links), dtype=np.float32),
+         ([topic_index[t] for _, t in links], [document_index[a] for a, _ in links])),
+        shape=(len(topic_ids), len(article_ids)),
+    )
+    topic_articles = np.asarray(membership.sum(axis=1)).ravel()
+
+    # topics x terms: summed weight and number of articles using the term
+    weights = (membership @ tfidf).tocoo()
+    usage = (membership @ (tfidf > 0).astype(np.float32)).tocsr()
+    rows, columns = weights.row, weights.col
+    weight = weights.data / topic_articles[rows]
+    articles = np.asarray(usage[rows, columns]).ravel().astype(int)
+
+    # baselines of the (topic, term) pairs used today
+    pair_terms = terms[columns]
+    baselines = {}
+    for chunk in chunked(sorted(set(pair_terms.tolist()))):
+        for topic_id, term, baseline_mean, baseline_variance, updated_date in (
+                session.query(TermBaseline.topic_id, TermBaseline.term, TermBaseline.mean, TermBaseline.variance,
+                              TermBaseline.updated_date)
+                .filter(TermBaseline.topic_id.in_(topic_ids), TermBaseline.term.in_(chunk))
+        ):
+            baselines[(topic_id, term)] = (baseline_mean, baseline_variance, (day - updated_date).days - 1)
+    known = [baselines.get((topic_ids[r], term), (0.0, 0.0, 0)) for r, term in zip(rows, pair_terms)]
+    mean, variance, idle_days = (np.array(values) for values in zip(*known))
+    mean, variance = mean.astype(float), variance.astype(float)
+
+    decay_baseline(mean, variance, idle_days, smoothing)
+    scores = (weight - mean) / np.sqrt(variance + settings.TREND_VARIANCE_FLOOR)
+    update_baseline(mean, variance, weight, smoothing)
+
+    history = dict(
+        session.query(TopicTrendHistory.topic_id, TopicTrendHistory.scored_days)
+        .filter(TopicTrendHistory.topic_id.in_(topic_ids))
+    )
+    established = np.array([history.get(topic_id, 0) >= settings.TREND_MIN_HISTORY_DAYS for topic_id in topic_ids])
+
+    trending = []
+    eligible = (articles >= settings.TREND_MIN_ARTICLES) & (scores >= settings.TREND_MIN_SCORE) & established[rows]
+    for topic_row, topic_id in enumerate(topic_ids):
+        candidates = np.flatnonzero(eligible & (rows == topic_row))
+        for i in candidates[np.argsort(-scores[candidates])][:top_k]:
+            trending.append({
+                "date": day,
+                "topic_id": topic_id,
+                "term": pair_terms[i],
+                "score": float(scores[i]),
+                "weight": float(weight[i]),
+                "articles": int(articles[i]),
+            })
+
+    insert_ignore(session, TrendingTerm, trending)
+    upsert(
+        session,
+        TermBaseline,
+        [
+            {"topic_id": topic_ids[r], "term": term, "mean": float(m), "variance": float(v), "updated_date": day}
+            for r, term, m, v in zip(rows, pair_terms, mean, variance)
+        ],
+        index_elements=["topic_id", "term"],
+        update_columns=["mean", "variance", "updated_date"],
+    )
+    upsert(
+        session,
+        TopicTrendHistory,
+        [{"topic_id": topic_id, "scored_days": history.get(topic_id, 0) + 1} for topic_id in topic_ids],
+        index_elements=["topic_id"],
+        update_columns=["scored_days"],
+    )
+    # a term unused for this long has decayed to nothing
+    session.execute(delete(TermBaseline).where(
+        TermBaseline.updated_date < day - datetime.timedelta(days=settings.TREND_BASELINE_MAX_AGE)
+    ))
+    session.commit()
+
+    logger.info(
+        f"Scored {len(weight)} topic terms from {len(article_ids)} articles of {day}, "
+        f"{len(trending)} trending, in {time.perf_counter() - started:.1f}s"
+    )
+    return len(trending)
+
+
+def score_pending_days(session, until: datetime.date = None) -> int:
+    """
+    Score every complete day since the last one scored, oldest first; on the first run, the
+    last TREND_BACKFILL_DAYS days.
+
+    Args:
+        session: Database session
+        until: Last day to score, defaults to yesterday
+
+    Returns:
+        The number of trending terms stored
+    """
+    until = until or datetime.date.today() - datetime.timedelta(days=1)
+    last_day = session.query(func.max(TermBaseline.updated_date)).scalar()
+    day = last_day + datetime.timedelta(days=1) if last_day else until - datetime.timedelta(days=config.settings.TREND_BACKFILL_DAYS - 1)
+
+    stored = 0
+    while day <= until:
+        stored += score_day(session, day)
+        day += datetime.timedelta(days=1)
+    return stored
+
+
+if __name__ == "__main__":
+    config.setup_logging()
+
+    with get_session() as session:
+        score_pending_days(session)
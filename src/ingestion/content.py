@@ -1,33 +1,399 @@
+import argparse
+import datetime
 import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
 
-from newspaper import Article
+import httpx
+from sqlalchemy import update, or_, false
 
 import config
-from db.models import Article as ArticleDB
+from common.urls import url_hash
+from db.bulk import chunked
+from db.models import Article as ArticleDB, Source, SourceName
+from ingestion.dedup import index_near_duplicates, signature_bytes
+from ingestion.extractors import extract_content
+from ingestion.html_cache import HtmlCache
 
 from db.connection import get_session
 
-config.setup_logging()
-
 logger = logging.getLogger(__name__)
 
-with get_session() as session:
-    articles = session.query(ArticleDB)
-    for article in articles:
+
+# failures that retrying won't fix
+PERMANENT_ERRORS = {"HTTP404", "HTTP410", "InvalidURL", "UnsupportedProtocol"}
+
+
+@dataclass
+class DownloadResult:
+    article_id: int
+    url: str
+    html: Optional[str] = None
+    error: Optional[str] = None
+    error_class: Optional[str] = None
+
+
+@dataclass
+class ExtractionResult:
+    article_id: int
+    text: Optional[str] = None
+    title: Optional[str] = None
+    minhash: Optional[bytes] = None
+    error: Optional[str] = None
+    error_class: Optional[str] = None
+
+
+def error_class_of(e: Exception) -> str:
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"HTTP{e.response.status_code}"
+    return type(e).__name__
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    """
+    Exponential backoff after the `attempts`-th failed attempt
+    """
+    settings = config.settings
+    delay = settings.EXTRACTION_RETRY_BASE_DELAY * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, settings.EXTRACTION_RETRY_MAX_DELAY))
+
+
+def select_articles_to_extract(
+        session,
+        limit: int = None,
+        now: datetime.datetime = None,
+) -> Iterable[Tuple[int, str, str, SourceName, int, Optional[str]]]:
+    """
+    Work queue of articles without text, oldest first, leaving out permanent failures and
+    articles still backing off. Only (id, url, url_hash, source name, fetch attempts, fetch error) is
+    loaded and rows are streamed, so the cost depends on the backlog and not on the size of the table.
+    """
+    now = now or datetime.datetime.utcnow()
+    query = (
+        session.query(
+            ArticleDB.id, ArticleDB.url, ArticleDB.url_hash, Source.name, ArticleDB.fetch_attempts, ArticleDB.fetch_error,
+        )
+        .join(Source, ArticleDB.source_id == Source.id)
+        .filter(
+            ArticleDB.text.is_(None),
+            ArticleDB.fetch_failed_permanently == false(),
+            ArticleDB.url.isnot(None),
+            or_(ArticleDB.fetch_next_attempt_at.is_(None), ArticleDB.fetch_next_attempt_at <= now),
+        )
+        .order_by(ArticleDB.created)
+        .yield_per(config.settings.EXTRACTION_QUERY_CHUNK_SIZE)
+    )
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def download_html(
+        client: httpx.Client,
+        article_id: int,
+        url: str,
+        domain_limit: threading.Semaphore,
+        cache: HtmlCache = None,
+        cache_key: str = None,
+) -> DownloadResult:
+    with domain_limit:
         try:
-            url = article.url
+            response = client.get(url)
+            response.raise_for_status()
+        # InvalidURL isn't an HTTPError, but a malformed link must only fail its own article
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            return DownloadResult(article_id=article_id, url=url, error=f"{type(e).__name__}: {e}", error_class=error_class_of(e))
+
+    if cache is not None:
+        cache.put(
+            cache_key, url, response.content, response.status_code, response.headers.get("Content-Type"),
+            encoding=response.encoding,
+        )
+    return DownloadResult(article_id=article_id, url=url, html=response.text)
+
+
+def parse_html(article_id: int, url: str, html: str, source_name: SourceName = None) -> ExtractionResult:
+    """
+    CPU-bound part of the extraction, runs in a worker process
+    """
+    try:
+        content = extract_content(url, html, source_name)
+    except Exception as e:
+        return ExtractionResult(article_id=article_id, error=f"{type(e).__name__}: {e}", error_class=error_class_of(e))
+    if not content.text:
+        # typically a paywall or a page that isn't an article
+        return ExtractionResult(article_id=article_id, error="no text found", error_class="EmptyText")
+    return ExtractionResult(
+        article_id=article_id, text=content.text, title=content.title, minhash=signature_bytes(content.text),
+    )
+
+
+class _ResultWriter:
+    """
+    Collects extracted text and fetch failures and writes them with bulk UPDATEs, one commit per batch.
+    Each batch of texts is also checked for near-duplicates (see ingestion/dedup.py).
+
+    Args:
+        session: Database session
+        commit_batch_size: Number of results written per commit
+        attempts: Previous fetch attempts per article id
+        track_fetches: If False, only text and minhash are written and failures are only logged,
+            leaving the fetch attempts, errors and backoff of the articles as they are
+    """
+
+    def __init__(self, session, commit_batch_size: int, attempts: Dict[int, int] = None, track_fetches: bool = True):
+        self.session = session
+        self.commit_batch_size = commit_batch_size
+        self.attempts = attempts if attempts is not None else {}
+        self.track_fetches = track_fetches
+        self.now = datetime.datetime.utcnow()
+        self.pending_texts = []
+        self.pending_failures = []
+        self.extracted = 0
+        self.failed = 0
+
+    def record(self, result: ExtractionResult):
+        if result.error:
+            logger.warning(f"error when parsing article: {result.article_id}: {result.error}")
+            self.record_failure(result.article_id, result.error_class)
+            return
+        logger.debug(f"processed article {result.article_id}. extracted title: {result.title}")
+        row = {"id": result.article_id, "text": result.text, "minhash": result.minhash}
+        if self.track_fetches:
+            row.update({
+                "fetch_attempts": self.attempts.get(result.article_id, 0) + 1,
+                "fetch_error": None,
+                "fetch_next_attempt_at": None,
+            })
+        self.pending_texts.append(row)
+        self.extracted += 1
+        self._maybe_flush()
+
+    def record_failure(self, article_id: int, error_class: str):
+        self.failed += 1
+        if not self.track_fetches:
+            return
+
+        attempts = self.attempts.get(article_id, 0) + 1
+        permanent = error_class in PERMANENT_ERRORS or attempts >= config.settings.EXTRACTION_MAX_ATTEMPTS
+        self.pending_failures.append({
+            "id": article_id,
+            "fetch_attempts": attempts,
+            "fetch_error": error_class,
+            "fetch_next_attempt_at": None if permanent else self.now + retry_delay(attempts),
+            "fetch_failed_permanently": permanent,
+        })
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self.pending_texts) + len(self.pending_failures) >= self.commit_batch_size:
+            self.flush()
+
+    def flush(self):
+        signatures = {row["id"]: row["minhash"] for row in self.pending_texts}
+        for pending in (self.pending_texts, self.pending_failures):
+            if pending:
+                self.session.execute(update(ArticleDB), pending)
+                pending.clear()
+        index_near_duplicates(self.session, signatures)
+        self.session.commit()
+
+
+def extract_article_contents(
+        session,
+        client: httpx.Client = None,
+        download_workers: int = None,
+        parse_workers: int = None,
+        per_domain_limit: int = None,
+        commit_batch_size: int = None,
+        limit: int = None,
+        cache: HtmlCache = None,
+) -> int:
+    """
+    Download and extract the text of every article that doesn't have it yet.
+
+    Downloads run concurrently in threads (with a per-domain limit) and parsing runs in a
+    process pool, so parsing one page overlaps with downloading the next ones.
+
+    Args:
+        session: Database session
+        client: HTTP client to reuse. If None, a pooled client is created for this call.
+        download_workers: Maximum number of concurrent downloads
+        parse_workers: Number of parser processes. 1 parses in this process.
+        per_domain_limit: Maximum number of concurrent downloads from a single domain
+        commit_batch_size: Number of extracted articles written per commit
+        limit: Maximum number of articles to process in this run. If None, EXTRACTION_MAX_ARTICLES_PER_RUN.
+        cache: Raw HTML store. Downloaded pages are saved to it, and pages already in it are not downloaded
+            again, except when retrying a failed article.
+
+    Returns:
+        The number of articles whose text was extracted.
+    """
+    settings = config.settings
+    download_workers = download_workers or settings.EXTRACTION_DOWNLOAD_WORKERS
+    parse_workers = parse_workers or settings.EXTRACTION_PARSE_WORKERS
+    per_domain_limit = per_domain_limit or settings.EXTRACTION_PER_DOMAIN_LIMIT
+    commit_batch_size = commit_batch_size or settings.EXTRACTION_COMMIT_BATCH_SIZE
+    limit = limit or settings.EXTRACTION_MAX_ARTICLES_PER_RUN
+
+    owns_client = client is None
+    if owns_client:
+        client = httpx.Client(
+            timeout=settings.EXTRACTION_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=download_workers, max_keepalive_connections=download_workers),
+        )
+
+    domain_limits = defaultdict(lambda: threading.Semaphore(per_domain_limit))
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 1 else None
+    writer = _ResultWriter(session, commit_batch_size)
+    source_names = {}
+    queued = 0
+    pending = set()
+    # parse futures hold a whole page each, so cached pages are only read while few are in flight
+    parsing = set()
+    max_parsing = parse_workers * 2
+
+    def parse(result: DownloadResult):
+        source_name = source_names[result.article_id]
+        if parse_pool is None:
+            writer.record(parse_html(result.article_id, result.url, result.html, source_name))
+        else:
+            future = parse_pool.submit(parse_html, result.article_id, result.url, result.html, source_name)
+            pending.add(future)
+            parsing.add(future)
+
+    def handle_next_results():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        pending.difference_update(done)
+        parsing.difference_update(done)
+        for future in done:
+            result = future.result()
+            if isinstance(result, ExtractionResult):
+                writer.record(result)
+            elif result.error:
+                logger.warning(f"error when downloading article: {result.article_id}: {result.error}")
+                writer.record_failure(result.article_id, result.error_class)
+            else:
+                parse(result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+            # the work queue is fully read before the first commit, which would end the cursor
+            cached = []
+            invalid = []
+            for article_id, url, key, source_name, attempts, error in select_articles_to_extract(session, limit):
+                source_names[article_id] = source_name
+                writer.attempts[article_id] = attempts or 0
+                queued += 1
+                try:
+                    key = key or url_hash(url)
+                    domain = urlsplit(url).netloc
+                except ValueError:
+                    invalid.append(article_id)
+                    continue
+                # after a failure the cached page may be what failed, e.g. a paywall, so it is downloaded again
+                if cache is not None and error is None and key in cache:
+                    cached.append((article_id, url, key))
+                    continue
+                pending.add(download_pool.submit(
+                    download_html, client, article_id, url, domain_limits[domain], cache, key,
+                ))
+            logger.info(f"{queued} articles to extract, {len(cached)} of them from the HTML cache")
+
+            for article_id in invalid:
+                logger.warning(f"invalid URL for article: {article_id}")
+                writer.record_failure(article_id, "InvalidURL")
+
+            for article_id, url, key in cached:
+                while len(parsing) >= max_parsing:
+                    handle_next_results()
+                parse(DownloadResult(article_id=article_id, url=url, html=cache.get(key).html))
+
+            while pending:
+                handle_next_results()
+        writer.flush()
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
+        if owns_client:
+            client.close()
+
+    logger.info(f"extracted text for {writer.extracted}/{queued} articles, {writer.failed} failed")
+    return writer.extracted
+
+
+def reextract_from_cache(
+        session,
+        cache: HtmlCache,
+        parse_workers: int = None,
+        commit_batch_size: int = None,
+) -> int:
+    """
+    Re-run extraction over every cached page, replacing the stored text. No network access.
+
+    Returns:
+        The number of articles whose text was re-extracted.
+    """
+    parse_workers = parse_workers or config.settings.EXTRACTION_PARSE_WORKERS
+    commit_batch_size = commit_batch_size or config.settings.EXTRACTION_COMMIT_BATCH_SIZE
+    writer = _ResultWriter(session, commit_batch_size, track_fetches=False)
+
+    query = (
+        session.query(ArticleDB.id, ArticleDB.url, ArticleDB.url_hash, Source.name)
+        .join(Source, ArticleDB.source_id == Source.id)
+        .filter(ArticleDB.url.isnot(None))
+        .yield_per(config.settings.EXTRACTION_QUERY_CHUNK_SIZE)
+    )
+    articles = [(article_id, key or url_hash(url), source_name) for article_id, url, key, source_name in query]
+    articles = [(article_id, key, source_name) for article_id, key, source_name in articles if key in cache]
+    logger.info(f"re-extracting {len(articles)} articles from the HTML cache")
+
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 1 else None
+    try:
+        # pages are read from the cache one slice at a time to bound memory
+        for batch in chunked(articles, max(parse_workers, 1) * commit_batch_size):
+            pages = [(article_id, cache.get(key), source_name) for article_id, key, source_name in batch]
+            args = (
+                [article_id for article_id, _, _ in pages],
+                [page.url for _, page, _ in pages],
+                [page.html for _, page, _ in pages],
+                [source_name for _, _, source_name in pages],
+            )
+            results = map(parse_html, *args) if parse_pool is None else parse_pool.map(parse_html, *args, chunksize=8)
+            for result in results:
+                writer.record(result)
+        writer.flush()
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+
+    logger.info(f"re-extracted text for {writer.extracted}/{len(articles)} articles")
+    return writer.extracted
+
+
+def open_html_cache() -> Optional[HtmlCache]:
+    if not config.settings.HTML_CACHE_DIR:
+        return None
+    return HtmlCache(config.settings.HTML_CACHE_DIR)
 
-            if not article.text:
-                newspaper_article = Article(url)
-                newspaper_article.download()
-                newspaper_article.parse()
 
-                text = newspaper_article.text
-                title = newspaper_article.title
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract article text from the article web pages")
+    parser.add_argument("--reextract", action="store_true", help="re-parse every page in the HTML cache without downloading")
+    args = parser.parse_args()
 
-                article.text = text
-                session.commit()
+    config.setup_logging()
 
-                logger.debug(f"processed article {article.id}.database title: {article.title} | extracted title: {title}")
-        except Exception as e:
-            logger.warning(f"error when parsing article: {article.id}: {str(e)}")
+    cache = open_html_cache()
+    with get_session() as session:
+        if args.reextract:
+            if cache is None:
+                parser.error("--reextract needs HTML_CACHE_DIR to be set")
+            reextract_from_cache(session, cache)
+        else:
+            extract_article_contents(session, cache=cache)
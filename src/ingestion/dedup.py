@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import re
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import delete, update
+
+import config
+from db.bulk import chunked, insert_ignore
+from db.connection import get_session
+from db.models import Article as ArticleDB, article_minhash_bucket
+
+logger = logging.getLogger(__name__)
+
+_word = re.compile(r"\w+")
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _permutations(num_perm: int):
+    # fixed seed: signatures are stored, so the hash functions must never change between runs
+    rng = np.random.default_rng(1)
+    return (
+        rng.integers(1, _MAX_HASH, size=num_perm, dtype=np.uint64),
+        rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64),
+    )
+
+
+def shingles(text: str, size: int = None) -> np.ndarray:
+    """
+    32-bit hashes of the overlapping word n-grams of the text
+    """
+    size = size or config.settings.DEDUP_SHINGLE_SIZE
+    words = _word.findall(text.lower())
+    grams = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+    return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash_signature(text: str, num_perm: int = None) -> np.ndarray:
+    """
+    MinHash signature of the text's shingles; the share of equal positions between two
+    signatures estimates the Jaccard similarity of the shingle sets.
+    """
+    num_perm = num_perm or config.settings.DEDUP_NUM_PERM
+    a, b = _permutations(num_perm)
+    hashes = shingles(text)
+    # (a * x + b) mod p; a, b and x are below 2^32, so nothing overflows
+    permuted = (np.outer(hashes, a) + b) % np.uint64(_MERSENNE_PRIME) & np.uint64(_MAX_HASH)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def signature_bytes(text: str) -> bytes:
+    return minhash_signature(text).tobytes()
+
+
+def band_buckets(signature: np.ndarray, bands: int = None) -> List[int]:
+    """
+    LSH bucket of each band of the signature. The band number is part of the hash, so buckets
+    of different bands never collide and a single indexed column is enough.
+    """
+    bands = bands or config.settings.DEDUP_BANDS
+    rows = len(signature) // bands
+    return [
+        int.from_bytes(
+            hashlib.blake2b(band.to_bytes(2, "big") + signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+            "big",
+            signed=True,
+        )
+        for band in range(bands)
+    ]
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    return float(np.mean(first == second))
+
+
+def index_near_duplicates(session, signatures: Dict[int, bytes], threshold: float = None) -> int:
+    """
+    Put articles in the LSH index and link each one that nearly duplicates an article already
+    there to that article's canonical article, so the first copy indexed stays canonical.
+
+    Candidates come from an indexed lookup of the articles' band buckets, so the cost depends
+    on the number of candidates and not on the size of the corpus. Candidates are confirmed by
+    comparing signatures. Re-indexed articles lose their previous buckets and link.
+
+    Args:
+        session: Database session. The caller commits.
+        signatures: MinHash signature bytes by article id
+        threshold: Minimum estimated Jaccard similarity of a duplicate
+
+    Returns:
+        The number of articles linked to a canonical article
+    """
+    threshold = config.settings.DEDUP_THRESHOLD if threshold is None else threshold
+    if not signatures:
+        return 0
+
+    article_ids = sorted(signatures)
+    decoded = {article_id: np.frombuffer(signatures[article_id], dtype=np.uint32) for article_id in article_ids}
+    buckets = {article_id: band_buckets(decoded[article_id]) for article_id in article_ids}
+
+    for chunk in chunked(article_ids):
+        session.execute(delete(article_minhash_bucket).where(article_minhash_bucket.c.article_id.in_(chunk)))
+
+    candidates_by_bucket: Dict[int, List[int]] = {}
+    all_buckets = sorted({bucket for article_buckets in buckets.values() for bucket in article_buckets})
+    for chunk in chunked(all_buckets):
+        rows = session.execute(
+            article_minhash_bucket.select().where(article_minhash_bucket.c.bucket.in_(chunk))
+        )
+        for bucket, candidate_id in rows:
+            candidates_by_bucket.setdefault(bucket, []).append(candidate_id)
+
+    candidate_ids = sorted({i for ids in candidates_by_bucket.values() for i in ids})
+    known: Dict[int, tuple] = {}
+    for chunk in chunked(candidate_ids):
+        for candidate_id, minhash, canonical_id in (
+                session.query(ArticleDB.id, ArticleDB.minhash, ArticleDB.canonical_article_id)
+                .filter(ArticleDB.id.in_(chunk), ArticleDB.minhash.isnot(None))
+        ):
+            known[candidate_id] = (np.frombuffer(minhash, dtype=np.uint32), canonical_id or candidate_id)
+
+    links = []
+    for article_id in article_ids:
+        matches = {
+            candidate_id for bucket in buckets[article_id] for candidate_id in candidates_by_bucket.get(bucket, ())
+            if candidate_id != article_id and candidate_id in known
+        }
+        canonical_ids = [
+            known[candidate_id][1] for candidate_id in matches
+            if similarity(decoded[article_id], known[candidate_id][0]) >= threshold
+        ]
+        # an article is never its own duplicate; among several canonical copies keep the oldest
+        canonical_ids = [i for i in canonical_ids if i != article_id]
+        canonical_id: Optional[int] = min(canonical_ids) if canonical_ids else None
+        links.append({"id": article_id, "canonical_article_id": canonical_id})
+
+        # later articles of the same batch can match this one
+        known[article_id] = (decoded[article_id], canonical_id or article_id)
+        for bucket in buckets[article_id]:
+            candidates_by_bucket.setdefault(bucket, []).append(article_id)
+
+    session.execute(update(ArticleDB), links)
+    insert_ignore(session, article_minhash_bucket, [
+        {"bucket": bucket, "article_id": article_id}
+        for article_id in article_ids
+        for bucket in buckets[article_id]
+    ])
+
+    duplicates = sum(1 for link in links if link["canonical_article_id"] is not None)
+    if duplicates:
+        logger.info(f"Found {duplicates} near-duplicate articles out of {len(article_ids)}")
+    return duplicates
+
+
+def index_missing_signatures(session, batch_size: int = 500) -> int:
+    """
+    Sign and index the articles that have text but no signature yet, e.g. those extracted
+    before near-duplicate detection existed.
+
+    Returns:
+        The number of near-duplicates found
+    """
+    missing_ids = [
+        article_id for (article_id,) in
+        session.query(ArticleDB.id)
+        .filter(ArticleDB.text.isnot(None), ArticleDB.minhash.is_(None))
+        .order_by(ArticleDB.id)
+    ]
+
+    duplicates = 0
+    for chunk in chunked(missing_ids, batch_size):
+        signatures = {
+            article_id: signature_bytes(text) for article_id, text in
+            session.query(ArticleDB.id, ArticleDB.text).filter(ArticleDB.id.in_(chunk))
+        }
+        session.execute(update(ArticleDB), [{"id": i, "minhash": s} for i, s in signatures.items()])
+        duplicates += index_near_duplicates(session, signatures)
+        session.commit()
+    return duplicates
+
+
+if __name__ == "__main__":
+    config.setup_logging()
+
+    with get_session() as session:
+        index_missing_signatures(session)
@@ -0,0 +1,105 @@
+import re
+from dataclasses import dataclass
+from typing import Protocol, Optional, List, Dict
+
+import lxml.html
+
+from db.models import SourceName
+
+_whitespace = re.compile(r"\s+")
+
+
+@dataclass
+class ExtractedContent:
+    title: Optional[str]
+    text: str
+
+
+class Extractor(Protocol):
+    def extract(self, url: str, html: str) -> ExtractedContent:
+        ...
+
+
+class NewspaperExtractor(Extractor):
+    """
+    Full newspaper3k pipeline. Slow, but works on layouts we know nothing about.
+    """
+
+    def extract(self, url: str, html: str) -> ExtractedContent:
+        from newspaper import Article
+
+        newspaper_article = Article(url)
+        newspaper_article.download(input_html=html)
+        newspaper_article.parse()
+        return ExtractedContent(title=newspaper_article.title, text=newspaper_article.text)
+
+
+class LxmlExtractor(Extractor):
+    """
+    Pulls the body paragraphs of a known page layout with XPath and nothing else.
+
+    Args:
+        paragraph_xpaths: Tried in order; the first one matching any paragraph is used
+        title_xpaths: Tried in order; the first one with text is used
+    """
+
+    def __init__(self, paragraph_xpaths: List[str], title_xpaths: List[str] = ("//h1",)):
+        self.paragraph_xpaths = paragraph_xpaths
+        self.title_xpaths = title_xpaths
+
+    def extract(self, url: str, html: str) -> ExtractedContent:
+        document = lxml.html.fromstring(html)
+
+        title = None
+        for xpath in self.title_xpaths:
+            titles = [_clean(element.text_content()) for element in document.xpath(xpath)]
+            titles = [t for t in titles if t]
+            if titles:
+                title = titles[0]
+                break
+
+        for xpath in self.paragraph_xpaths:
+            paragraphs = [_clean(element.text_content()) for element in document.xpath(xpath)]
+            paragraphs = [p for p in paragraphs if p]
+            if paragraphs:
+                return ExtractedContent(title=title, text="\n\n".join(paragraphs))
+
+        return ExtractedContent(title=title, text="")
+
+
+def _clean(text: str) -> str:
+    return _whitespace.sub(" ", text).strip()
+
+
+FALLBACK_EXTRACTOR = NewspaperExtractor()
+
+EXTRACTORS: Dict[SourceName, Extractor] = {
+    SourceName.BBC: LxmlExtractor(
+        paragraph_xpaths=[
+            "//article//div[@data-component='text-block']//p",
+            "//article//p",
+        ],
+    ),
+    SourceName.THE_GUARDIAN: LxmlExtractor(
+        paragraph_xpaths=[
+            "//div[@data-gu-name='body']//p",
+            "//div[@id='maincontent']//p",
+        ],
+    ),
+}
+
+
+def get_extractor(source_name: Optional[SourceName]) -> Extractor:
+    return EXTRACTORS.get(source_name, FALLBACK_EXTRACTOR)
+
+
+def extract_content(url: str, html: str, source_name: Optional[SourceName] = None) -> ExtractedContent:
+    """
+    Extract with the lean extractor registered for the source, falling back to newspaper3k
+    when there is none or when the page doesn't match the expected layout.
+    """
+    extractor = get_extractor(source_name)
+    content = extractor.extract(url, html)
+    if not content.text and extractor is not FALLBACK_EXTRACTOR:
+        content = FALLBACK_EXTRACTOR.extract(url, html)
+    return content
@@ -0,0 +1,128 @@
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedResponse:
+    url: str
+    content: Optional[bytes] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+
+def conditional_headers(etag: str = None, last_modified: str = None) -> Dict[str, str]:
+    """
+    Build the validator headers that let a server answer 304 Not Modified
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def _fetch_feed(
+        client: httpx.Client,
+        url: str,
+        headers: Dict[str, str],
+        host_limit: threading.Semaphore,
+) -> FeedResponse:
+    with host_limit:
+        try:
+            response = client.get(url, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            return FeedResponse(url=url, error=f"{type(e).__name__}: {e}")
+
+    return FeedResponse(
+        url=url,
+        content=None if response.status_code == 304 else response.content,
+        status_code=response.status_code,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+
+
+def download_feeds(
+        urls: List[str],
+        headers: Dict[str, Dict[str, str]] = None,
+        client: httpx.Client = None,
+        max_workers: int = None,
+        per_host_limit: int = None,
+        timeout: float = None,
+        total_timeout: float = None,
+) -> Dict[str, FeedResponse]:
+    """
+    Download feeds in parallel over a shared, keep-alive connection pool.
+
+    Args:
+        urls: Feed URLs to download
+        headers: Extra request headers per URL, e.g. from conditional_headers()
+        client: HTTP client to reuse. If None, a pooled client is created for this call.
+        max_workers: Maximum number of feeds downloaded at once
+        per_host_limit: Maximum number of concurrent requests to a single host
+        timeout: Per-request timeout in seconds
+        total_timeout: Deadline for the whole batch. Feeds still pending are reported as failed.
+
+    Returns:
+        A FeedResponse for every URL, keyed by URL.
+    """
+    max_workers = max_workers or config.settings.FEED_FETCH_MAX_WORKERS
+    per_host_limit = per_host_limit or config.settings.FEED_FETCH_PER_HOST_LIMIT
+    timeout = timeout or config.settings.FEED_FETCH_TIMEOUT
+    total_timeout = total_timeout or config.settings.FEED_FETCH_TOTAL_TIMEOUT
+
+    urls = list(dict.fromkeys(urls))
+    headers = headers or {}
+    if not urls:
+        return {}
+
+    owns_client = client is None
+    if owns_client:
+        client = httpx.Client(
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_workers, max_keepalive_connections=max_workers),
+        )
+
+    host_limits = defaultdict(lambda: threading.Semaphore(per_host_limit))
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    try:
+        futures = {
+            executor.submit(_fetch_feed, client, url, headers.get(url, {}), host_limits[urlsplit(url).netloc]): url
+            for url in urls
+        }
+        done, not_done = wait(futures, timeout=total_timeout)
+
+        responses = {}
+        for future in done:
+            responses[futures[future]] = future.result()
+        for future in not_done:
+            url = futures[future]
+            logger.warning(f"feed download did not finish within {total_timeout}s: {url}")
+            responses[url] = FeedResponse(url=url, error="TimeoutError: ingestion deadline exceeded")
+        return responses
+    finally:
+        # don't block on stragglers; they are bounded by the per-request timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+        if owns_client:
+            client.close()
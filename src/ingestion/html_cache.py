@@ -0,0 +1,217 @@
+import datetime
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# a new pack file is started once the current one reaches this size
+PACK_MAX_BYTES = 256 * 1024 * 1024
+# sealed packs with less than this share of live pages are compacted
+COMPACT_LIVE_RATIO = 0.5
+
+_PACK_NAME = re.compile(r"pack-(\d{6})\.bin")
+
+
+@dataclass
+class CachedPage:
+    key: str
+    url: str
+    content: bytes  # the response body as downloaded
+    encoding: Optional[str]  # what the body was decoded with when downloaded
+    status_code: int
+    content_type: Optional[str]
+    fetched_at: datetime.datetime
+
+    @property
+    def html(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class HtmlCache:
+    """
+    On-disk store of raw article HTML, keyed by URL hash (see common.urls.url_hash).
+
+    Pages are kept as the raw response bytes, so that they can be decoded again later, along
+    with the encoding used at download time. They are zlib-compressed and appended to a few
+    large pack files rather than written one file per page; a small SQLite index maps each key
+    to its pack, offset and fetch metadata. Writing a key again appends a new copy and repoints
+    the index; once the superseded copies add up to a pack's worth, packs that are mostly
+    superseded copies are compacted (see compact()). Safe to share between threads.
+    """
+
+    def __init__(self, root: str, pack_max_bytes: int = PACK_MAX_BYTES, compression_level: int = 6):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.pack_max_bytes = pack_max_bytes
+        self.compression_level = compression_level
+
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("PRAGMA synchronous=NORMAL")
+        self._index.execute("""
+            CREATE TABLE IF NOT EXISTS page (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                pack INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                status_code INTEGER NOT NULL,
+                content_type TEXT,
+                fetched_at TEXT NOT NULL,
+                encoding TEXT
+            )
+        """)
+        # indexes created before raw bytes were kept hold UTF-8 text, which a NULL encoding decodes
+        if "encoding" not in [column[1] for column in self._index.execute("PRAGMA table_info(page)")]:
+            self._index.execute("ALTER TABLE page ADD COLUMN encoding TEXT")
+        self._index.commit()
+        self._pack = self._index.execute("SELECT COALESCE(MAX(pack), 1) FROM page").fetchone()[0]
+        self._superseded = self._superseded_bytes()
+
+    def _pack_path(self, pack: int) -> str:
+        return os.path.join(self.root, f"pack-{pack:06d}.bin")
+
+    def _pack_sizes(self) -> dict:
+        sizes = {}
+        for name in os.listdir(self.root):
+            match = _PACK_NAME.fullmatch(name)
+            if match:
+                sizes[int(match.group(1))] = os.path.getsize(os.path.join(self.root, name))
+        return sizes
+
+    def _superseded_bytes(self) -> int:
+        live = self._index.execute("SELECT COALESCE(SUM(length), 0) FROM page").fetchone()[0]
+        return sum(self._pack_sizes().values()) - live
+
+    def _append(self, payload: bytes) -> Tuple[int, int]:
+        """
+        Write a payload at the end of the current pack, starting a new one when it is full. Needs the lock.
+
+        Returns:
+            The pack and offset the payload was written at
+        """
+        path = self._pack_path(self._pack)
+        if os.path.exists(path) and os.path.getsize(path) + len(payload) > self.pack_max_bytes:
+            self._pack += 1
+            path = self._pack_path(self._pack)
+
+        with open(path, "ab") as pack_file:
+            offset = pack_file.tell()
+            pack_file.write(payload)
+        return self._pack, offset
+
+    def put(
+            self,
+            key: str,
+            url: str,
+            content: Union[bytes, str],
+            status_code: int = 200,
+            content_type: str = None,
+            encoding: str = None,
+    ):
+        """
+        Args:
+            content: The response body. Text is stored UTF-8 encoded.
+            encoding: What the body was decoded with at download time
+        """
+        if isinstance(content, str):
+            content, encoding = content.encode("utf-8"), "utf-8"
+        payload = zlib.compress(content, self.compression_level)
+        with self._lock:
+            previous = self._index.execute("SELECT length FROM page WHERE key = ?", (key,)).fetchone()
+            pack, offset = self._append(payload)
+            self._index.execute(
+                "INSERT OR REPLACE INTO page VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, pack, offset, len(payload), status_code, content_type,
+                 datetime.datetime.utcnow().isoformat(), encoding),
+            )
+            self._index.commit()
+            if previous is not None:
+                self._superseded += previous[0]
+            compact = self._superseded >= self.pack_max_bytes
+        if compact:
+            self.compact()
+
+    def compact(self):
+        """
+        Copy the live pages of the sealed packs that are mostly superseded copies to the end of
+        the current pack, and delete those packs.
+        """
+        with self._lock:
+            live = dict(self._index.execute("SELECT pack, SUM(length) FROM page GROUP BY pack"))
+            packs = [
+                pack for pack, size in self._pack_sizes().items()
+                if pack != self._pack and live.get(pack, 0) < size * COMPACT_LIVE_RATIO
+            ]
+            for pack in packs:
+                path = self._pack_path(pack)
+                pages = self._index.execute("SELECT key, offset, length FROM page WHERE pack = ?", (pack,)).fetchall()
+                with open(path, "rb") as pack_file:
+                    for key, offset, length in pages:
+                        pack_file.seek(offset)
+                        new_pack, new_offset = self._append(pack_file.read(length))
+                        self._index.execute(
+                            "UPDATE page SET pack = ?, offset = ? WHERE key = ?", (new_pack, new_offset, key),
+                        )
+                self._index.commit()
+                os.remove(path)
+            self._superseded = self._superseded_bytes()
+        if packs:
+            logger.info(f"Compacted {len(packs)} HTML cache packs")
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        # a compaction may move the page between reading the index and reading its pack
+        for _ in range(2):
+            with self._lock:
+                row = self._index.execute(
+                    "SELECT url, pack, offset, length, status_code, content_type, fetched_at, encoding "
+                    "FROM page WHERE key = ?",
+                    (key,),
+                ).fetchone()
+            if row is None:
+                return None
+
+            url, pack, offset, length, status_code, content_type, fetched_at, encoding = row
+            try:
+                with open(self._pack_path(pack), "rb") as pack_file:
+                    pack_file.seek(offset)
+                    payload = pack_file.read(length)
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            return None
+
+        return CachedPage(
+            key=key,
+            url=url,
+            content=zlib.decompress(payload),
+            encoding=encoding,
+            status_code=status_code,
+            content_type=content_type,
+            fetched_at=datetime.datetime.fromisoformat(fetched_at),
+        )
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._index.execute("SELECT 1 FROM page WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._index.execute("SELECT COUNT(*) FROM page").fetchone()[0]
+
+    def keys(self) -> Iterator[str]:
+        with self._lock:
+            keys = [key for (key,) in self._index.execute("SELECT key FROM page")]
+        return iter(keys)
+
+    def close(self):
+        with self._lock:
+            self._index.close()
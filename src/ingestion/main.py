@@ -1,36 +1,119 @@
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
 import feedparser
+from sqlalchemy import select
 
+from common.urls import url_hash
+from db.bulk import chunked, insert_ignore
 from db.models import Article as ArticleDB, Source
+from ingestion.fetch import download_feeds, conditional_headers
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedArticles:
+    # articles that are not stored yet, by URL of the feed they were found in
+    articles_per_feed: Dict[str, List[ArticleDB]] = field(default_factory=dict)
+    # URLs of the feeds that couldn't be downloaded, which have no entry in articles_per_feed
+    failed_feeds: Set[str] = field(default_factory=set)
+
+    @property
+    def articles(self) -> List[ArticleDB]:
+        return [article for articles in self.articles_per_feed.values() for article in articles]
+
+
+def fetch_feed_articles(session, feeds=None) -> FeedArticles:
+    """
+    Download and parse feeds, returning the articles that are not stored yet, grouped by feed URL,
+    and the feeds that failed. Failed feeds are told apart from feeds without new articles, so
+    that a poll that failed isn't mistaken for a quiet one.
+
+    Args:
+        session: Database session
+        feeds: Feeds to poll. If None, every feed of every source is polled.
+    """
+    if feeds is None:
+        feeds = [feed for source in session.query(Source).all() for feed in source.feeds]
+
+    # keyed by canonical URL hash so a story listed in several feeds is only inserted once
+    articles_to_insert = {}
+    failed_feeds = set()
+
+    responses = download_feeds(
+        [feed.url for feed in feeds],
+        headers={feed.url: conditional_headers(feed.etag, feed.last_modified) for feed in feeds},
+    )
+
+    for feed in feeds:
+        response = responses[feed.url]
+        if response.not_modified:
+            logger.debug(f"feed not modified since last poll: {feed.url}")
+            continue
+        if response.content is None:
+            logger.warning(f"skipping feed {feed.url}: {response.error}")
+            failed_feeds.add(feed.url)
+            continue
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        feed.etag = response.etag
+        feed.last_modified = response.last_modified
+        if content_hash == feed.content_hash:
+            logger.debug(f"feed content unchanged since last poll: {feed.url}")
+            continue
+        feed.content_hash = content_hash
+
+        feed_data = feedparser.parse(response.content)
+        logger.debug(f"{len(feed_data.entries)} entries found in feed {feed.url}")
+        for entry in feed_data.entries:
+            url = entry.get("link")
+            title = entry.get("title")
 
+            if not url:
+                continue
+            key = url_hash(url)
+            if key in articles_to_insert:
+                continue
 
-def fetch_rss_entries(session):
-    articles_to_insert = []
+            articles_to_insert[key] = (feed.url, ArticleDB(
+                url=url,
+                url_hash=key,
+                title=title,
+                source_topic=feed.feed_type.value,
+                source=feed.source
+            ))
 
-    for source in session.query(Source).all():
-        for feed in source.feeds:
-            feed_data = feedparser.parse(feed.url)
-            print(feed_data.entries)
-            for entry in feed_data.entries:
-                url = entry.get("link")
-                title = entry.get("title")
+    # Deduplication against the DB: one indexed lookup per chunk of URL hashes
+    existing_hashes = set()
+    for hashes in chunked(list(articles_to_insert)):
+        existing_hashes.update(session.scalars(select(ArticleDB.url_hash).where(ArticleDB.url_hash.in_(hashes))))
 
-                # Simple deduplication: skip if URL already in DB
-                exists = session.query(ArticleDB).filter_by(url=url).first()
-                if exists:
-                    continue
+    articles_per_feed = {feed.url: [] for feed in feeds if feed.url not in failed_feeds}
+    for key, (feed_url, article) in articles_to_insert.items():
+        if key not in existing_hashes:
+            articles_per_feed[feed_url].append(article)
+    return FeedArticles(articles_per_feed, failed_feeds)
 
-                article = ArticleDB(
-                    url=url,
-                    title=title,
-                    source_topic=feed.feed_type.value,
-                    source=source
-                )
-                articles_to_insert.append(article)
 
-    return articles_to_insert
+def fetch_rss_entries(session, feeds=None):
+    return fetch_feed_articles(session, feeds).articles
 
 
 def save_articles(articles, session):
-    session.add_all(articles)
+    rows = [
+        {
+            "url": article.url,
+            "url_hash": article.url_hash or url_hash(article.url),
+            "title": article.title,
+            "source_topic": article.source_topic,
+            "source_id": article.source.id,
+        }
+        for article in articles
+    ]
+    # URLs inserted by a concurrent run since fetch_rss_entries are silently skipped
+    inserted = insert_ignore(session, ArticleDB.__table__, rows, index_elements=["url_hash"], returning=ArticleDB.id)
     session.commit()
-    print(f"Inserted {len(articles)} new articles")
+    print(f"Inserted {len(inserted)} new articles")
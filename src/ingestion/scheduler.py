@@ -0,0 +1,158 @@
+import datetime
+import logging
+import random
+import threading
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import config
+from db.connection import get_session
+from db.models import Feed
+from ingestion.main import fetch_feed_articles, save_articles
+
+logger = logging.getLogger(__name__)
+
+# weight of the latest poll in the smoothed publish rate
+RATE_SMOOTHING = 0.3
+
+
+def update_publish_rate(feed: Feed, new_items: int, now: datetime.datetime):
+    """
+    Fold the result of a poll into the feed's smoothed publish rate (new articles per hour)
+    """
+    if feed.last_polled_at is None:
+        elapsed = feed.poll_interval or config.settings.FEED_POLL_DEFAULT_INTERVAL
+    else:
+        elapsed = max((now - feed.last_polled_at).total_seconds(), 1)
+
+    observed_rate = new_items / (elapsed / 3600)
+    if feed.publish_rate is None:
+        feed.publish_rate = observed_rate
+    else:
+        feed.publish_rate = RATE_SMOOTHING * observed_rate + (1 - RATE_SMOOTHING) * feed.publish_rate
+
+    feed.last_new_items = new_items
+    feed.last_polled_at = now
+
+
+def next_poll_interval(publish_rate: float) -> int:
+    """
+    Interval in seconds after which a feed publishing at `publish_rate` articles/hour
+    is expected to have FEED_POLL_TARGET_NEW_ITEMS new articles, clamped to the configured bounds.
+    """
+    settings = config.settings
+    if not publish_rate:
+        return settings.FEED_POLL_MAX_INTERVAL
+
+    interval = settings.FEED_POLL_TARGET_NEW_ITEMS / publish_rate * 3600
+    return int(min(max(interval, settings.FEED_POLL_MIN_INTERVAL), settings.FEED_POLL_MAX_INTERVAL))
+
+
+def schedule_next_poll(feed: Feed, now: datetime.datetime, rng: random.Random = random):
+    feed.poll_interval = next_poll_interval(feed.publish_rate)
+
+    # jitter spreads feeds of the same host apart, but never past the staleness bound
+    jitter = config.settings.FEED_POLL_JITTER
+    delay = feed.poll_interval * rng.uniform(1 - jitter, 1 + jitter)
+    delay = min(delay, config.settings.FEED_POLL_MAX_INTERVAL)
+    feed.next_poll_at = now + datetime.timedelta(seconds=delay)
+
+
+def schedule_retry(feed: Feed, now: datetime.datetime, rng: random.Random = random):
+    """
+    Poll a feed that couldn't be downloaded again soon, leaving its publish rate and interval alone
+    """
+    jitter = config.settings.FEED_POLL_JITTER
+    delay = config.settings.FEED_POLL_MIN_INTERVAL * rng.uniform(1 - jitter, 1 + jitter)
+    feed.next_poll_at = now + datetime.timedelta(seconds=delay)
+
+
+def due_feeds(session: Session, now: datetime.datetime):
+    return (
+        session.query(Feed)
+        .filter(or_(Feed.next_poll_at.is_(None), Feed.next_poll_at <= now))
+        .all()
+    )
+
+
+def poll_due_feeds(session: Session, now: datetime.datetime = None) -> int:
+    """
+    Poll the feeds whose next poll time has passed, save their new articles and reschedule them.
+    Feeds that failed to download are retried after FEED_POLL_MIN_INTERVAL, without counting the
+    failure as a poll that found nothing new.
+
+    Returns:
+        The number of feeds polled.
+    """
+    now = now or datetime.datetime.utcnow()
+    feeds = due_feeds(session, now)
+    if not feeds:
+        return 0
+
+    fetched = fetch_feed_articles(session, feeds)
+    for feed in feeds:
+        if feed.url in fetched.failed_feeds:
+            schedule_retry(feed, now)
+            logger.info(f"polling {feed.url} failed, retrying at {feed.next_poll_at}")
+            continue
+
+        new_items = len(fetched.articles_per_feed[feed.url])
+        update_publish_rate(feed, new_items, now)
+        schedule_next_poll(feed, now)
+        logger.info(
+            f"polled {feed.url}: {new_items} new, {feed.publish_rate:.2f}/h, "
+            f"next poll in {feed.poll_interval}s"
+        )
+
+    save_articles(fetched.articles, session)
+    return len(feeds)
+
+
+def poll_or_retry(session: Session, now: datetime.datetime = None) -> int:
+    """
+    poll_due_feeds, except that when the poll fails (a database error when saving, say), the due
+    feeds are rescheduled for a retry, so that the scheduler doesn't poll them again right away.
+
+    Returns:
+        The number of feeds polled, 0 when the poll failed.
+    """
+    now = now or datetime.datetime.utcnow()
+    try:
+        return poll_due_feeds(session, now)
+    except Exception as e:
+        session.rollback()
+        logger.exception(f"feed poll failed: {str(e)}")
+
+    feeds = due_feeds(session, now)
+    for feed in feeds:
+        schedule_retry(feed, now)
+    session.commit()
+    logger.info(f"retrying {len(feeds)} feeds in about {config.settings.FEED_POLL_MIN_INTERVAL}s")
+    return 0
+
+
+def seconds_until_next_poll(session: Session, now: datetime.datetime) -> float:
+    next_poll_at = session.query(Feed.next_poll_at).order_by(Feed.next_poll_at.asc().nulls_first()).limit(1).scalar()
+    if next_poll_at is None:
+        return 0
+    return max((next_poll_at - now).total_seconds(), 0)
+
+
+def run_scheduler(stop_event: threading.Event = None):
+    """
+    Poll feeds forever, each on its own adaptive interval, until `stop_event` is set
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        with get_session() as session:
+            try:
+                poll_or_retry(session)
+            except Exception as e:
+                # not even the retry could be scheduled; the wait below is then at least a second
+                session.rollback()
+                logger.exception(f"rescheduling failed feeds failed: {str(e)}")
+            wait = seconds_until_next_poll(session, datetime.datetime.utcnow())
+
+        # wake up at least once per minimum interval to pick up newly added feeds
+        stop_event.wait(min(max(wait, 1), config.settings.FEED_POLL_MIN_INTERVAL))
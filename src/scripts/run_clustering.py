@@ -0,0 +1,28 @@
+import argparse
+
+import config
+from db.connection import get_session
+from embeddings.ann import update_related_index
+from embeddings.main import embed_articles, open_embedding_store
+from inference.clustering import cluster_recent_articles
+from inference.encoder import SentenceTransformerEncoder
+
+parser = argparse.ArgumentParser(description="Group recent articles into emerging stories")
+parser.add_argument("--full", action="store_true", help="re-cluster the whole window now")
+args = parser.parse_args()
+
+config.setup_logging()
+
+encoder = SentenceTransformerEncoder(
+    config.settings.EMBEDDING_MODEL,
+    batch_size=config.settings.EMBEDDING_BATCH_SIZE,
+    threads=config.settings.EMBEDDING_THREADS,
+)
+store = open_embedding_store(encoder.model_name)
+if store is None:
+    parser.error("clustering needs EMBEDDING_STORE_DIR to be set")
+
+with get_session() as session:
+    embed_articles(session, encoder, store)
+    update_related_index(store)
+    cluster_recent_articles(session, store, force_full=args.full)
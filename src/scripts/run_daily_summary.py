@@ -1,9 +1,15 @@
 import config
-from adapters.ollama import OllamaClient
+from adapters.cache import cached_llm_client
+from adapters.ollama import AsyncOllamaClient
 from db.connection import get_session
 from summary.main import generate_daily_summary
 
 config.setup_logging()
 
 with get_session() as session:
-    generate_daily_summary(session, OllamaClient(config.settings.OLLAMA_MODEL))
+    generate_daily_summary(
+        session,
+        cached_llm_client(
+            AsyncOllamaClient(config.settings.OLLAMA_MODEL, timeout=config.settings.SUMMARY_REQUEST_TIMEOUT)
+        ),
+    )
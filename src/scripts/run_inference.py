@@ -1,8 +1,20 @@
 import config
 from db.connection import get_session
+from embeddings.main import open_embedding_store
+from inference.encoder import SentenceTransformerEncoder
 from inference.main import infer_topics
 
 config.setup_logging()
 
+encoder = None
+store = None
+if config.settings.TOPIC_INFERENCE_MODE == "embedding":
+    encoder = SentenceTransformerEncoder(
+        config.settings.EMBEDDING_MODEL,
+        batch_size=config.settings.EMBEDDING_BATCH_SIZE,
+        threads=config.settings.EMBEDDING_THREADS,
+    )
+    store = open_embedding_store(encoder.model_name)
+
 with get_session() as session:
-    infer_topics(session)
+    infer_topics(session, encoder=encoder, store=store)
@@ -0,0 +1,6 @@
+import config
+from ingestion.scheduler import run_scheduler
+
+config.setup_logging()
+
+run_scheduler()
@@ -0,0 +1,110 @@
+import asyncio
+import functools
+import inspect
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Union
+
+from adapters.interfaces import LLMClient, AsyncLLMClient
+
+Messages = List[Dict[str, str]]
+
+
+@dataclass
+class ChatResult:
+    index: int
+    response: Optional[str] = None
+    error: Optional[str] = None
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """
+    The event loop requests run on: one per process, on a daemon thread. Async clients keep
+    connections bound to the loop they were opened on, so every call has to share it.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-requests", daemon=True).start()
+    return _loop
+
+
+async def _chat_all(
+        client: Union[LLMClient, AsyncLLMClient],
+        requests: List[Messages],
+        concurrency: int,
+        timeout: Optional[float],
+        deliver,
+):
+    next_index = iter(range(len(requests)))
+    is_async = inspect.iscoroutinefunction(client.chat)
+    # blocking clients run on exactly `concurrency` threads
+    executor = None if is_async else ThreadPoolExecutor(max_workers=concurrency)
+
+    async def worker():
+        for index in next_index:
+            if is_async:
+                call = client.chat(requests[index], stream=False)
+            else:
+                call = asyncio.get_running_loop().run_in_executor(
+                    executor, functools.partial(client.chat, requests[index], stream=False),
+                )
+            try:
+                deliver(ChatResult(index=index, response=await asyncio.wait_for(call, timeout)))
+            except asyncio.TimeoutError:
+                deliver(ChatResult(index=index, error=f"timed out after {timeout}s"))
+            except Exception as e:
+                deliver(ChatResult(index=index, error=f"{type(e).__name__}: {e}"))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(requests)))))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def chat_concurrently(
+        client: Union[LLMClient, AsyncLLMClient],
+        requests: List[Messages],
+        concurrency: int,
+        timeout: float = None,
+) -> Iterator[ChatResult]:
+    """
+    Send chat requests with at most `concurrency` in flight and yield the results in request
+    order, each as soon as it and every request before it have finished.
+
+    Async clients are awaited directly; blocking LLMClients run on a pool of `concurrency`
+    threads. Requests run on an event loop in a background thread, so the caller can keep
+    using its database session while consuming the results. A request that fails or takes
+    longer than `timeout` seconds yields a result with an error instead of a response. A
+    timed-out blocking call can't be interrupted and keeps its thread until it returns.
+    """
+    if not requests:
+        return
+
+    results = queue.Queue()
+    finished = object()
+
+    future = asyncio.run_coroutine_threadsafe(
+        _chat_all(client, requests, concurrency, timeout, results.put), _event_loop(),
+    )
+    future.add_done_callback(lambda _: results.put(finished))
+
+    done = {}
+    next_index = 0
+    while True:
+        result = results.get()
+        if result is finished:
+            break
+        done[result.index] = result
+        while next_index in done:
+            yield done.pop(next_index)
+            next_index += 1
+    future.result()
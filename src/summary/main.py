@@ -1,14 +1,36 @@
 import datetime
+import json
 import logging
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple, Union
 
+from sqlalchemy import delete, exists, update
 from sqlalchemy.orm import Session
 
-from adapters.interfaces import LLMClient
-from db.models import Article, Topic, DailyTrendSummary
+import config
+from adapters.cache import cache_counts, log_hit_rate, request_hash
+from adapters.interfaces import LLMClient, AsyncLLMClient
+from db.bulk import chunked, insert_ignore
+from db.models import Article, Topic, DailyTrendSummary, StoryCluster, SummaryChunk, article_topic
+from summary.concurrency import chat_concurrently, ChatResult, Messages
+from summary.tokens import count_tokens, trim_to_budget
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class ArticleSummaryResult:
+    summarised: int
+    seconds: float
+
+    @property
+    def articles_per_second(self) -> float:
+        return self.summarised / self.seconds if self.seconds else 0.0
+
+
 def create_system_prompt_for_topic_summary(topic: str):
     return f"""You will be given multiple summaries of different articles. Combine them all into one single concise paragraph. 
     Consider these articles as under the topic: {topic}.
@@ -33,58 +55,216 @@ Help readers understand what happened and why it matters.
 """.strip()
 
 
-def generate_summary(
-        text: str,
-        llm_client: LLMClient,
-        system_prompt: str,
-):
-    response = llm_client.chat(
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    system_prompt
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    text
-                ),
-            },
-        ],
-        stream=False,
+def summary_messages(text: str, system_prompt: str) -> Messages:
+    return [
+        {
+            "role": "system",
+            "content": (
+                system_prompt
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                text
+            ),
+        },
+    ]
+
+
+def article_summary_request(text: str) -> Messages:
+    return summary_messages(
+        f"Summarize the following article. in one sentence\n\n{text}",
+        create_system_prompt_for_article_summary(n_sentences=1),
     )
 
-    return response
+
+def packed_summary_request(texts: List[str]) -> Messages:
+    system_prompt = create_system_prompt_for_article_summary(n_sentences=1) + """
+
+You will be given several numbered articles. Summarize each one separately.
+Reply with a JSON object only, mapping each article number to its summary, e.g. {"1": "...", "2": "..."}."""
+    articles = "\n\n".join(f"Article {number}:\n{text}" for number, text in enumerate(texts, start=1))
+    return summary_messages(f"Summarize each of the following articles in one sentence.\n\n{articles}", system_prompt)
+
+
+def parse_packed_summaries(response: str, count: int) -> Optional[List[str]]:
+    """
+    The summaries in a response to packed_summary_request, in article order, or None unless
+    it has a non-empty summary for exactly articles 1 to count
+    """
+    start, end = response.find("{"), response.rfind("}")
+    try:
+        summaries = json.loads(response[start:end + 1]) if start >= 0 else None
+    except ValueError:
+        return None
+    if not isinstance(summaries, dict) or set(summaries) != {str(number) for number in range(1, count + 1)}:
+        return None
+    if not all(isinstance(summary, str) and summary.strip() for summary in summaries.values()):
+        return None
+    return [summaries[str(number)].strip() for number in range(1, count + 1)]
+
+
+def pack_texts(texts: List[str], pack_size: int, max_tokens: int) -> List[List[int]]:
+    """
+    Group the positions of texts of at most max_tokens into packs of up to pack_size, in
+    order; longer texts get a pack of their own
+    """
+    packs = []
+    short = []
+    for i, text in enumerate(texts):
+        if pack_size > 1 and count_tokens(text) <= max_tokens:
+            short.append(i)
+            if len(short) == pack_size:
+                packs.append(short)
+                short = []
+        else:
+            packs.append([i])
+    if short:
+        packs.append(short)
+    return packs
+
+
+def summarise_texts(
+        llm_client: Union[LLMClient, AsyncLLMClient],
+        texts: List[str],
+        concurrency: int,
+        timeout: float = None,
+        pack_size: int = 1,
+        pack_max_tokens: int = None,
+) -> Iterator[ChatResult]:
+    """
+    One-sentence summaries of texts, yielded as ChatResults indexed by text position as they
+    complete.
+
+    With pack_size above 1, texts of at most pack_max_tokens tokens are sent pack_size at a
+    time in one request that asks for a JSON object of summaries, so the system prompt and
+    per-request overhead are paid once per pack. The texts of a pack whose response fails or
+    doesn't parse are summarized again one by one, after all the other requests.
+    """
+    pack_max_tokens = pack_max_tokens or config.settings.SUMMARY_PACK_MAX_TOKENS
+    packs = pack_texts(texts, pack_size, pack_max_tokens)
+    requests = [
+        article_summary_request(texts[pack[0]]) if len(pack) == 1
+        else packed_summary_request([texts[i] for i in pack])
+        for pack in packs
+    ]
+
+    retry = []
+    for result in chat_concurrently(llm_client, requests, concurrency, timeout):
+        pack = packs[result.index]
+        if len(pack) == 1:
+            yield ChatResult(index=pack[0], response=result.response, error=result.error)
+            continue
+
+        summaries = None if result.error else parse_packed_summaries(result.response, len(pack))
+        if summaries is None:
+            logger.warning(f"Packed request for {len(pack)} articles failed ({result.error or 'invalid response'}), "
+                           f"retrying them one by one")
+            retry.extend(pack)
+            continue
+        for i, summary in zip(pack, summaries):
+            yield ChatResult(index=i, response=summary)
+
+    results = chat_concurrently(llm_client, [article_summary_request(texts[i]) for i in retry], concurrency, timeout)
+    for result in results:
+        yield ChatResult(index=retry[result.index], response=result.response, error=result.error)
+
+    logger.info(f"Sent {len(requests) + len(retry)} requests for {len(texts)} articles")
 
 
 def generate_article_summaries(
         session: Session,
-        llm_client: LLMClient,
-        date: datetime.datetime = None
-):
+        llm_client: Union[LLMClient, AsyncLLMClient],
+        date: datetime.datetime = None,
+        concurrency: int = None,
+        timeout: float = None,
+        commit_batch_size: int = None,
+        pack_size: int = None,
+) -> ArticleSummaryResult:
     """
     Generate summaries for articles created after a specific datetime.
 
+    Articles longer than SUMMARY_MAX_INPUT_TOKENS are trimmed to their lead and most salient
+    sentences first (see summary.tokens.trim_to_budget).
+
+    An article is skipped when its summary came from the same request (text and prompt) to the
+    same model, as recorded by Article.summary_hash, so reruns and overlapping windows only
+    summarize new articles and those whose text or model changed.
+
+    Up to `concurrency` requests are in flight at once, each for one article or, with
+    `pack_size` above 1, for several short ones (see summarise_texts). Results are written as
+    they come in, with a bulk UPDATE and a commit every `commit_batch_size` summaries. Near-duplicates (see
+    ingestion/dedup.py) get their canonical article's summary instead of a request of their own.
+
     Args:
         session: Database session
-        llm_client: LLM client for generating summaries
+        llm_client: LLM client for generating summaries, blocking or async
         date: Datetime to filter articles from. If None, defaults to past 24 hours from now.
               If provided, generates summaries for articles created >= that datetime.
+        concurrency: Maximum number of requests in flight, defaults to SUMMARY_CONCURRENCY
+        timeout: Seconds before a request is given up on, defaults to SUMMARY_REQUEST_TIMEOUT
+        commit_batch_size: Summaries written per commit, defaults to SUMMARY_COMMIT_BATCH_SIZE
+        pack_size: Short articles per request, defaults to SUMMARY_PACK_SIZE
+
+    Returns:
+        How many articles got a summary, and how long it took
     """
+    settings = config.settings
+    concurrency = concurrency or settings.SUMMARY_CONCURRENCY
+    timeout = settings.SUMMARY_REQUEST_TIMEOUT if timeout is None else timeout
+    commit_batch_size = commit_batch_size or settings.SUMMARY_COMMIT_BATCH_SIZE
+    pack_size = pack_size or settings.SUMMARY_PACK_SIZE
+    started = time.perf_counter()
+    cache_counts_before = cache_counts(llm_client)
+
     if date is None:
         # Default: articles from the past 24 hours
         cutoff_datetime = datetime.datetime.now() - datetime.timedelta(days=1)
     else:
         cutoff_datetime = date
 
-    articles = session.query(Article).filter(Article.created >= cutoff_datetime).all()
+    # canonical articles first, so that their near-duplicates can wait for the summary
+    articles = (
+        session.query(Article.id, Article.title, Article.text, Article.canonical_article_id, Article.summary,
+                      Article.summary_hash)
+        .filter(Article.created >= cutoff_datetime)
+        .order_by(Article.canonical_article_id.isnot(None), Article.id)
+        .all()
+    )
     logger.info(f"Filtering articles created >= {cutoff_datetime}")
     logger.info(f"Found {len(articles)} articles to summarize")
 
-    for i, article in enumerate(articles):
-        logger.info(f"summarising article {i + 1}/{len(articles)}. id: {article.id}, title: {article.title}")
+    canonical_ids = sorted({article.canonical_article_id for article in articles if article.canonical_article_id})
+    canonical_summaries = {}
+    for chunk in chunked(canonical_ids):
+        canonical_summaries.update(
+            session.query(Article.id, Article.summary).filter(Article.id.in_(chunk), Article.summary.isnot(None))
+        )
+
+    pending = []
+    to_summarise = []
+    up_to_date = 0
+    duplicates_waiting = defaultdict(list)
+    tokens_sent = tokens_before_trimming = 0
+    for article in articles:
+        text, tokens, original_tokens = trim_to_budget(
+            article.text, settings.SUMMARY_MAX_INPUT_TOKENS, settings.SUMMARY_LEAD_SENTENCES,
+        ) if article.text else (None, 0, 0)
+        request = article_summary_request(text) if text else None
+        summary_hash = request_hash(llm_client.model, request) if request else None
+        if article.summary is not None and summary_hash == article.summary_hash:
+            up_to_date += 1
+            continue
+
+        group = article.canonical_article_id or article.id
+        if article.canonical_article_id and group in canonical_summaries:
+            logger.info(f"Reusing the summary of article {group} for near-duplicate {article.id}")
+            pending.append({"id": article.id, "summary": canonical_summaries[group], "summary_hash": summary_hash})
+            continue
+        if group in duplicates_waiting:
+            duplicates_waiting[group].append((article.id, summary_hash))
+            continue
 
         # Skip articles with 5 lines or fewer
         line_count = len(article.text.splitlines()) if article.text else 0
@@ -92,28 +272,188 @@ def generate_article_summaries(
             logger.info(f"Skipping article {article.id}: only {line_count} lines (minimum 6 required)")
             continue
 
-        article.summary = generate_summary(
-            f"Summarize the following article. in one sentence\n\n{article.text}",
+        # its old summary is stale, so its near-duplicates wait for the new one
+        canonical_summaries.pop(article.id, None)
+        duplicates_waiting[group] = []
+        to_summarise.append((article, summary_hash, text))
+        tokens_sent += tokens
+        tokens_before_trimming += original_tokens
+
+    if up_to_date:
+        logger.info(f"Skipping {up_to_date} articles whose summary is up to date")
+    if tokens_sent < tokens_before_trimming:
+        logger.info(f"Trimming long articles cut the text sent from {tokens_before_trimming} to {tokens_sent} tokens "
+                    f"({1 - tokens_sent / tokens_before_trimming:.0%} less)")
+
+    summarised = 0
+
+    def flush():
+        nonlocal summarised
+        if pending:
+            session.execute(update(Article), pending)
+            session.commit()
+            summarised += len(pending)
+            pending.clear()
+
+    texts = [text for _, _, text in to_summarise]
+    for done, result in enumerate(summarise_texts(llm_client, texts, concurrency, timeout, pack_size), start=1):
+        article, summary_hash, _ = to_summarise[result.index]
+        if result.error:
+            logger.warning(f"Failed to summarise article {article.id}: {result.error}")
+            continue
+
+        logger.info(f"summarised article {done}/{len(to_summarise)}. id: {article.id}, title: {article.title}")
+        group = article.canonical_article_id or article.id
+        for article_id, article_hash in [(article.id, summary_hash), *duplicates_waiting[group]]:
+            pending.append({"id": article_id, "summary": result.response, "summary_hash": article_hash})
+        if len(pending) >= commit_batch_size:
+            flush()
+    flush()
+
+    result = ArticleSummaryResult(summarised=summarised, seconds=time.perf_counter() - started)
+    if summarised:
+        logger.info(f"Summarised {result.summarised} articles in {result.seconds:.1f}s "
+                    f"({result.articles_per_second:.2f} articles/s, {pack_size} per request)")
+    log_hit_rate(llm_client, since=cache_counts_before)
+    return result
+
+
+def chunk_summaries(summaries: List[Tuple[int, str]], budget: int, boundary_every: int = None) -> List[List[str]]:
+    """
+    Split (id, summary) pairs, in order, into chunks of at most `budget` tokens (a single
+    summary over budget gets a chunk of its own).
+
+    With boundary_every, a chunk also ends after every item whose id hashes to 0 modulo
+    boundary_every. Those boundaries depend only on the items next to them, so when items
+    are added at the end of the list or dropped from its start, the chunks in between stay
+    the same and their summaries can be reused.
+    """
+    chunks = []
+    current, tokens = [], 0
+    for item_id, summary in summaries:
+        size = count_tokens(summary)
+        if current and tokens + size > budget:
+            chunks.append(current)
+            current, tokens = [], 0
+        current.append(summary)
+        tokens += size
+        if boundary_every and zlib.crc32(str(item_id).encode()) % boundary_every == 0:
+            chunks.append(current)
+            current, tokens = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _cached_chat(
+        session: Session,
+        llm_client: Union[LLMClient, AsyncLLMClient],
+        requests: List[Messages],
+        concurrency: int,
+        timeout: float,
+) -> List[Optional[str]]:
+    """
+    Responses to the requests, in order, reusing SummaryChunk rows and storing new ones.
+    None for the requests that failed.
+    """
+    hashes = [request_hash(llm_client.model, request) for request in requests]
+    responses = {}
+    for chunk in chunked(sorted(set(hashes))):
+        responses.update(
+            session.query(SummaryChunk.request_hash, SummaryChunk.summary).filter(SummaryChunk.request_hash.in_(chunk))
+        )
+
+    missing = [i for i, key in enumerate(hashes) if key not in responses]
+    new_rows = []
+    for result in chat_concurrently(llm_client, [requests[i] for i in missing], concurrency, timeout):
+        if result.error:
+            logger.warning(f"Failed to summarise a chunk: {result.error}")
+            continue
+        responses[hashes[missing[result.index]]] = result.response
+        new_rows.append({"request_hash": hashes[missing[result.index]], "summary": result.response})
+    insert_ignore(session, SummaryChunk, new_rows)
+
+    logger.info(f"Summarised {len(new_rows)} chunks, reused {len(requests) - len(missing)}")
+    return [responses.get(key) for key in hashes]
+
+
+def summarise_topic(
+        session: Session,
+        llm_client: Union[LLMClient, AsyncLLMClient],
+        topic_name: str,
+        summaries: List[Tuple[int, str]],
+        concurrency: int = None,
+        timeout: float = None,
+) -> Optional[str]:
+    """
+    Combine article summaries into one topic summary.
+
+    Summaries that fit in DAILY_SUMMARY_TOKEN_BUDGET are combined with a single request.
+    Otherwise they are split into chunks within the budget (see chunk_summaries), the chunks
+    are summarized in parallel and the partial summaries are combined the same way, until
+    one is left. Every request is cached in SummaryChunk, so a rerun after a few more
+    articles came in only sends the chunks that changed and the final combination.
+
+    Args:
+        session: Database session
+        llm_client: LLM client, blocking or async
+        topic_name: Topic the articles are about
+        summaries: (article id, summary) pairs, oldest first
+        concurrency: Maximum number of requests in flight, defaults to SUMMARY_CONCURRENCY
+        timeout: Seconds before a request is given up on, defaults to SUMMARY_REQUEST_TIMEOUT
+
+    Returns:
+        The topic summary, or None if a request failed
+    """
+    settings = config.settings
+    concurrency = concurrency or settings.SUMMARY_CONCURRENCY
+    timeout = settings.SUMMARY_REQUEST_TIMEOUT if timeout is None else timeout
+    budget = settings.DAILY_SUMMARY_TOKEN_BUDGET
+    system_prompt = create_system_prompt_for_topic_summary(topic_name)
+
+    chunks = chunk_summaries(summaries, budget, settings.DAILY_SUMMARY_CHUNK_BOUNDARY)
+    if len(chunks) > 1 and sum(count_tokens(summary) for _, summary in summaries) <= budget:
+        chunks = [[summary for _, summary in summaries]]
+
+    level = 0
+    while True:
+        logger.info(f"Summarising {len(chunks)} chunks of topic {topic_name} (level {level})")
+        partials = _cached_chat(
+            session,
             llm_client,
-            create_system_prompt_for_article_summary(n_sentences=1),
+            [summary_messages(" ".join(chunk), system_prompt) for chunk in chunks],
+            concurrency,
+            timeout,
         )
-        session.commit()
+        if None in partials:
+            return None
+        if len(partials) == 1:
+            return partials[0]
+
+        reduced = chunk_summaries(list(enumerate(partials)), budget)
+        # partial summaries too long to shrink any further are combined in one go
+        chunks = reduced if len(reduced) < len(chunks) else [partials]
+        level += 1
 
 
 def generate_daily_summary(
         session: Session,
-        llm_client: LLMClient,
-        date: datetime.datetime = None
+        llm_client: Union[LLMClient, AsyncLLMClient],
+        date: datetime.datetime = None,
+        concurrency: int = None,
+        timeout: float = None,
 ):
     """
-    Generate daily topic summaries combining article summaries.
+    Generate daily topic summaries combining article summaries, see summarise_topic.
 
     Args:
         session: Database session
-        llm_client: LLM client for generating summaries
+        llm_client: LLM client for generating summaries, blocking or async
         date: Datetime to filter articles from. If None, defaults to past 24 hours from now.
               If provided, generates summaries for articles created >= that datetime.
               The DailyTrendSummary will be tagged with today's date if None, or the date component of the provided datetime.
+        concurrency: Maximum number of chunk requests in flight, defaults to SUMMARY_CONCURRENCY
+        timeout: Seconds before a request is given up on, defaults to SUMMARY_REQUEST_TIMEOUT
     """
     if date is None:
         # Default: articles from the past 24 hours
@@ -124,16 +464,27 @@ def generate_daily_summary(
         summary_date = date.date()
 
     logger.info(f"Generating daily summaries for articles created >= {cutoff_datetime}")
+    cache_counts_before = cache_counts(llm_client)
 
-    topics = session.query(Topic).all()
+    session.execute(delete(SummaryChunk).where(
+        SummaryChunk.created < datetime.datetime.utcnow() - datetime.timedelta(days=config.settings.DAILY_SUMMARY_CACHE_DAYS)
+    ))
+    session.commit()
+
+    # stories that clustering has since dropped are left out
+    topics = session.query(Topic).filter(
+        ~exists().where(StoryCluster.topic_id == Topic.id, StoryCluster.active.is_(False))
+    ).all()
     for i, topic in enumerate(topics):
         logger.info(f"summarising topic {i + 1}/{len(topics)}. id: {topic.id}, title: {topic.name}")
 
-        # Query articles for this topic created after cutoff datetime
-        topic_articles = session.query(Article).filter(
-            Article.source_topic == topic.name,
+        # Query articles linked to this topic, by topic inference or clustering, created after cutoff datetime
+        topic_articles = session.query(Article).join(
+            article_topic, article_topic.c.article_id == Article.id
+        ).filter(
+            article_topic.c.topic_id == topic.id,
             Article.created >= cutoff_datetime
-        ).all()
+        ).order_by(Article.created, Article.id).all()
 
         logger.info(f"{len(topic_articles)} found for topic: {topic.name}")
 
@@ -147,12 +498,19 @@ def generate_daily_summary(
             logger.warning(f"No articles with summaries found for topic {topic.name}, skipping")
             continue
 
-        topic_summaries = " ".join(article.summary for article in articles_with_summaries)
-        daily_topic_summary = generate_summary(
-            topic_summaries,
+        daily_topic_summary = summarise_topic(
+            session,
             llm_client,
-            create_system_prompt_for_topic_summary(topic.name)
+            topic.name,
+            [(article.id, article.summary) for article in articles_with_summaries],
+            concurrency,
+            timeout,
         )
+        if daily_topic_summary is None:
+            logger.warning(f"Failed to summarise topic {topic.name}, skipping")
+            session.commit()  # keeps the chunks that did succeed
+            continue
+
         daily_summary = DailyTrendSummary(
             topic=topic,
             summary=daily_topic_summary,
@@ -162,3 +520,5 @@ def generate_daily_summary(
             article.daily_trend_summary = daily_summary
         session.add(daily_summary)
         session.commit()
+
+    log_hit_rate(llm_client, since=cache_counts_before)
@@ -0,0 +1,153 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import Optional, Protocol, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+CHARACTERS_PER_TOKEN = 4  # rough average for English text with Llama-style tokenizers
+
+# a sentence ends at ., ! or ? (maybe followed by a closing quote or bracket) and whitespace, or at a line break
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]?\s+|\s*\n+\s*")
+WORD = re.compile(r"[a-z][a-z'-]+")
+
+
+class TokenCounter(Protocol):
+    def count(self, text: str) -> int:
+        ...
+
+
+class ApproximateTokenCounter(TokenCounter):
+    def count(self, text: str) -> int:
+        return len(text) // CHARACTERS_PER_TOKEN + 1
+
+
+class HuggingFaceTokenCounter(TokenCounter):
+    """
+    Exact token counts from a Hugging Face tokenizer
+
+    Args:
+        name: Hugging Face model id whose tokenizer.json to load
+    """
+
+    def __init__(self, name: str):
+        # imported here so that the rest of the pipeline doesn't need tokenizers installed
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_pretrained(name)
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+_counter: Optional[TokenCounter] = None
+
+
+def get_token_counter() -> TokenCounter:
+    """
+    The tokenizer of SUMMARY_TOKENIZER, loaded once per process. Falls back to an estimate
+    from the character count when it isn't set or can't be loaded.
+    """
+    global _counter
+    if _counter is None:
+        name = config.settings.SUMMARY_TOKENIZER
+        _counter = ApproximateTokenCounter()
+        if name:
+            try:
+                _counter = HuggingFaceTokenCounter(name)
+            except Exception as e:
+                logger.warning(f"Couldn't load tokenizer {name}, estimating token counts instead: {e}")
+    return _counter
+
+
+def count_tokens(text: str) -> int:
+    return get_token_counter().count(text)
+
+
+def split_sentences(text: str):
+    return [sentence for sentence in SENTENCE_END.split(text.strip()) if sentence]
+
+
+def cut_to_budget(text: str, budget: int) -> Tuple[str, int]:
+    """
+    The longest start of text that fits in `budget` tokens, cut between words where possible and
+    never empty.
+
+    Returns:
+        The cut text and its token count
+    """
+
+    def longest(length: int, prefix) -> int:
+        # token counts grow with the prefix, so the longest one that fits is found by bisection
+        low, high = 0, length
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(prefix(middle)) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    words = text.split()
+    kept_words = longest(len(words), lambda n: " ".join(words[:n]))
+    if kept_words:
+        cut = " ".join(words[:kept_words])
+    else:
+        cut = words[0][:max(longest(len(words[0]), lambda n: words[0][:n]), 1)]
+    return cut, count_tokens(cut)
+
+
+def trim_to_budget(text: str, budget: int, lead_sentences: int = 3) -> Tuple[str, int, int]:
+    """
+    Shorten text to at most `budget` tokens by keeping its lead and its most salient sentences.
+
+    The first `lead_sentences` sentences are kept, since news articles put the most important
+    facts first, and a lead sentence that doesn't fit is cut to the tokens left. The remaining
+    budget goes to the sentences that share the most words (stop words aside) with the rest of
+    the article, and with the lead above all, favouring shorter sentences. Repeated sentences
+    are kept once, and the kept ones are put back in their original order. The result is never
+    empty: at worst it is the start of the first sentence.
+
+    Returns:
+        The trimmed text, its token count, and the token count of the original text
+    """
+    original_tokens = count_tokens(text)
+    if original_tokens <= budget:
+        return text, original_tokens, original_tokens
+
+    # slow to import, and only needed for long articles
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+    sentences = split_sentences(text)
+    sizes = [count_tokens(sentence) for sentence in sentences]
+    sentence_words = [
+        {word for word in WORD.findall(sentence.lower()) if word not in ENGLISH_STOP_WORDS} for sentence in sentences
+    ]
+    lead = range(min(lead_sentences, len(sentences)))
+    lead_words = set().union(*(sentence_words[i] for i in lead))
+    # words used by many different sentences, and most of all those of the lead, say what the article is about
+    weights = Counter(word for words in {frozenset(words) for words in sentence_words} for word in words)
+    for word in lead_words:
+        weights[word] *= 2
+
+    def salience(i: int) -> float:
+        return sum(weights[word] for word in sentence_words[i]) / math.sqrt(sizes[i])
+
+    rest = sorted(range(len(lead), len(sentences)), key=salience, reverse=True)
+    kept, seen, tokens = [], set(), 0
+    for i in [*lead, *rest]:
+        if sentences[i] in seen:
+            continue
+        if tokens + sizes[i] > budget:
+            if kept and (i not in lead or tokens >= budget):
+                continue
+            sentences[i], sizes[i] = cut_to_budget(sentences[i], budget - tokens)
+        kept.append(i)
+        seen.add(sentences[i])
+        tokens += sizes[i]
+
+    trimmed = " ".join(sentences[i] for i in sorted(kept))
+    return trimmed, tokens, original_tokens
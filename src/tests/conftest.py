@@ -1,5 +1,9 @@
 from typing import List, Dict
 import datetime
+import re
+import zlib
+
+import numpy as np
 
 import pytest
 from sqlalchemy import create_engine
@@ -11,6 +15,9 @@ from api.main import app
 from db.connection import get_session_dependency
 from db.initialise import initialise_database
 from db.models import Article as ArticleDB, Feed, FeedType, SourceName, Source, Topic, DailyTrendSummary
+from ingestion import main as ingestion_main
+from inference.encoder import Encoder
+from ingestion.fetch import FeedResponse
 
 # Article text with more than 5 lines for summary generation tests
 SAMPLE_ARTICLE_TEXT = """This is the first line of the article.
@@ -20,6 +27,21 @@ Fourth line continues the narrative.
 Fifth line adds more details.
 Sixth line ensures we have enough content for summarization."""
 
+SAMPLE_ARTICLE_HTML = """<html>
+<head><title>Budget vote passes after late-night session</title></head>
+<body>
+<nav><a href="/">Home</a> <a href="/news">News</a></nav>
+<article>
+<h1>Budget vote passes after late-night session</h1>
+<p>Ministers confirmed on Tuesday that the budget had passed its final vote in parliament after a session that ran late into the night.</p>
+<p>The package includes new funding for hospitals and schools, alongside changes to income tax thresholds that will take effect next April.</p>
+<p>Opposition members said the measures did not go far enough to address rising living costs, and promised to table amendments next month.</p>
+<p>Economists said the impact on public borrowing would depend on growth forecasts that are due to be revised in the spring statement.</p>
+</article>
+<footer>Copyright</footer>
+</body>
+</html>"""
+
 
 @pytest.fixture
 def fake_source():
@@ -288,14 +310,46 @@ class FakeFeedData:
         self.entries = entries
 
 
+@pytest.fixture
+def fake_feed_download(monkeypatch):
+    """Serve every feed URL from memory instead of the network"""
+    def _download(urls, **kwargs):
+        return {url: FeedResponse(url=url, content=b"<rss></rss>") for url in urls}
+
+    monkeypatch.setattr(ingestion_main, "download_feeds", _download)
+
+
 class FakeLLM(LLMClient):
     def __init__(self, model: str):
-        ...
+        self.model = model
 
     def chat(self, messages: List[Dict[str, str]], stream=False, **kwargs) -> str:
         return "Fake response"
 
 
+class FakeEncoder(Encoder):
+    """Bag-of-words hashed into a fixed number of dimensions; texts sharing words end up close"""
+    model_name = "fake-encoder"
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.encoded: List[str] = []
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        self.encoded.extend(texts)
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                if word not in {"news", "about"}:
+                    vectors[row, zlib.crc32(word.encode()) % self.dimensions] += 1
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+
+
+@pytest.fixture
+def fake_encoder():
+    return FakeEncoder()
+
+
 @pytest.fixture
 def override_get_session_with_summaries(
         fake_source,
@@ -1,5 +1,11 @@
 import datetime
 
+import numpy as np
+
+from api.main import app
+from embeddings.ann import get_related_index, update_related_index
+from embeddings.store import EmbeddingStore
+
 
 def test_get_topics(
         test_client,
@@ -89,6 +95,20 @@ def test_get_articles_with_pagination_skip(test_client, fake_articles):
     assert len(response.json()) == total_articles - 1
 
 
+def test_get_articles_by_url(test_client, fake_articles):
+    response = test_client.get("/articles/", params={"url": "http://example.com/article2/?utm_source=rss"})
+    assert response.status_code == 200
+    articles = response.json()
+    assert len(articles) == 1
+    assert articles[0]["url"] == fake_articles[1].url
+
+
+def test_get_articles_by_unknown_url(test_client):
+    response = test_client.get("/articles/", params={"url": "https://example.com/unknown"})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
 # Tests for /daily-summaries/ endpoint
 
 
@@ -203,3 +223,23 @@ def test_get_daily_summaries_topic_structure(test_client_with_summaries):
         assert "name" in topic
         assert isinstance(topic["id"], int)
         assert isinstance(topic["name"], str)
+
+
+def test_get_related_articles(test_client, tmp_path, monkeypatch):
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    store.add([1, 2, 99], np.array([[1.0, 0.0], [0.8, 0.6], [0.9, 0.1]], dtype=np.float32))
+    index = update_related_index(store)
+    monkeypatch.setitem(app.dependency_overrides, get_related_index, lambda: index)
+
+    response = test_client.get("/article/1/related/")
+
+    assert response.status_code == 200
+    # article 99 isn't in the database
+    assert [article["id"] for article in response.json()] == [2]
+
+
+def test_get_related_articles_without_index(test_client, monkeypatch):
+    monkeypatch.setitem(app.dependency_overrides, get_related_index, lambda: None)
+
+    assert test_client.get("/article/1/related/").status_code == 503
+    assert test_client.get("/article/99999/related/").status_code == 404
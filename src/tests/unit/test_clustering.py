@@ -0,0 +1,170 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import config
+from api.main import get_topics
+from db.models import Article, DailyTrendSummary, Source, StoryCluster, Topic
+from embeddings.store import EmbeddingStore
+from inference.clustering import cluster_recent_articles, name_clusters
+from inference.main import infer_topics
+from summary.main import generate_daily_summary
+from tests.conftest import FakeLLM
+
+NOW = datetime.datetime(2026, 3, 2, 12, 0)
+
+
+@pytest.fixture
+def raw_clustering(monkeypatch):
+    # UMAP is slow to start and pointless on a handful of points
+    monkeypatch.setattr(config.settings, "CLUSTER_UMAP_DIMENSIONS", None)
+    monkeypatch.setattr(config.settings, "CLUSTER_MIN_SIZE", 4)
+
+
+def story_vectors(direction_seed, count, noise=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    direction = np.random.default_rng(direction_seed).normal(size=32)
+    vectors = direction + rng.normal(scale=noise * np.linalg.norm(direction), size=(count, 32))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def add_story(db_session, store, title, vectors, created=NOW):
+    source = db_session.query(Source).first()
+    articles = [
+        Article(title=f"{title} {i}", url=f"https://example.com/{title.replace(' ', '-')}-{created:%H%M}-{i}",
+                source=source, created=created, text=f"{title} {i}, the full story.")
+        for i in range(len(vectors))
+    ]
+    db_session.add_all(articles)
+    db_session.commit()
+    store.add([a.id for a in articles], vectors)
+    return articles
+
+
+def story_topics(db_session, article):
+    db_session.refresh(article)
+    story_topic_ids = {topic_id for (topic_id,) in db_session.query(StoryCluster.topic_id)}
+    return [topic for topic in article.topics if topic.id in story_topic_ids]
+
+
+def test_full_clustering_creates_story_topics(db_session, tmp_path, raw_clustering):
+    store = EmbeddingStore(str(tmp_path), "fake")
+    budget = add_story(db_session, store, "Budget vote passes", story_vectors(1, 8))
+    storm = add_story(db_session, store, "Storm floods coast", story_vectors(2, 8, seed=1))
+
+    result = cluster_recent_articles(db_session, store, now=NOW)
+
+    assert result.full and result.clusters == 2
+    budget_topics = story_topics(db_session, budget[0])
+    storm_topics = story_topics(db_session, storm[0])
+    assert len(budget_topics) == len(storm_topics) == 1
+    assert budget_topics != storm_topics
+    assert "budget" in budget_topics[0].name
+    assert all(story_topics(db_session, a) == budget_topics for a in budget)
+
+
+def test_new_articles_are_assigned_without_reclustering(db_session, tmp_path, raw_clustering):
+    store = EmbeddingStore(str(tmp_path), "fake")
+    add_story(db_session, store, "Budget vote passes", story_vectors(1, 8))
+    add_story(db_session, store, "Storm floods coast", story_vectors(2, 8, seed=1))
+    cluster_recent_articles(db_session, store, now=NOW)
+    topics_before = db_session.query(Topic).count()
+
+    later = NOW + datetime.timedelta(hours=1)
+    follow_up = add_story(db_session, store, "Budget reaction", story_vectors(1, 2, seed=2), created=later)
+    unrelated = add_story(db_session, store, "Cup final", story_vectors(3, 1, seed=3), created=later)
+    result = cluster_recent_articles(db_session, store, now=later)
+
+    assert not result.full
+    assert result.assigned == 2
+    assert db_session.query(Topic).count() == topics_before
+    assert story_topics(db_session, follow_up[0])[0].name == story_topics(db_session, follow_up[1])[0].name
+    assert story_topics(db_session, unrelated[0]) == []
+    budget_cluster = db_session.query(StoryCluster).filter(StoryCluster.size == 10).one()
+    assert "budget" in budget_cluster.topic.name
+
+
+def test_reclustering_keeps_story_topic(db_session, tmp_path, raw_clustering):
+    store = EmbeddingStore(str(tmp_path), "fake")
+    budget = add_story(db_session, store, "Budget vote passes", story_vectors(1, 8))
+    add_story(db_session, store, "Storm floods coast", story_vectors(2, 8, seed=1))
+    cluster_recent_articles(db_session, store, now=NOW)
+    topic_before = story_topics(db_session, budget[0])[0].id
+
+    later = NOW + datetime.timedelta(hours=1)
+    add_story(db_session, store, "Budget reaction", story_vectors(1, 4, seed=2), created=later)
+    result = cluster_recent_articles(db_session, store, now=later, force_full=True)
+
+    assert result.full
+    assert story_topics(db_session, budget[0])[0].id == topic_before
+    assert db_session.query(StoryCluster).filter(StoryCluster.active.is_(True)).count() == 2
+
+
+def non_story_topic_names(db_session, article):
+    db_session.refresh(article)
+    story_topic_ids = {topic_id for (topic_id,) in db_session.query(StoryCluster.topic_id)}
+    return [topic.name for topic in article.topics if topic.id not in story_topic_ids]
+
+
+def test_clustered_articles_still_get_their_feed_topic(db_session, tmp_path, raw_clustering):
+    store = EmbeddingStore(str(tmp_path), "fake")
+    budget = add_story(db_session, store, "Budget vote passes", story_vectors(1, 8))
+    add_story(db_session, store, "Storm floods coast", story_vectors(2, 8, seed=1))
+    cluster_recent_articles(db_session, store, now=NOW)
+    later = NOW + datetime.timedelta(hours=1)
+    (follow_up,) = add_story(db_session, store, "Budget reaction", story_vectors(1, 1, seed=2), created=later)
+    cluster_recent_articles(db_session, store, now=later)
+    for article in [*budget, follow_up]:
+        article.source_topic = "politics"
+    db_session.commit()
+    assert story_topics(db_session, follow_up)
+
+    infer_topics(db_session)
+
+    for article in [*budget, follow_up]:
+        assert non_story_topic_names(db_session, article) == ["politics"]
+        assert story_topics(db_session, article)
+
+
+def test_clustered_articles_are_still_tagged_by_embedding(db_session, tmp_path, raw_clustering, fake_encoder):
+    store = EmbeddingStore(str(tmp_path), "fake")
+    budget = add_story(db_session, store, "Budget vote passes", story_vectors(1, 8))
+    add_story(db_session, store, "Storm floods coast", story_vectors(2, 8, seed=1))
+    cluster_recent_articles(db_session, store, now=NOW)
+
+    infer_topics(db_session, encoder=fake_encoder)
+
+    assert all(non_story_topic_names(db_session, article) for article in budget)
+
+
+def test_active_stories_are_summarised_and_dropped_ones_hidden(db_session, tmp_path, raw_clustering):
+    store = EmbeddingStore(str(tmp_path), "fake")
+    budget = add_story(db_session, store, "Budget vote passes", story_vectors(1, 8))
+    storm = add_story(db_session, store, "Storm floods coast", story_vectors(2, 8, seed=1))
+    cluster_recent_articles(db_session, store, now=NOW)
+    for article in [*budget, *storm]:
+        article.summary = f"{article.title} in brief."
+    budget_topic, storm_topic = story_topics(db_session, budget[0])[0], story_topics(db_session, storm[0])[0]
+    db_session.query(StoryCluster).filter_by(topic_id=storm_topic.id).update({StoryCluster.active: False})
+    db_session.commit()
+
+    generate_daily_summary(db_session, FakeLLM("llama3.1:8b"), date=NOW - datetime.timedelta(days=1))
+
+    summarised = {topic_id for (topic_id,) in db_session.query(DailyTrendSummary.topic_id)}
+    assert budget_topic.id in summarised
+    assert storm_topic.id not in summarised
+
+    listed = {topic.id for topic in get_topics(session=db_session)}
+    assert budget_topic.id in listed
+    assert storm_topic.id not in listed
+
+
+def test_name_clusters_uses_distinctive_title_terms():
+    names = name_clusters([
+        ["Budget vote passes", "Budget row deepens", "New budget today"],
+        ["Storm hits coast", "Storm damage today"],
+    ])
+
+    assert names[0].startswith("budget")
+    assert names[1].startswith("storm")
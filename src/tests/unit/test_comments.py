@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+from sqlalchemy import event
+
+from db.models import Article, Comment
+from inference.comments import tag_comments
+from inference.sentiment import length_sorted_batches
+
+
+class KeywordClassifier:
+    model_name = "keywords"
+
+    def __init__(self, fail_after: int = None):
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def classify(self, texts):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise KeyboardInterrupt
+        return [
+            {"label": "negative" if "terrible" in text else "positive", "score": 0.9}
+            for text in texts
+        ]
+
+
+def add_comments(db_session, bodies):
+    article = db_session.query(Article).first()
+    comments = [
+        Comment(article=article, body=body, score=1, created=datetime.datetime(2026, 3, 1))
+        for body in bodies
+    ]
+    db_session.add_all(comments)
+    db_session.commit()
+    return comments
+
+
+def test_tag_comments(db_session, fake_encoder):
+    great, terrible = add_comments(db_session, ["Great health reporting", "A terrible take on business"])
+
+    result = tag_comments(db_session, KeywordClassifier(), fake_encoder)
+
+    assert result.tagged == 2
+    db_session.refresh(great)
+    db_session.refresh(terrible)
+    assert great.sentiment["label"] == "positive"
+    assert terrible.sentiment["label"] == "negative"
+    assert great.topics[0] == "health"
+    assert terrible.topics[0] == "business"
+
+
+def test_tag_comments_writes_one_bulk_update_per_chunk(db_session):
+    add_comments(db_session, [f"Comment {i}" for i in range(10)])
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        tag_comments(db_session, KeywordClassifier(), chunk_size=4)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+
+    updates = [statement for statement in statements if statement.startswith("UPDATE")]
+    assert len(updates) == 3
+    assert db_session.query(Comment).filter(Comment.sentiment.is_(None)).count() == 0
+
+
+def test_tag_comments_resumes_after_interrupt(db_session):
+    add_comments(db_session, [f"Comment {i}" for i in range(10)])
+
+    with pytest.raises(KeyboardInterrupt):
+        tag_comments(db_session, KeywordClassifier(fail_after=2), chunk_size=3)
+    assert db_session.query(Comment).filter(Comment.sentiment.isnot(None)).count() == 6
+
+    classifier = KeywordClassifier()
+    result = tag_comments(db_session, classifier, chunk_size=3)
+
+    assert result.tagged == 4
+    assert classifier.calls == 2
+    assert db_session.query(Comment).filter(Comment.sentiment.is_(None)).count() == 0
+
+
+def test_length_sorted_batches():
+    batches = length_sorted_batches([50, 3, 40, 2, 4], batch_size=2)
+
+    assert batches == [[3, 1], [4, 2], [0]]
@@ -0,0 +1,387 @@
+import datetime
+import os
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+import pytest
+
+import config
+from db.models import Article, SourceName
+from ingestion.content import extract_article_contents, parse_html, select_articles_to_extract, reextract_from_cache
+from ingestion.extractors import extract_content, get_extractor, NewspaperExtractor
+from ingestion.html_cache import HtmlCache
+from tests.conftest import SAMPLE_ARTICLE_HTML, SAMPLE_ARTICLE_TEXT
+
+
+def html_transport(pages, delay=0.0, on_request=None):
+    def handler(request):
+        if on_request:
+            on_request(request)
+        time.sleep(delay)
+        url = str(request.url)
+        if url not in pages:
+            return httpx.Response(404)
+        return httpx.Response(200, text=pages[url], headers={"Content-Type": "text/html"})
+
+    return httpx.MockTransport(handler)
+
+
+def test_parse_html_extracts_text():
+    result = parse_html(1, "https://example.com/article1", SAMPLE_ARTICLE_HTML)
+
+    assert result.error is None
+    assert "Ministers confirmed" in result.text
+    assert result.title == "Budget vote passes after late-night session"
+
+
+def test_extract_article_contents(db_session, fake_articles):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    pages = {article.url: SAMPLE_ARTICLE_HTML for article in fake_articles}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=1, commit_batch_size=1)
+
+    assert extracted == len(fake_articles)
+    for article in db_session.query(Article).all():
+        assert "Ministers confirmed" in article.text
+
+
+def test_extract_article_contents_in_process_pool(db_session, fake_articles):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    pages = {article.url: SAMPLE_ARTICLE_HTML for article in fake_articles}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=2)
+
+    assert extracted == len(fake_articles)
+    assert all(article.text for article in db_session.query(Article).all())
+
+
+def test_extraction_links_near_duplicates(db_session, fake_articles):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    # every article serves the same wire story
+    pages = {article.url: SAMPLE_ARTICLE_HTML for article in fake_articles}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extract_article_contents(db_session, client=client, parse_workers=1, commit_batch_size=1)
+
+    articles = db_session.query(Article).all()
+    # whichever copy was extracted first is the canonical one
+    (canonical,) = [article for article in articles if article.canonical_article_id is None]
+    assert all(article.canonical_article_id == canonical.id for article in articles if article is not canonical)
+
+
+def test_extract_article_contents_skips_failures(db_session, fake_articles):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    pages = {fake_articles[0].url: SAMPLE_ARTICLE_HTML}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=1)
+
+    assert extracted == 1
+    db_session.refresh(fake_articles[1])
+    assert fake_articles[1].text is None
+
+
+def test_extract_article_contents_limits_concurrency_per_domain(db_session, fake_source):
+    urls = [f"https://{host}/story-{i}" for host in ("a.test", "b.test") for i in range(4)]
+    db_session.add_all([Article(url=url, title=url, source=fake_source) for url in urls])
+    db_session.commit()
+
+    lock = threading.Lock()
+    in_flight = defaultdict(int)
+    peak = defaultdict(int)
+
+    def on_request(request):
+        with lock:
+            in_flight[request.url.host] += 1
+            peak[request.url.host] = max(peak[request.url.host], in_flight[request.url.host])
+        time.sleep(0.05)
+        with lock:
+            in_flight[request.url.host] -= 1
+
+    with httpx.Client(transport=html_transport({url: SAMPLE_ARTICLE_HTML for url in urls}, on_request=on_request)) as client:
+        extract_article_contents(db_session, client=client, parse_workers=1, download_workers=8, per_domain_limit=2)
+
+    assert peak["a.test"] == 2
+    assert peak["b.test"] == 2
+
+
+def test_work_queue_only_selects_articles_without_text(db_session, fake_source, fake_articles):
+    base = datetime.datetime(2026, 10, 18, 9, 0)
+    db_session.add_all([
+        Article(url="https://example.com/newer", source=fake_source, created=base + datetime.timedelta(hours=1)),
+        Article(url="https://example.com/older", source=fake_source, created=base),
+        Article(url="https://example.com/done", source=fake_source, created=base, text="Already extracted"),
+    ])
+    db_session.commit()
+
+    queue = list(select_articles_to_extract(db_session))
+
+    assert [row.url for row in queue] == ["https://example.com/older", "https://example.com/newer"]
+
+
+def test_work_queue_is_capped_per_run(db_session, fake_source):
+    db_session.add_all([Article(url=f"https://example.com/queued-{i}", source=fake_source) for i in range(5)])
+    db_session.commit()
+    pages = {f"https://example.com/queued-{i}": SAMPLE_ARTICLE_HTML for i in range(5)}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=1, limit=3)
+
+    assert extracted == 3
+    assert len(list(select_articles_to_extract(db_session))) == 2
+
+
+def test_html_cache_round_trip(tmp_path):
+    cache = HtmlCache(str(tmp_path))
+    cache.put("k1", "https://example.com/a", SAMPLE_ARTICLE_HTML, 200, "text/html")
+
+    page = cache.get("k1")
+    assert page.html == SAMPLE_ARTICLE_HTML
+    assert page.url == "https://example.com/a"
+    assert page.status_code == 200
+    assert "k1" in cache
+    assert cache.get("missing") is None
+
+    # the index survives reopening
+    cache.close()
+    assert HtmlCache(str(tmp_path)).get("k1").html == SAMPLE_ARTICLE_HTML
+
+
+def test_html_cache_packs_pages_into_few_files(tmp_path):
+    cache = HtmlCache(str(tmp_path), pack_max_bytes=1024)
+    for i in range(20):
+        cache.put(f"k{i}", f"https://example.com/{i}", f"<p>{i}</p>" + SAMPLE_ARTICLE_HTML)
+
+    packs = [name for name in os.listdir(tmp_path) if name.startswith("pack-")]
+    assert 1 < len(packs) < 20
+    assert len(cache) == 20
+    assert cache.get("k13").html.startswith("<p>13</p>")
+
+
+def test_html_cache_keeps_raw_bytes_and_encoding(tmp_path):
+    cache = HtmlCache(str(tmp_path))
+    cache.put("k1", "https://example.com/a", "<p>Café</p>".encode("latin-1"), encoding="iso-8859-1")
+
+    page = cache.get("k1")
+    assert page.content == b"<p>Caf\xe9</p>"
+    assert page.encoding == "iso-8859-1"
+    assert page.html == "<p>Café</p>"
+
+
+def test_html_cache_reclaims_space_of_rewritten_pages(tmp_path):
+    cache = HtmlCache(str(tmp_path), pack_max_bytes=4096)
+    latest = {}
+    for _ in range(50):
+        for i in range(5):
+            latest[f"k{i}"] = os.urandom(300)
+            cache.put(f"k{i}", f"https://example.com/{i}", latest[f"k{i}"])
+
+    pack_bytes = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path) if name.startswith("pack-"))
+    assert pack_bytes < 4 * 4096
+    assert all(cache.get(key).content == content for key, content in latest.items())
+
+
+def test_extraction_fills_and_reuses_html_cache(db_session, fake_articles, tmp_path):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    cache = HtmlCache(str(tmp_path))
+    pages = {article.url: SAMPLE_ARTICLE_HTML for article in fake_articles}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extract_article_contents(db_session, client=client, parse_workers=1, cache=cache)
+    assert len(cache) == len(fake_articles)
+
+    # second run with text cleared must not touch the network
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    with httpx.Client(transport=html_transport({}, on_request=lambda _: pytest.fail("should use the cache"))) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=1, cache=cache)
+    assert extracted == len(fake_articles)
+
+
+def test_retry_downloads_again_instead_of_using_html_cache(db_session, fake_articles, tmp_path):
+    paywall = "<html><body><div>Subscribe to continue reading</div></body></html>"
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    cache = HtmlCache(str(tmp_path))
+
+    with httpx.Client(transport=html_transport({article.url: paywall for article in fake_articles})) as client:
+        assert extract_article_contents(db_session, client=client, parse_workers=1, cache=cache) == 0
+
+    db_session.query(Article).update({Article.fetch_next_attempt_at: None})
+    db_session.commit()
+    pages = {article.url: SAMPLE_ARTICLE_HTML for article in fake_articles}
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=1, cache=cache)
+
+    assert extracted == len(fake_articles)
+    assert cache.get(fake_articles[0].url_hash).html == SAMPLE_ARTICLE_HTML
+
+
+def test_reextract_from_cache(db_session, fake_articles, tmp_path):
+    cache = HtmlCache(str(tmp_path))
+    cache.put(fake_articles[0].url_hash, fake_articles[0].url, SAMPLE_ARTICLE_HTML)
+
+    reextracted = reextract_from_cache(db_session, cache, parse_workers=1)
+
+    assert reextracted == 1
+    db_session.refresh(fake_articles[0])
+    db_session.refresh(fake_articles[1])
+    assert "Ministers confirmed" in fake_articles[0].text
+    assert fake_articles[1].text == SAMPLE_ARTICLE_TEXT
+
+
+def test_reextract_leaves_fetch_state_alone(db_session, fake_articles, tmp_path):
+    retry_at = datetime.datetime(2026, 10, 18, 12, 0)
+    db_session.query(Article).filter_by(id=fake_articles[0].id).update(
+        {Article.fetch_attempts: 2, Article.fetch_error: "HTTP503", Article.fetch_next_attempt_at: retry_at},
+    )
+    db_session.commit()
+    cache = HtmlCache(str(tmp_path))
+    cache.put(fake_articles[0].url_hash, fake_articles[0].url, SAMPLE_ARTICLE_HTML)
+
+    assert reextract_from_cache(db_session, cache, parse_workers=1) == 1
+
+    db_session.refresh(fake_articles[0])
+    assert "Ministers confirmed" in fake_articles[0].text
+    assert fake_articles[0].fetch_attempts == 2
+    assert fake_articles[0].fetch_error == "HTTP503"
+    assert fake_articles[0].fetch_next_attempt_at == retry_at
+
+
+def test_cached_pages_are_parsed_in_process_pool(db_session, fake_articles, tmp_path):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    cache = HtmlCache(str(tmp_path))
+    for article in fake_articles:
+        cache.put(article.url_hash, article.url, SAMPLE_ARTICLE_HTML)
+
+    with httpx.Client(transport=html_transport({}, on_request=lambda _: pytest.fail("should use the cache"))) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=2, cache=cache)
+
+    assert extracted == len(fake_articles)
+
+
+def read_fixture(name):
+    with open(os.path.join(os.path.dirname(__file__), "..", "fixtures", "html", name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("fixture, source_name, first_sentence", [
+    ("bbc_article.html", SourceName.BBC, "The Bank of England has kept interest rates at 4%"),
+    ("guardian_article.html", SourceName.THE_GUARDIAN, "The waiting list for routine hospital treatment"),
+])
+def test_lean_extractor_for_known_sources(fixture, source_name, first_sentence, monkeypatch):
+    monkeypatch.setattr(NewspaperExtractor, "extract", lambda *args: pytest.fail("should not fall back"))
+
+    content = extract_content("https://example.com/a", read_fixture(fixture), source_name)
+
+    assert content.text.startswith(first_sentence)
+    assert content.title
+    # navigation, captions, related links and footers are left out
+    assert "Copyright" not in content.text and "©" not in content.text
+    assert "Related" not in content.text and "Most viewed" not in content.text
+    assert len(content.text.split("\n\n")) >= 5
+
+
+def test_unknown_layout_falls_back_to_newspaper():
+    html = read_fixture("other_article.html")
+
+    assert isinstance(get_extractor(None), NewspaperExtractor)
+    assert "laptop processor" in extract_content("https://example.com/a", html).text
+    # the page has no <article>, so the BBC extractor finds nothing and newspaper takes over
+    assert "laptop processor" in extract_content("https://example.com/a", html, SourceName.BBC).text
+
+
+def test_not_found_is_a_permanent_failure(db_session, fake_articles):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+
+    with httpx.Client(transport=html_transport({fake_articles[0].url: SAMPLE_ARTICLE_HTML})) as client:
+        extract_article_contents(db_session, client=client, parse_workers=1)
+
+    missing = db_session.query(Article).filter_by(url=fake_articles[1].url).one()
+    assert missing.fetch_attempts == 1
+    assert missing.fetch_error == "HTTP404"
+    assert missing.fetch_failed_permanently
+    assert [row.id for row in select_articles_to_extract(db_session)] == []
+
+
+@pytest.mark.parametrize("bad_url", ["https://example.com/\x00article", "https://[example.com/article"])
+def test_invalid_url_is_a_permanent_failure(db_session, fake_articles, bad_url):
+    db_session.query(Article).update({Article.text: None})
+    db_session.query(Article).filter_by(id=fake_articles[0].id).update({Article.url: bad_url, Article.url_hash: None})
+    db_session.commit()
+    pages = {article.url: SAMPLE_ARTICLE_HTML for article in fake_articles[1:]}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=1)
+
+    assert extracted == len(fake_articles) - 1
+    db_session.refresh(fake_articles[0])
+    assert fake_articles[0].fetch_error == "InvalidURL"
+    assert fake_articles[0].fetch_failed_permanently
+
+
+def test_transient_failure_backs_off_exponentially(db_session, fake_articles):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    article = db_session.query(Article).filter_by(url=fake_articles[0].url).one()
+    unavailable = httpx.MockTransport(lambda request: httpx.Response(503))
+
+    with httpx.Client(transport=unavailable) as client:
+        extract_article_contents(db_session, client=client, parse_workers=1)
+    db_session.refresh(article)
+    first_delay = article.fetch_next_attempt_at - datetime.datetime.utcnow()
+    assert article.fetch_error == "HTTP503"
+    assert not article.fetch_failed_permanently
+
+    # not eligible again until the backoff has passed
+    assert article.id not in [row.id for row in select_articles_to_extract(db_session)]
+    later = article.fetch_next_attempt_at + datetime.timedelta(seconds=1)
+    assert article.id in [row.id for row in select_articles_to_extract(db_session, now=later)]
+
+    db_session.query(Article).update({Article.fetch_next_attempt_at: None})
+    db_session.commit()
+    with httpx.Client(transport=unavailable) as client:
+        extract_article_contents(db_session, client=client, parse_workers=1)
+    db_session.refresh(article)
+    assert article.fetch_attempts == 2
+    assert article.fetch_next_attempt_at - datetime.datetime.utcnow() > first_delay * 1.9
+
+
+def test_article_is_given_up_after_max_attempts(db_session, fake_articles):
+    db_session.query(Article).update({
+        Article.text: None,
+        Article.fetch_attempts: config.settings.EXTRACTION_MAX_ATTEMPTS - 1,
+    })
+    db_session.commit()
+
+    with httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(503))) as client:
+        extract_article_contents(db_session, client=client, parse_workers=1)
+
+    for article in db_session.query(Article).all():
+        assert article.fetch_failed_permanently
+        assert article.fetch_next_attempt_at is None
+
+
+def test_empty_extraction_counts_as_failure(db_session, fake_articles, monkeypatch):
+    db_session.query(Article).update({Article.text: None})
+    db_session.commit()
+    pages = {article.url: "<html><body><div>Subscribe to continue reading</div></body></html>" for article in fake_articles}
+
+    with httpx.Client(transport=html_transport(pages)) as client:
+        extracted = extract_article_contents(db_session, client=client, parse_workers=1)
+
+    assert extracted == 0
+    for article in db_session.query(Article).all():
+        assert article.text is None
+        assert article.fetch_error == "EmptyText"
@@ -0,0 +1,84 @@
+from sqlalchemy import update
+
+from db.models import Article, Source, article_minhash_bucket
+from ingestion.dedup import (
+    band_buckets, index_missing_signatures, index_near_duplicates, minhash_signature, signature_bytes, similarity,
+)
+
+WIRE_STORY = " ".join(
+    f"Paragraph {i} of the wire story says the central bank held interest rates at five percent "
+    f"while officials signalled that cuts could follow later in the year if inflation keeps easing."
+    for i in range(8)
+)
+EDITED_COPY = "Updated 10:42. " + WIRE_STORY.replace("officials signalled", "officials hinted", 1)
+OTHER_STORY = " ".join(
+    f"Section {i}: heavy rain flooded coastal towns overnight and forced hundreds of residents "
+    f"to leave their homes as rivers burst their banks across the region."
+    for i in range(8)
+)
+
+
+def add_articles(db_session, texts):
+    source = db_session.query(Source).first()
+    start = db_session.query(Article).count()
+    articles = [
+        Article(title=f"Article {i}", url=f"https://example.com/dedup-{i}", text=text, source=source)
+        for i, text in enumerate(texts, start)
+    ]
+    db_session.add_all(articles)
+    db_session.commit()
+    return articles
+
+
+def test_signature_similarity_tracks_text_overlap():
+    assert similarity(minhash_signature(WIRE_STORY), minhash_signature(EDITED_COPY)) > 0.8
+    assert similarity(minhash_signature(WIRE_STORY), minhash_signature(OTHER_STORY)) < 0.1
+
+
+def test_buckets_are_per_band():
+    signature = minhash_signature(WIRE_STORY)
+
+    buckets = band_buckets(signature)
+
+    assert len(buckets) == len(set(buckets))
+    assert buckets == band_buckets(minhash_signature(WIRE_STORY))
+
+
+def test_near_duplicates_link_to_the_oldest_copy(db_session):
+    original, edited, other = add_articles(db_session, [WIRE_STORY, EDITED_COPY, OTHER_STORY])
+
+    index_missing_signatures(db_session)
+
+    for article in (original, edited, other):
+        db_session.refresh(article)
+    assert original.canonical_article_id is None
+    assert edited.canonical_article_id == original.id
+    assert other.canonical_article_id is None
+
+
+def test_duplicate_of_a_duplicate_links_to_the_canonical_article(db_session):
+    original, edited = add_articles(db_session, [WIRE_STORY, EDITED_COPY])
+    index_missing_signatures(db_session)
+
+    # only similar to the edited copy, which is itself a duplicate
+    (third,) = add_articles(db_session, [EDITED_COPY.replace("Updated 10:42.", "Updated 11:05.")])
+    index_missing_signatures(db_session)
+
+    db_session.refresh(third)
+    assert third.canonical_article_id == original.id
+
+
+def test_reindexing_replaces_buckets_and_link(db_session):
+    original, edited = add_articles(db_session, [WIRE_STORY, EDITED_COPY])
+    index_missing_signatures(db_session)
+
+    # the copy was re-extracted and turned out to be a different story
+    signature = signature_bytes(OTHER_STORY)
+    db_session.execute(update(Article), [{"id": edited.id, "text": OTHER_STORY, "minhash": signature}])
+    index_near_duplicates(db_session, {edited.id: signature})
+    db_session.commit()
+
+    db_session.refresh(edited)
+    assert edited.canonical_article_id is None
+    buckets = db_session.query(article_minhash_bucket).filter_by(article_id=edited.id).all()
+    assert sorted(bucket for bucket, _ in buckets) == sorted(band_buckets(minhash_signature(OTHER_STORY)))
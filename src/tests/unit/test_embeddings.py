@@ -0,0 +1,185 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import config
+
+from db.models import Article, Source
+from embeddings import ann
+from embeddings.ann import get_related_index, load_related_index, update_related_index
+from embeddings.main import embed_articles
+from embeddings.store import EmbeddingStore
+from inference.main import infer_topics_by_embedding
+
+
+def random_unit_vectors(count, dimensions=8, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_store_round_trip_is_memory_mapped(tmp_path):
+    vectors = random_unit_vectors(3)
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    assert store.add([30, 10, 20], vectors) == 3
+
+    reader = EmbeddingStore(str(tmp_path))
+
+    assert reader.model_name == "model-a"
+    assert isinstance(reader.vectors, np.memmap)
+    assert reader.vectors.dtype == np.float16
+    np.testing.assert_allclose(reader.get([10, 30]), vectors[[1, 0]], atol=1e-3)
+    assert reader.contains([10, 40]).tolist() == [True, False]
+    with pytest.raises(KeyError):
+        reader.get([40])
+
+
+def test_store_int8(tmp_path):
+    vectors = random_unit_vectors(2)
+    store = EmbeddingStore(str(tmp_path), "model-a", dtype="int8")
+    store.add([1, 2], vectors)
+
+    assert store.vectors.dtype == np.int8
+    np.testing.assert_allclose(store.get([1, 2]), vectors, atol=1 / 127)
+
+
+def test_store_skips_ids_already_stored(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    store.add([1, 2], random_unit_vectors(2))
+
+    assert store.add([2, 3, 3], random_unit_vectors(3, seed=1)) == 1
+    assert sorted(store.ids.tolist()) == [1, 2, 3]
+
+
+def test_model_change_resets_store(tmp_path):
+    EmbeddingStore(str(tmp_path), "model-a").add([1], random_unit_vectors(1))
+
+    store = EmbeddingStore(str(tmp_path), "model-b")
+
+    assert len(store) == 0
+    assert EmbeddingStore(str(tmp_path)).model_name == "model-b"
+
+
+def test_model_change_keeps_open_readers_working(tmp_path):
+    vectors = random_unit_vectors(3)
+    EmbeddingStore(str(tmp_path), "model-a").add([1, 2, 3], vectors)
+    reader = EmbeddingStore(str(tmp_path))
+
+    EmbeddingStore(str(tmp_path), "model-b")
+
+    # the reader still maps the old files until it refreshes
+    assert np.allclose(reader.get([3]), vectors[2:], atol=1e-2)
+    reader.refresh()
+    assert len(reader) == 0
+
+
+def test_store_ignores_partially_written_row(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    store.add([1], random_unit_vectors(1))
+    # a crash between writing the vector and the id
+    with open(os.path.join(tmp_path, "vectors.bin"), "ab") as vectors_file:
+        vectors_file.write(random_unit_vectors(1).astype(np.float16).tobytes())
+
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    assert len(store) == 1
+    store.add([2], random_unit_vectors(1, seed=1))
+    assert store.ids.tolist() == [1, 2]
+    np.testing.assert_allclose(store.get([2]), random_unit_vectors(1, seed=1), atol=1e-3)
+
+
+def test_embed_articles_only_encodes_new_articles_with_text(db_session, fake_encoder, tmp_path):
+    source = db_session.query(Source).first()
+    with_text = Article(title="Rates rise", text="The bank raised rates.", url="https://example.com/rates", source=source)
+    without_text = Article(title="Title only", url="https://example.com/title", source=source)
+    db_session.add_all([with_text, without_text])
+    db_session.commit()
+    store = EmbeddingStore(str(tmp_path), fake_encoder.model_name)
+    articles_with_text = db_session.query(Article).filter(Article.text.isnot(None)).count()
+
+    assert embed_articles(db_session, fake_encoder, store) == articles_with_text
+    assert embed_articles(db_session, fake_encoder, store) == 0
+
+    assert store.contains([with_text.id, without_text.id]).tolist() == [True, False]
+    assert len(fake_encoder.encoded) == articles_with_text
+
+
+def test_embedding_inference_reuses_stored_vectors(db_session, fake_encoder, tmp_path):
+    source = db_session.query(Source).first()
+    article = Article(title="Markets", text="Business news from the markets.", url="https://example.com/m", source=source)
+    db_session.add(article)
+    db_session.commit()
+    store = EmbeddingStore(str(tmp_path), fake_encoder.model_name)
+    embed_articles(db_session, fake_encoder, store)
+    fake_encoder.encoded.clear()
+
+    infer_topics_by_embedding(db_session, fake_encoder, store=store)
+
+    # only the topic centroids were encoded
+    assert all(text.startswith("News about") for text in fake_encoder.encoded)
+    db_session.refresh(article)
+    assert [topic.name for topic in article.topics] == ["business"]
+
+
+def test_related_index_finds_closest_articles(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    base = random_unit_vectors(1)[0]
+    near = base + 0.1 * random_unit_vectors(1, seed=1)[0]
+    store.add([1, 2, 3], np.stack([base, random_unit_vectors(1, seed=2)[0], near]))
+
+    index = update_related_index(store)
+
+    assert index.related(1, 2) == [3, 2]
+    assert index.related(42, 2) == []
+
+
+def test_related_index_searches_rows_added_after_it_was_built(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    store.add([1, 2], random_unit_vectors(2))
+    update_related_index(store)
+    store.add([3], random_unit_vectors(1)[:1] * 0.99 + 0.01)
+
+    index = load_related_index(str(tmp_path))
+
+    assert index.rows == 2
+    assert index.related(1, 1) == [3]
+
+
+def test_related_index_ann(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    vectors = random_unit_vectors(300, dimensions=16)
+    store.add(range(1, 301), vectors)
+
+    built = update_related_index(store, min_rows=0)
+    store.add([301], vectors[:1] * 0.99 + 0.01)
+    extended = update_related_index(store, min_rows=0)
+
+    assert built.ann is not None and extended.rows == 301
+    exact = np.argsort(-(vectors @ vectors[0]))[1:6] + 1
+    assert extended.related(1, 5)[0] == 301
+    assert len(set(extended.related(1, 6)[1:]) & set(exact.tolist())) >= 4
+
+
+def test_api_reloads_a_rewritten_index_after_the_reload_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.settings, "EMBEDDING_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(config.settings, "RELATED_INDEX_RELOAD_INTERVAL", 3600)
+    monkeypatch.setattr(ann, "_loaded", {"store_dir": None, "mtime": None, "index": None, "checked": None})
+    store = EmbeddingStore(str(tmp_path), "model-a")
+    store.add([1, 2], random_unit_vectors(2))
+    update_related_index(store)
+
+    threads_saw = []
+    threads = [threading.Thread(target=lambda: threads_saw.append(get_related_index())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    loaded = get_related_index()
+    assert loaded.rows == 2 and all(index is loaded for index in threads_saw)
+
+    store.add([3], random_unit_vectors(1, seed=1))
+    update_related_index(store)
+    assert get_related_index() is loaded  # not looked at again within the interval
+
+    monkeypatch.setattr(config.settings, "RELATED_INDEX_RELOAD_INTERVAL", 0)
+    assert get_related_index().rows == 3
@@ -0,0 +1,57 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from summary.main import packed_summary_request, parse_packed_summaries
+
+
+def post_chat(url: str, request: dict):
+    http_request = urllib.request.Request(
+        f"{url}/api/chat", data=json.dumps(request).encode(), headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(http_request) as response:
+        return [json.loads(line) for line in response.read().decode().splitlines()]
+
+
+@pytest.fixture
+def fake_ollama():
+    with FakeOllamaServer(latency=0.001, latency_sigma=0.5, tokens_per_second=10_000) as server:
+        yield server
+
+
+def test_chat_answers_like_ollama(fake_ollama):
+    messages = [{"role": "user", "content": "Summarize the following article.\n\nThe council approved a new bridge."}]
+
+    (response,) = post_chat(fake_ollama.url, {"model": "llama3.1:8b", "messages": messages, "stream": False})
+
+    assert response["done"] and response["model"] == "llama3.1:8b"
+    assert response["message"] == {"role": "assistant", "content": "The council approved a new bridge."}
+    assert response["eval_count"] > 0
+    assert fake_ollama.requests == 1
+
+
+def test_packed_requests_get_one_summary_per_article(fake_ollama):
+    request = packed_summary_request(["First story.\nMore.", "Second story.\nMore."])
+
+    (response,) = post_chat(fake_ollama.url, {"model": "llama3.1:8b", "messages": request, "stream": False})
+
+    assert parse_packed_summaries(response["message"]["content"], 2) == ["First story.", "Second story."]
+
+
+def test_streamed_replies_end_with_a_done_line(fake_ollama):
+    lines = post_chat(fake_ollama.url, {"model": "llama3.1:8b", "messages": [{"role": "user", "content": "a b c"}]})
+
+    assert [line["done"] for line in lines] == [False] * 3 + [True]
+    assert "".join(line["message"]["content"] for line in lines) == "a b c."
+
+
+def test_simulated_errors():
+    with FakeOllamaServer(error_rate=1.0) as server:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_chat(server.url, {"model": "llama3.1:8b", "messages": [], "stream": False})
+
+    assert error.value.code == 500
+    assert server.errors == 1
@@ -1,5 +1,9 @@
+import numpy as np
+from sqlalchemy import event
+
 from db.models import Article, Topic, Source
-from inference.main import infer_topics
+from embeddings.store import EmbeddingStore
+from inference.main import infer_topics, infer_topics_by_embedding, assign_topics, topic_centroids
 
 
 def test_topic_inference(db_session):
@@ -67,3 +71,148 @@ def test_existing_topic_is_reused(db_session):
 
 
     assert article.topics[0].id == topic.id
+
+
+def test_topic_inference_creates_missing_topic(db_session):
+    source = db_session.query(Source).first()
+    article = Article(title="New vaccine approved", source_topic="science", source=source)
+    db_session.add(article)
+    db_session.commit()
+
+    infer_topics(db_session)
+
+    db_session.refresh(article)
+    assert [topic.name for topic in article.topics] == ["science"]
+    assert db_session.query(Topic).filter_by(name="science").count() == 1
+
+
+def test_topic_inference_query_count_does_not_grow_with_articles(db_session):
+    source = db_session.query(Source).first()
+    db_session.add_all([
+        Article(title=f"Story {i}", url=f"https://example.com/story-{i}", source_topic=topic, source=source)
+        for i, topic in enumerate(["technology", "politics", "business", "health"] * 25)
+    ])
+    db_session.commit()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        infer_topics(db_session)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+
+    # topic map + work queue + one bulk insert, not one query per article
+    assert len(statements) <= 4
+    untagged = db_session.query(Article).filter(~Article.topics.any()).count()
+    assert untagged == 0
+
+
+def test_embedding_inference_assigns_most_similar_topic(db_session, fake_encoder):
+    source = db_session.query(Source).first()
+    article = Article(
+        title="Health officials warn of flu season",
+        text="Hospitals expect a busy winter, health experts said.",
+        url="https://example.com/flu",
+        source_topic="technology",
+        source=source,
+    )
+    db_session.add(article)
+    db_session.commit()
+
+    infer_topics(db_session, encoder=fake_encoder)
+
+    db_session.refresh(article)
+    assert [topic.name for topic in article.topics] == ["health"]
+
+
+def test_embedding_inference_does_not_reencode_tagged_articles(db_session, fake_encoder):
+    source = db_session.query(Source).first()
+    db_session.add_all([
+        Article(title=f"Business story {i}", url=f"https://example.com/business-{i}", source=source,
+                text=f"Business story {i} in full.")
+        for i in range(5)
+    ])
+    db_session.commit()
+
+    assert infer_topics_by_embedding(db_session, fake_encoder, batch_size=2) == 5
+    encoded = len(fake_encoder.encoded)
+
+    assert infer_topics_by_embedding(db_session, fake_encoder, batch_size=2) == 0
+    # only the topic centroids are encoded again
+    assert len(fake_encoder.encoded) - encoded == db_session.query(Topic).count()
+    assert db_session.query(Article).filter(~Article.topics.any()).count() == 0
+
+
+def test_embedding_inference_waits_for_extracted_text(db_session, fake_encoder):
+    source = db_session.query(Source).first()
+    pending = Article(title="Business story", url="https://example.com/pending", source=source)
+    given_up = Article(title="Business story", url="https://example.com/gone", source=source,
+                       fetch_failed_permanently=True)
+    db_session.add_all([pending, given_up])
+    db_session.commit()
+
+    assert infer_topics_by_embedding(db_session, fake_encoder) == 1
+    assert not pending.topics and given_up.topics
+
+    pending.text = "The business story in full."
+    db_session.commit()
+    assert infer_topics_by_embedding(db_session, fake_encoder) == 1
+    db_session.refresh(pending)
+    assert pending.topics
+
+
+def unit_vectors(count, dimensions, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_topic_centroids_average_the_stored_embeddings_of_tagged_articles(db_session, fake_encoder, tmp_path):
+    source = db_session.query(Source).first()
+    health = db_session.query(Topic).filter_by(name="health").one()
+    articles = [Article(title=f"Clinic {i}", url=f"https://example.com/clinic-{i}", source=source) for i in range(2)]
+    for article in articles:
+        article.topics.append(health)
+    db_session.add_all(articles)
+    db_session.commit()
+    store = EmbeddingStore(str(tmp_path), fake_encoder.model_name)
+    vectors = unit_vectors(2, fake_encoder.dimensions)
+    store.add([article.id for article in articles], vectors)
+
+    topic_ids, centroids = topic_centroids(db_session, fake_encoder, store)
+
+    expected = vectors.mean(axis=0) / np.linalg.norm(vectors.mean(axis=0))
+    assert np.allclose(centroids[topic_ids.index(health.id)], expected, atol=1e-2)
+    # topics without embedded articles fall back to their name
+    assert "News about health" not in fake_encoder.encoded
+    assert "News about business" in fake_encoder.encoded
+
+
+def test_embedding_inference_matches_articles_to_tagged_ones(db_session, fake_encoder, tmp_path):
+    source = db_session.query(Source).first()
+    health = db_session.query(Topic).filter_by(name="health").one()
+    tagged = Article(title="Clinic", url="https://example.com/clinic", source=source, topics=[health])
+    # nothing in the title points to health, only the stored embedding does
+    untagged = Article(title="Business markets update", url="https://example.com/update", source=source,
+                       text="Markets moved.")
+    db_session.add_all([tagged, untagged])
+    db_session.commit()
+    store = EmbeddingStore(str(tmp_path), fake_encoder.model_name)
+    vector = unit_vectors(1, fake_encoder.dimensions)
+    store.add([tagged.id, untagged.id], np.vstack([vector, vector]))
+
+    infer_topics_by_embedding(db_session, fake_encoder, store=store)
+
+    db_session.refresh(untagged)
+    assert [topic.name for topic in untagged.topics] == ["health"]
+
+
+def test_assign_topics_keeps_best_and_those_above_threshold():
+    similarities = np.array([
+        [0.1, 0.9, 0.5],
+        [0.05, 0.1, 0.2],
+    ])
+
+    assignments = list(assign_topics(similarities, threshold=0.4, max_topics=2))
+
+    assert [list(columns) for columns in assignments] == [[1, 2], [2]]
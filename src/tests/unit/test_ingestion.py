@@ -1,11 +1,27 @@
+import datetime
+import random
+import threading
+import time
+from collections import defaultdict
+
 import feedparser
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
 
-from db.models import Article, FeedType
-from ingestion.main import fetch_rss_entries
+import config
+from common.urls import canonicalize_url, url_hash
+from db.connection import Base
+from db.models import Article, Feed, FeedType
+from ingestion import main as ingestion_main, scheduler
+from ingestion.fetch import FeedResponse, download_feeds, conditional_headers
+from ingestion.main import fetch_rss_entries, save_articles
+from ingestion.scheduler import update_publish_rate, next_poll_interval, schedule_next_poll, poll_due_feeds, poll_or_retry
 from tests.conftest import FakeFeedData
 
 
-def test_new_articles(db_session, fake_source, monkeypatch):
+def test_new_articles(db_session, fake_source, fake_feed_download, monkeypatch):
     fake_entries = [
         {"link": "https://example.com/a1", "title": "Article 1"},
         {"link": "https://example.com/a2", "title": "Article 2"},
@@ -33,7 +49,7 @@ def test_new_articles(db_session, fake_source, monkeypatch):
         assert article.source_topic == FeedType.POLITICS.value
 
 
-def test_new_articles_skips_duplicates(db_session, fake_source, monkeypatch):
+def test_new_articles_skips_duplicates(db_session, fake_source, fake_feed_download, monkeypatch):
     existing = Article(
         url="https://example.com/a1",
         title="Existing",
@@ -57,3 +73,323 @@ def test_new_articles_skips_duplicates(db_session, fake_source, monkeypatch):
     articles = fetch_rss_entries(db_session)
 
     assert articles == []
+
+
+def test_failed_feed_download_is_skipped(db_session, monkeypatch):
+    monkeypatch.setattr(
+        ingestion_main,
+        "download_feeds",
+        lambda urls, **kwargs: {url: FeedResponse(url=url, error="ConnectError: unreachable") for url in urls},
+    )
+    monkeypatch.setattr(feedparser, "parse", lambda _: pytest.fail("failed feeds should not be parsed"))
+
+    assert fetch_rss_entries(db_session) == []
+
+
+def test_unchanged_feed_is_not_parsed(db_session, fake_source, monkeypatch):
+    calls = []
+
+    def fake_download(urls, headers=None, **kwargs):
+        calls.append(headers)
+        return {
+            url: FeedResponse(url=url, content=b"<rss>same</rss>", status_code=200, etag='"v1"')
+            for url in urls
+        }
+
+    parsed = []
+
+    def fake_parse(content):
+        parsed.append(content)
+        return FakeFeedData([{"link": "https://example.com/a1", "title": "Article 1"}])
+
+    monkeypatch.setattr(ingestion_main, "download_feeds", fake_download)
+    monkeypatch.setattr(feedparser, "parse", fake_parse)
+
+    assert len(fetch_rss_entries(db_session)) == 1
+    feed = fake_source.feeds[0]
+    assert feed.etag == '"v1"'
+    assert feed.content_hash
+
+    # same body on the second poll: no parse, no new articles
+    assert fetch_rss_entries(db_session) == []
+    assert len(parsed) == 1
+    assert calls[1] == {feed.url: {"If-None-Match": '"v1"'}}
+
+
+def test_not_modified_feed_is_skipped(db_session, fake_source, monkeypatch):
+    fake_source.feeds[0].etag = '"v1"'
+    fake_source.feeds[0].content_hash = "abc"
+    monkeypatch.setattr(
+        ingestion_main,
+        "download_feeds",
+        lambda urls, **kwargs: {url: FeedResponse(url=url, status_code=304) for url in urls},
+    )
+    monkeypatch.setattr(feedparser, "parse", lambda _: pytest.fail("unchanged feeds should not be parsed"))
+
+    assert fetch_rss_entries(db_session) == []
+    assert fake_source.feeds[0].etag == '"v1"'
+    assert fake_source.feeds[0].content_hash == "abc"
+
+
+def test_download_feeds_sends_conditional_headers():
+    def handler(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=b"<rss/>", headers={"ETag": '"v1"', "Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT"})
+
+    url = "https://feeds.test/rss"
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        first = download_feeds([url], client=client)[url]
+        second = download_feeds(
+            [url],
+            headers={url: conditional_headers(first.etag, first.last_modified)},
+            client=client,
+        )[url]
+
+    assert first.content == b"<rss/>"
+    assert first.last_modified == "Sat, 17 Oct 2026 10:00:00 GMT"
+    assert second.not_modified
+    assert second.content is None
+    assert second.error is None
+
+
+def test_download_feeds_in_parallel():
+    def handler(request):
+        return httpx.Response(200, content=request.url.path.encode())
+
+    urls = [f"https://feeds.test/{i}" for i in range(5)]
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        responses = download_feeds(urls, client=client)
+
+    assert set(responses) == set(urls)
+    for i, url in enumerate(urls):
+        assert responses[url].content == f"/{i}".encode()
+        assert responses[url].error is None
+
+
+def test_download_feeds_limits_concurrency_per_host():
+    lock = threading.Lock()
+    in_flight = defaultdict(int)
+    peak = defaultdict(int)
+
+    def handler(request):
+        host = request.url.host
+        with lock:
+            in_flight[host] += 1
+            peak[host] = max(peak[host], in_flight[host])
+        time.sleep(0.05)
+        with lock:
+            in_flight[host] -= 1
+        return httpx.Response(200, content=b"ok")
+
+    urls = [f"https://{host}/{i}" for host in ("a.test", "b.test") for i in range(6)]
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        download_feeds(urls, client=client, max_workers=12, per_host_limit=2)
+
+    assert peak == {"a.test": 2, "b.test": 2}
+
+
+def test_download_feeds_total_timeout_does_not_wait_for_slow_feed():
+    def handler(request):
+        if request.url.host == "slow.test":
+            time.sleep(1)
+        return httpx.Response(200, content=b"ok")
+
+    start = time.monotonic()
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        responses = download_feeds(
+            ["https://fast.test/rss", "https://slow.test/rss"],
+            client=client,
+            total_timeout=0.2,
+        )
+
+    assert time.monotonic() - start < 1
+    assert responses["https://fast.test/rss"].content == b"ok"
+    assert responses["https://slow.test/rss"].content is None
+    assert responses["https://slow.test/rss"].error
+
+
+def test_download_feeds_reports_http_errors():
+    with httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(503))) as client:
+        responses = download_feeds(["https://feeds.test/rss"], client=client)
+
+    assert responses["https://feeds.test/rss"].content is None
+    assert "503" in responses["https://feeds.test/rss"].error
+
+
+def test_same_url_in_several_feeds_is_collapsed(db_session, fake_source, fake_feed_download, monkeypatch):
+    fake_source.feeds.append(Feed(url="https://feed2.test", feed_type=FeedType.BUSINESS))
+    db_session.commit()
+
+    monkeypatch.setattr(
+        feedparser,
+        "parse",
+        lambda _: FakeFeedData([{"link": "https://example.com/shared", "title": "Shared story"}]),
+    )
+
+    articles = fetch_rss_entries(db_session)
+
+    assert [a.url for a in articles] == ["https://example.com/shared"]
+    assert articles[0].source_topic == FeedType.POLITICS.value
+
+
+def test_save_articles_bulk_inserts(db_session, fake_source):
+    before = db_session.query(Article).count()
+    articles = [
+        Article(url=f"https://example.com/bulk{i}", title=f"Bulk {i}", source_topic="politics", source=fake_source)
+        for i in range(3)
+    ]
+
+    save_articles(articles, db_session)
+
+    assert db_session.query(Article).count() == before + 3
+    stored = db_session.query(Article).filter_by(url="https://example.com/bulk1").one()
+    assert stored.title == "Bulk 1"
+    assert stored.source_id == fake_source.id
+    assert stored.created is not None
+
+
+def test_save_articles_ignores_urls_already_stored(db_session, fake_source, fake_articles):
+    before = db_session.query(Article).count()
+    articles = [
+        Article(url=fake_articles[0].url, title="Inserted by a concurrent run", source=fake_source),
+        Article(url="https://example.com/fresh", title="Fresh", source=fake_source),
+    ]
+
+    save_articles(articles, db_session)
+
+    assert db_session.query(Article).count() == before + 1
+    assert db_session.query(Article).filter_by(url=fake_articles[0].url).one().title == fake_articles[0].title
+
+
+@pytest.mark.parametrize("url", [
+    "http://www.bbc.co.uk/news/articles/c1?at_medium=RSS&at_campaign=rss",
+    "https://WWW.BBC.CO.UK/news/articles/c1/",
+    "https://www.bbc.co.uk:443/news/articles/c1#comments",
+    "https://www.bbc.co.uk/news/articles/c1?utm_source=twitter",
+])
+def test_canonicalize_url_drops_noise(url):
+    assert canonicalize_url(url) == "https://www.bbc.co.uk/news/articles/c1"
+    assert url_hash(url) == url_hash("https://www.bbc.co.uk/news/articles/c1")
+
+
+def test_canonicalize_url_keeps_meaningful_query():
+    assert canonicalize_url("https://example.com/search?q=tax&page=2&CMP=share") == "https://example.com/search?page=2&q=tax"
+    assert url_hash("https://example.com/a?id=1") != url_hash("https://example.com/a?id=2")
+
+
+def test_new_articles_skips_canonical_duplicates(db_session, fake_feed_download, monkeypatch):
+    monkeypatch.setattr(
+        feedparser,
+        "parse",
+        lambda _: FakeFeedData([
+            {"link": "http://example.com/article1/?utm_medium=rss", "title": "Same as fixture"},
+            {"link": "https://example.com/a3?CMP=share_btn", "title": "New"},
+            {"link": "https://example.com/a3", "title": "New, without tracking"},
+        ]),
+    )
+
+    articles = fetch_rss_entries(db_session)
+
+    assert [a.title for a in articles] == ["New"]
+    assert articles[0].url_hash == url_hash("https://example.com/a3")
+
+
+def test_busy_feed_is_polled_more_often_than_quiet_feed():
+    now = datetime.datetime(2026, 10, 18, 12, 0)
+    busy = Feed(url="https://busy.test", last_polled_at=now - datetime.timedelta(hours=1), publish_rate=10)
+    quiet = Feed(url="https://quiet.test", last_polled_at=now - datetime.timedelta(hours=1), publish_rate=0.5)
+
+    update_publish_rate(busy, 20, now)
+    update_publish_rate(quiet, 0, now)
+
+    assert busy.publish_rate > 10
+    assert quiet.publish_rate < 0.5
+    assert busy.last_new_items == 20
+    assert busy.last_polled_at == now
+    assert next_poll_interval(busy.publish_rate) < next_poll_interval(quiet.publish_rate)
+
+
+def test_poll_interval_is_bounded():
+    assert next_poll_interval(10_000) == config.settings.FEED_POLL_MIN_INTERVAL
+    assert next_poll_interval(0.0001) == config.settings.FEED_POLL_MAX_INTERVAL
+    assert next_poll_interval(None) == config.settings.FEED_POLL_MAX_INTERVAL
+
+
+def test_jitter_never_exceeds_max_staleness():
+    now = datetime.datetime(2026, 10, 18, 12, 0)
+    feed = Feed(url="https://quiet.test", publish_rate=0)
+
+    for seed in range(20):
+        schedule_next_poll(feed, now, rng=random.Random(seed))
+        delay = (feed.next_poll_at - now).total_seconds()
+        assert delay <= config.settings.FEED_POLL_MAX_INTERVAL
+        assert delay >= config.settings.FEED_POLL_MAX_INTERVAL * (1 - config.settings.FEED_POLL_JITTER)
+
+
+def test_poll_due_feeds_saves_articles_and_reschedules(db_session, fake_source, fake_feed_download, monkeypatch):
+    monkeypatch.setattr(
+        feedparser,
+        "parse",
+        lambda _: FakeFeedData([{"link": "https://example.com/scheduled", "title": "Scheduled"}]),
+    )
+    now = datetime.datetime(2026, 10, 18, 12, 0)
+
+    assert poll_due_feeds(db_session, now) == 1
+
+    feed = fake_source.feeds[0]
+    assert feed.last_new_items == 1
+    assert feed.last_polled_at == now
+    assert feed.next_poll_at > now
+    assert db_session.query(Article).filter_by(url="https://example.com/scheduled").count() == 1
+
+    # nothing is due until the next poll time
+    assert poll_due_feeds(db_session, now + datetime.timedelta(seconds=1)) == 0
+    assert poll_due_feeds(db_session, feed.next_poll_at) == 1
+
+
+def test_failed_poll_is_retried_without_changing_the_publish_rate(db_session, fake_source, monkeypatch):
+    def timed_out(urls, **kwargs):
+        return {url: FeedResponse(url=url, error="timed out") for url in urls}
+
+    monkeypatch.setattr(ingestion_main, "download_feeds", timed_out)
+    feed = fake_source.feeds[0]
+    polled_at = datetime.datetime(2026, 10, 18, 11, 0)
+    feed.publish_rate, feed.poll_interval, feed.last_polled_at = 4.0, 1800, polled_at
+    db_session.commit()
+    now = datetime.datetime(2026, 10, 18, 12, 0)
+
+    assert poll_due_feeds(db_session, now) == 1
+
+    assert feed.publish_rate == 4.0
+    assert feed.poll_interval == 1800
+    assert feed.last_polled_at == polled_at
+    retry_delay = (feed.next_poll_at - now).total_seconds()
+    assert retry_delay <= config.settings.FEED_POLL_MIN_INTERVAL * (1 + config.settings.FEED_POLL_JITTER)
+
+
+def test_failed_save_reschedules_due_feeds(fake_source, fake_feed_download, monkeypatch, tmp_path):
+    # a database of its own, since the failed poll rolls the session back
+    engine = create_engine(f"sqlite:///{tmp_path / 'feeds.sqlite'}")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    session.add(fake_source)
+    session.commit()
+
+    def failing_save(articles, session):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(scheduler, "save_articles", failing_save)
+    monkeypatch.setattr(
+        feedparser, "parse", lambda _: FakeFeedData([{"link": "https://example.com/unsaved", "title": "Unsaved"}]),
+    )
+    now = datetime.datetime(2026, 10, 18, 12, 0)
+
+    assert poll_or_retry(session, now) == 0
+
+    feed = fake_source.feeds[0]
+    assert feed.last_polled_at is None
+    assert feed.next_poll_at > now
+    # not due again until the retry
+    assert poll_due_feeds(session, now + datetime.timedelta(seconds=1)) == 0
+    session.close()
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+from adapters.cache import AsyncCachingLLMClient, CachingLLMClient, LLMResponseCache, request_hash
+from summary.concurrency import chat_concurrently
+from tests.conftest import FakeLLM
+
+MESSAGES = [{"role": "user", "content": "Summarize this."}]
+
+
+class NumberingLLM(FakeLLM):
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.calls = 0
+
+    def chat(self, messages, stream=False, **kwargs) -> str:
+        self.calls += 1
+        return f"response {self.calls}"
+
+
+class AsyncNumberingLLM:
+    def __init__(self, model: str):
+        self.model = model
+        self.calls = 0
+
+    async def chat(self, messages, stream=False, **kwargs) -> str:
+        self.calls += 1
+        await asyncio.sleep(0)
+        return f"response {self.calls}"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm" / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_identical_requests_are_answered_from_the_cache(cache):
+    llm = NumberingLLM("llama3.1:8b")
+    client = CachingLLMClient(llm, cache)
+
+    assert client.chat(MESSAGES, stream=False) == "response 1"
+    assert client.chat(MESSAGES) == "response 1"
+    assert client.chat(MESSAGES, options={"temperature": 0}) == "response 2"
+    assert client.chat([{"role": "user", "content": "Something else."}]) == "response 3"
+
+    assert llm.calls == 3
+    assert (client.hits, client.misses) == (1, 3)
+    assert client.model == "llama3.1:8b"
+
+
+def test_the_cache_is_per_model_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    CachingLLMClient(NumberingLLM("llama3.1:8b"), LLMResponseCache(path)).chat(MESSAGES)
+
+    reopened = LLMResponseCache(path)
+    assert CachingLLMClient(NumberingLLM("llama3.1:8b"), reopened).chat(MESSAGES) == "response 1"
+    other_model = CachingLLMClient(NumberingLLM("qwen2.5:7b"), reopened)
+    other_model.chat(MESSAGES)
+    assert other_model.misses == 1
+
+
+def test_bypass_calls_the_model_and_refreshes_the_cache(cache):
+    CachingLLMClient(NumberingLLM("llama3.1:8b"), cache).chat(MESSAGES)
+
+    bypassing = CachingLLMClient(NumberingLLM("llama3.1:8b"), cache, bypass=True)
+    bypassing.chat(MESSAGES)
+    bypassing.chat(MESSAGES)
+
+    assert bypassing.client.calls == 2
+    assert cache.get(request_hash("llama3.1:8b", MESSAGES)) == "response 2"
+
+
+def test_old_entries_expire(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), max_age=60)
+    cache.put("fresh", "kept")
+    cache.put("old", "dropped")
+    cache.connection.execute("UPDATE llm_response SET created = ? WHERE key = 'old'", (time.time() - 120,))
+
+    assert cache.get("old") is None
+    cache.evict()
+    assert len(cache) == 1
+    assert cache.get("fresh") == "kept"
+
+
+def test_least_recently_used_entries_are_evicted_past_the_size_limit(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=25)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, "x" * 10)
+        cache.connection.execute("UPDATE llm_response SET used = ? WHERE key = ?", (i, key))
+    cache.get("a")
+
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == "x" * 10
+
+
+def test_async_clients_are_cached_too(cache):
+    llm = AsyncNumberingLLM("llama3.1:8b")
+    client = AsyncCachingLLMClient(llm, cache)
+    requests = [[{"role": "user", "content": f"article {i % 3}"}] for i in range(6)]
+
+    list(chat_concurrently(client, requests, concurrency=1))
+    results = list(chat_concurrently(client, requests, concurrency=3))
+
+    assert llm.calls == 3
+    assert [result.response for result in results] == [f"response {i % 3 + 1}" for i in range(6)]
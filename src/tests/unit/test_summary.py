@@ -1,7 +1,21 @@
+import asyncio
 import datetime
-
-from db.models import Article, DailyTrendSummary, Topic
-from summary.main import generate_article_summaries, generate_daily_summary
+import json
+import logging
+import math
+import re
+import threading
+import time
+
+import pytest
+
+import config
+from adapters.cache import CachingLLMClient, LLMResponseCache
+from db.models import Article, DailyTrendSummary, FeedType, SummaryChunk, Topic
+from summary.concurrency import chat_concurrently
+from summary.main import chunk_summaries, generate_article_summaries, generate_daily_summary, parse_packed_summaries
+from summary import tokens
+from summary.tokens import count_tokens, trim_to_budget
 from tests.conftest import FakeLLM, SAMPLE_ARTICLE_TEXT
 
 
@@ -322,3 +336,412 @@ def test_generate_article_summaries_skips_empty_text(db_session, fake_source):
 
     # Empty article should not have a summary
     assert empty_article.summary is None, "Article with no text should not be summarized"
+
+
+class CountingLLM(FakeLLM):
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def chat(self, messages, stream=False, **kwargs) -> str:
+        with self.lock:
+            self.calls += 1
+            return f"Summary {self.calls}"
+
+
+def test_near_duplicates_reuse_the_canonical_summary(db_session):
+    source = db_session.query(Article).first().source
+    original = Article(title="Wire story", url="https://example.com/wire", source=source, text=SAMPLE_ARTICLE_TEXT)
+    db_session.add(original)
+    db_session.commit()
+    copies = [
+        Article(title=f"Wire copy {i}", url=f"https://example.com/wire-{i}", source=source,
+                text=SAMPLE_ARTICLE_TEXT, canonical_article_id=original.id)
+        for i in range(2)
+    ]
+    db_session.add_all(copies)
+    db_session.commit()
+    llm = CountingLLM("llama3.1:8b")
+
+    generate_article_summaries(db_session, llm)
+
+    summarised = db_session.query(Article).filter(Article.summary.isnot(None)).count()
+    assert llm.calls == summarised - len(copies)
+    db_session.refresh(original)
+    for copy in copies:
+        db_session.refresh(copy)
+        assert copy.summary == original.summary
+
+
+class SlowLLM(FakeLLM):
+    """Echoes the article back after a delay, recording how many calls overlap"""
+
+    def __init__(self, model: str, delay: float = 0.02, hang_on: str = None):
+        super().__init__(model)
+        self.delay = delay
+        self.hang_on = hang_on
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def chat(self, messages, stream=False, **kwargs) -> str:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        text = messages[-1]["content"]
+        time.sleep(1 if self.hang_on and self.hang_on in text else self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return f"summary of {text[-20:]}"
+
+
+class AsyncEchoLLM:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def chat(self, messages, stream=False, **kwargs) -> str:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return messages[-1]["content"]
+
+
+def test_chat_concurrently_bounds_requests_and_keeps_order():
+    llm = SlowLLM("llama3.1:8b")
+    requests = [[{"role": "user", "content": f"article {i}"}] for i in range(12)]
+
+    results = list(chat_concurrently(llm, requests, concurrency=3))
+
+    assert [result.index for result in results] == list(range(12))
+    assert [result.response for result in results] == [f"summary of article {i}" for i in range(12)]
+    assert llm.max_in_flight == 3
+
+
+def test_chat_concurrently_with_an_async_client():
+    llm = AsyncEchoLLM()
+    requests = [[{"role": "user", "content": f"article {i}"}] for i in range(10)]
+
+    results = list(chat_concurrently(llm, requests, concurrency=4))
+
+    assert [result.response for result in results] == [f"article {i}" for i in range(10)]
+    assert llm.max_in_flight == 4
+
+
+def test_async_clients_keep_their_event_loop_between_calls():
+    class LoopBoundLLM(AsyncEchoLLM):
+        """Like clients with a connection pool, only works on the loop it was first used on"""
+        loop = None
+
+        async def chat(self, messages, stream=False, **kwargs) -> str:
+            self.loop = self.loop or asyncio.get_running_loop()
+            assert asyncio.get_running_loop() is self.loop
+            return await super().chat(messages, stream, **kwargs)
+
+    llm = LoopBoundLLM()
+    for _ in range(2):
+        results = list(chat_concurrently(llm, [[{"role": "user", "content": "article"}]] * 3, concurrency=2))
+        assert [result.error for result in results] == [None] * 3
+
+
+def test_chat_concurrently_reports_timeouts_and_errors():
+    class FailingLLM(SlowLLM):
+        def chat(self, messages, stream=False, **kwargs) -> str:
+            if "broken" in messages[-1]["content"]:
+                raise ConnectionError("connection refused")
+            return super().chat(messages, stream, **kwargs)
+
+    llm = FailingLLM("llama3.1:8b", hang_on="slow")
+    requests = [[{"role": "user", "content": content}] for content in ("fine", "slow", "broken", "fine too")]
+
+    results = list(chat_concurrently(llm, requests, concurrency=2, timeout=0.2))
+
+    assert results[0].response and results[3].response
+    assert results[1].response is None and "timed out" in results[1].error
+    assert results[2].error == "ConnectionError: connection refused"
+
+
+def test_generate_article_summaries_concurrently(db_session):
+    llm = SlowLLM("llama3.1:8b")
+
+    summarised = generate_article_summaries(db_session, llm, concurrency=3, commit_batch_size=2).summarised
+
+    articles = db_session.query(Article).filter(Article.summary.isnot(None)).all()
+    assert summarised == len(articles) > 0
+    for article in articles:
+        assert article.summary == f"summary of {article.text[-20:]}"
+    assert llm.max_in_flight <= 3
+
+
+def test_timed_out_articles_are_left_for_the_next_run(db_session, fake_source):
+    slow = Article(title="Slow", url="https://example.com/slow", source=fake_source,
+                   text=SAMPLE_ARTICLE_TEXT + "\nhangs the model")
+    db_session.add(slow)
+    db_session.commit()
+
+    generate_article_summaries(db_session, SlowLLM("llama3.1:8b", hang_on="hangs the model"), timeout=0.2)
+
+    db_session.refresh(slow)
+    assert slow.summary is None
+    assert db_session.query(Article).filter(Article.summary.isnot(None)).count() > 0
+
+
+def test_rerun_skips_up_to_date_summaries(db_session):
+    first = CountingLLM("llama3.1:8b")
+    summarised = generate_article_summaries(db_session, first).summarised
+    assert summarised == first.calls > 0
+
+    rerun = CountingLLM("llama3.1:8b")
+    assert generate_article_summaries(db_session, rerun).summarised == 0
+    assert rerun.calls == 0
+
+
+def test_cache_hit_rate_is_logged_per_run(db_session, tmp_path, caplog):
+    client = CachingLLMClient(CountingLLM("llama3.1:8b"), LLMResponseCache(str(tmp_path / "cache.sqlite")))
+    generate_article_summaries(db_session, client)
+    db_session.query(Article).update({Article.summary_hash: None})
+    db_session.commit()
+
+    with caplog.at_level(logging.INFO, logger="adapters.cache"):
+        summarised = generate_article_summaries(db_session, client).summarised
+
+    assert f"LLM cache answered {summarised}/{summarised} requests (100%)" in caplog.text
+
+
+def test_changed_text_is_summarised_again(db_session):
+    generate_article_summaries(db_session, CountingLLM("llama3.1:8b"))
+    edited = db_session.query(Article).filter(Article.summary.isnot(None)).first()
+    edited.text += "\nA correction was appended."
+    db_session.commit()
+    llm = CountingLLM("llama3.1:8b")
+
+    generate_article_summaries(db_session, llm)
+
+    assert llm.calls == 1
+    db_session.refresh(edited)
+    assert edited.summary == "Summary 1"
+
+
+def test_changed_model_summarises_everything_again(db_session):
+    first = CountingLLM("llama3.1:8b")
+    generate_article_summaries(db_session, first)
+    llm = CountingLLM("qwen2.5:7b")
+
+    generate_article_summaries(db_session, llm)
+
+    assert llm.calls == first.calls
+
+
+def test_chunk_summaries_stay_within_budget():
+    summaries = [(i, "word " * 40) for i in range(50)]  # 51 tokens each
+
+    chunks = chunk_summaries(summaries, budget=200)
+
+    assert [len(chunk) for chunk in chunks] == [3] * 16 + [2]
+    assert chunk_summaries([(1, "word " * 400)], budget=200) == [["word " * 400]]
+
+
+def test_chunk_boundaries_survive_a_sliding_window():
+    summaries = [(i, f"summary {i}") for i in range(200)]
+
+    before = chunk_summaries(summaries[:150], budget=1000, boundary_every=8)
+    after = chunk_summaries(summaries[30:], budget=1000, boundary_every=8)
+
+    # every chunk that starts in the overlap, other than the last one, comes out the same
+    overlapping = [chunk for chunk in before[:-1] if int(chunk[0].split()[1]) >= 30]
+    assert len(overlapping) > 10
+    assert all(chunk in after for chunk in overlapping)
+
+
+class RecordingLLM(FakeLLM):
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def chat(self, messages, stream=False, **kwargs) -> str:
+        with self.lock:
+            self.requests.append(messages[-1]["content"])
+            return f"partial summary {len(self.requests)}"
+
+
+@pytest.fixture
+def many_summaries(db_session, fake_source, monkeypatch):
+    monkeypatch.setattr(config.settings, "DAILY_SUMMARY_TOKEN_BUDGET", 100)
+    monkeypatch.setattr(config.settings, "DAILY_SUMMARY_CHUNK_BOUNDARY", 4)
+    technology = db_session.query(Topic).filter(Topic.name == FeedType.TECHNOLOGY.value).one()
+    db_session.add_all([
+        Article(title=f"Story {i}", url=f"https://example.com/story-{i}", source=fake_source,
+                source_topic=FeedType.TECHNOLOGY.value, topics=[technology],
+                summary=f"Article {i} reports on something. " * 3)
+        for i in range(40)
+    ])
+    db_session.commit()
+    return db_session
+
+
+def test_daily_summary_of_many_articles_is_summarised_in_chunks(many_summaries):
+    llm = RecordingLLM("llama3.1:8b")
+
+    generate_daily_summary(many_summaries, llm)
+
+    assert all(count_tokens(request) <= 100 for request in llm.requests)
+    assert len(llm.requests) > 10
+    technology = many_summaries.query(Topic).filter(Topic.name == FeedType.TECHNOLOGY.value).one()
+    daily_summary = many_summaries.query(DailyTrendSummary).filter(DailyTrendSummary.topic == technology).one()
+    assert daily_summary.summary == f"partial summary {len(llm.requests)}"
+
+
+def test_daily_summary_reuses_unchanged_chunks(many_summaries, fake_source):
+    first = RecordingLLM("llama3.1:8b")
+    generate_daily_summary(many_summaries, first)
+    chunk_rows = many_summaries.query(SummaryChunk).count()
+    assert chunk_rows == len(first.requests)
+
+    technology = many_summaries.query(Topic).filter(Topic.name == FeedType.TECHNOLOGY.value).one()
+    many_summaries.add(Article(title="Late story", url="https://example.com/late", source=fake_source,
+                               source_topic=FeedType.TECHNOLOGY.value, topics=[technology],
+                               summary="A late article came in."))
+    many_summaries.commit()
+    rerun = RecordingLLM("llama3.1:8b")
+    generate_daily_summary(many_summaries, rerun)
+
+    # the chunk that got the new article, and the combination of the partial summaries
+    assert len(rerun.requests) <= 3
+    assert "A late article came in." in rerun.requests[0]
+
+
+def test_parse_packed_summaries():
+    response = '```json\n{"1": "First happened.", "2": " Second happened. "}\n```'
+
+    assert parse_packed_summaries(response, 2) == ["First happened.", "Second happened."]
+    assert parse_packed_summaries(response, 3) is None
+    assert parse_packed_summaries('{"1": "First happened.", "2": ""}', 2) is None
+    assert parse_packed_summaries('{"1": "First happened.", "2": "Second', 2) is None
+    assert parse_packed_summaries("Fake response", 1) is None
+
+
+class PackingLLM(FakeLLM):
+    """Answers packed requests with JSON, one summary per article, and single ones in plain text"""
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def chat(self, messages, stream=False, **kwargs) -> str:
+        with self.lock:
+            self.requests += 1
+        articles = re.findall(r"Article (\d+):\n(.*)", messages[-1]["content"])
+        if not articles:
+            return "single summary"
+        return json.dumps({number: f"summary of {first_line}" for number, first_line in articles})
+
+
+@pytest.fixture
+def short_articles(db_session, fake_source):
+    articles = [
+        Article(title=f"Brief {i}", url=f"https://example.com/brief-{i}", source=fake_source,
+                text="\n".join([f"Brief {i} headline."] + ["A short line."] * 6))
+        for i in range(10)
+    ]
+    db_session.add_all(articles)
+    db_session.commit()
+    return articles
+
+
+def test_short_articles_are_summarised_in_packs(db_session, short_articles):
+    llm = PackingLLM("llama3.1:8b")
+
+    result = generate_article_summaries(db_session, llm, pack_size=4)
+
+    assert result.summarised >= len(short_articles)
+    assert llm.requests == math.ceil(result.summarised / 4)
+    for article in short_articles:
+        db_session.refresh(article)
+        assert article.summary == f"summary of {article.title} headline."
+
+
+def test_unparseable_packs_fall_back_to_single_requests(db_session, short_articles):
+    llm = CountingLLM("llama3.1:8b")
+
+    result = generate_article_summaries(db_session, llm, pack_size=4)
+
+    assert llm.calls == math.ceil(result.summarised / 4) + result.summarised
+    for article in short_articles:
+        db_session.refresh(article)
+        assert article.summary.startswith("Summary ")
+
+
+LONG_ARTICLE = " ".join(
+    [
+        "The city council approved the new flood barrier on Monday.",
+        "The barrier will protect the harbour district from storm surges.",
+        "Work starts in spring.",
+    ]
+    + ["Residents of a nearby village held a bake sale for unrelated reasons."] * 20
+    + ["The flood barrier in the harbour district is the council's largest project, and the barrier cost is disputed."]
+    + ["Weather was mild."] * 20
+)
+
+
+def test_trim_keeps_short_texts():
+    assert trim_to_budget("A short article.", budget=100) == ("A short article.", 5, 5)
+
+
+def test_trim_keeps_the_lead_and_salient_sentences():
+    trimmed, tokens_kept, original_tokens = trim_to_budget(LONG_ARTICLE, budget=80, lead_sentences=2)
+
+    assert tokens_kept <= 80 < original_tokens
+    assert count_tokens(trimmed) <= tokens_kept + 1
+    assert trimmed.startswith(
+        "The city council approved the new flood barrier on Monday. The barrier will protect the harbour district"
+    )
+    assert "the barrier cost is disputed." in trimmed
+    assert trimmed.index("Monday") < trimmed.index("disputed")
+
+
+def test_trim_cuts_an_oversized_sentence_to_the_budget():
+    trimmed, tokens_kept, original_tokens = trim_to_budget("word " * 10000, budget=1500)
+
+    assert trimmed.startswith("word word")
+    assert tokens_kept == count_tokens(trimmed)
+    assert 1400 < tokens_kept <= 1500 < original_tokens
+
+
+def test_trim_never_returns_empty_text():
+    oversized_lead = "The council " + "really " * 500 + "approved the barrier. " + "Work starts in spring. " * 50
+
+    assert trim_to_budget(oversized_lead, budget=10)[0].startswith("The council really")
+    assert trim_to_budget(oversized_lead, budget=10, lead_sentences=0)[0]
+    assert trim_to_budget("x" * 400, budget=10) == ("x" * 39, 10, 101)
+
+
+def test_unavailable_tokenizer_falls_back_to_an_estimate(monkeypatch):
+    def unavailable(name):
+        raise OSError(f"{name} not found")
+
+    monkeypatch.setattr(tokens, "_counter", None)
+    monkeypatch.setattr(tokens, "HuggingFaceTokenCounter", unavailable)
+    monkeypatch.setattr(config.settings, "SUMMARY_TOKENIZER", "some/tokenizer")
+
+    assert isinstance(tokens.get_token_counter(), tokens.ApproximateTokenCounter)
+    assert count_tokens("twelve chars") == 4
+
+
+def test_long_articles_are_trimmed_before_summarising(db_session, fake_source, monkeypatch, caplog):
+    monkeypatch.setattr(config.settings, "SUMMARY_MAX_INPUT_TOKENS", 80)
+    article = Article(title="Flood barrier", url="https://example.com/flood-barrier", source=fake_source,
+                      text=LONG_ARTICLE.replace(". ", ".\n"))
+    db_session.add(article)
+    db_session.commit()
+    llm = RecordingLLM("llama3.1:8b")
+
+    with caplog.at_level(logging.INFO, logger="summary.main"):
+        generate_article_summaries(db_session, llm)
+
+    (request,) = [request for request in llm.requests if "flood barrier on Monday" in request]
+    assert count_tokens(request) < 100
+    assert "Trimming long articles cut the text sent" in caplog.text
@@ -0,0 +1,115 @@
+import datetime
+
+import numpy as np
+
+import config
+from db.models import Article, Source, TermBaseline, Topic, TrendingTerm
+from inference.trending import decay_baseline, score_day, score_pending_days, update_baseline
+
+DAY = datetime.date(2026, 3, 1)
+
+
+def add_day(db_session, day, titles, topic_name="politics"):
+    source = db_session.query(Source).first()
+    topic = db_session.query(Topic).filter_by(name=topic_name).one()
+    created = datetime.datetime.combine(day, datetime.time(9))
+    db_session.add_all([
+        Article(title=title, url=f"https://example.com/{topic_name}/{day}-{i}", source=source, created=created, topics=[topic])
+        for i, title in enumerate(titles)
+    ])
+    db_session.commit()
+
+
+def routine_titles(day):
+    return [
+        f"Parliament debates the budget on day {day.day}",
+        "Budget committee hearing continues in parliament",
+        "Minister defends budget plans",
+    ]
+
+
+def trending_terms(db_session, day):
+    return [
+        term for (term,) in
+        db_session.query(TrendingTerm.term).filter_by(date=day).order_by(TrendingTerm.score.desc())
+    ]
+
+
+def test_surging_term_trends_and_steady_terms_do_not(db_session):
+    for offset in range(4):
+        day = DAY + datetime.timedelta(days=offset)
+        add_day(db_session, day, routine_titles(day))
+        score_day(db_session, day)
+
+    surge_day = DAY + datetime.timedelta(days=4)
+    add_day(db_session, surge_day, routine_titles(surge_day) + [
+        "Rail strike halts trains across the country",
+        "Strike talks collapse as unions walk out",
+        "Commuters stranded by the strike",
+    ])
+    score_day(db_session, surge_day)
+
+    terms = trending_terms(db_session, surge_day)
+    assert terms[0] == "strike"
+    assert "budget" not in terms
+
+
+def test_first_scored_day_only_builds_baselines(db_session):
+    add_day(db_session, DAY, routine_titles(DAY))
+
+    assert score_day(db_session, DAY) == 0
+
+    assert trending_terms(db_session, DAY) == []
+    assert db_session.query(TermBaseline).filter_by(term="budget").count() == 1
+
+
+def test_new_topic_waits_for_baseline_history(db_session):
+    for offset in range(4):
+        day = DAY + datetime.timedelta(days=offset)
+        add_day(db_session, day, routine_titles(day))
+        score_day(db_session, day)
+
+    # a topic seen for the first time, like a new story cluster, next to an established one
+    next_day = DAY + datetime.timedelta(days=4)
+    add_day(db_session, next_day, routine_titles(next_day))
+    add_day(db_session, next_day, [
+        "Chip makers report record demand", "Record chip demand lifts shares", "Chip shortage eases",
+    ], topic_name="technology")
+    score_day(db_session, next_day)
+
+    technology = db_session.query(Topic).filter_by(name="technology").one()
+    assert db_session.query(TrendingTerm).filter_by(topic_id=technology.id).count() == 0
+
+
+def test_day_is_only_scored_once(db_session, monkeypatch):
+    monkeypatch.setattr(config.settings, "TREND_MIN_HISTORY_DAYS", 0)
+    add_day(db_session, DAY, routine_titles(DAY))
+
+    assert score_day(db_session, DAY) > 0
+    assert score_day(db_session, DAY) == 0
+    assert score_day(db_session, DAY - datetime.timedelta(days=1)) == 0
+
+
+def test_pending_days_continue_from_the_last_baseline(db_session):
+    add_day(db_session, DAY, routine_titles(DAY))
+    score_day(db_session, DAY)
+    next_day = DAY + datetime.timedelta(days=2)
+    add_day(db_session, next_day, routine_titles(next_day))
+
+    score_pending_days(db_session, until=next_day)
+
+    baseline = db_session.query(TermBaseline).filter_by(term="budget").one()
+    assert baseline.updated_date == next_day
+    assert db_session.query(TrendingTerm).filter(TrendingTerm.date < DAY).count() == 0
+
+
+def test_lazy_decay_matches_daily_updates():
+    mean, variance = np.array([0.3]), np.array([0.01])
+    expected_mean, expected_variance = mean.copy(), variance.copy()
+    for _ in range(3):
+        update_baseline(expected_mean, expected_variance, np.array([0.0]), smoothing=0.2)
+
+    decay_baseline(mean, variance, np.array([3]), smoothing=0.2)
+
+    np.testing.assert_allclose(mean, expected_mean)
+    np.testing.assert_allclose(variance, expected_variance)